@@ -0,0 +1,4 @@
+"""
+Офлайн-бенчмарки горячих участков скрапера: парсинг страниц, поиск фильмов в реестре и запись сеансов в БД.
+Запуск: python -m benchmarks --help
+"""
@@ -0,0 +1,79 @@
+import os
+import tempfile
+from typing import List
+
+from benchmarks.fixtures import make_queries, make_registry
+from benchmarks.runner import run_benchmark
+from repos.fed_movies_repo import FedMoviesRepo
+from repos.registry_snapshot import RegistrySnapshot, RegistryVersion
+from repos.title_index import TitleIndex
+from repos.trigram_matcher import TrigramMatcher
+
+
+def run(repeat: int, registry_size: int = 10000, queries: int = 100, seed: int = 0) -> List[dict]:
+    """
+    Замеряет поиск фильмов по синтетическому реестру.
+    Поиск в БД по найденному id (последний шаг search_movie) не замеряется, чтобы бенчмарк работал без БД
+
+    :param repeat: сколько раз прогнать все запросы
+    :param registry_size: количество фильмов в реестре
+    :param queries: количество запросов
+    :param seed: зерно генератора реестра и запросов
+    """
+    registry = make_registry(registry_size, seed)
+    # так выглядит выборка из БД, которую получает _find_title_matches
+    rows = [(idx, title) for idx, title, _ in registry]
+    query_list = make_queries(registry, queries, seed)
+    repo = FedMoviesRepo()
+    index = TitleIndex(registry)
+    matcher = TrigramMatcher(registry)
+
+    def full_scan() -> int:
+        for title, _ in query_list:
+            repo._find_title_matches(title, rows)
+        return len(query_list)
+
+    def indexed() -> int:
+        for title, year in query_list:
+            index.find_matches(title, year)
+        return len(query_list)
+
+    def build_index() -> int:
+        TitleIndex(registry)
+        return len(registry)
+
+    def trigram() -> int:
+        for title, year in query_list:
+            matcher.search(title, year, limit=1)
+        return len(query_list)
+
+    def build_trigrams() -> int:
+        TrigramMatcher(registry)
+        return len(registry)
+
+    snapshot_dir = tempfile.TemporaryDirectory()
+    snapshot_path = os.path.join(snapshot_dir.name, 'registry.snapshot')
+    RegistrySnapshot.write(snapshot_path, registry, RegistryVersion(registry_size, registry_size, 0))
+    snapshot_matcher = TrigramMatcher.from_snapshot(RegistrySnapshot(snapshot_path))
+
+    def open_snapshot() -> int:
+        TrigramMatcher.from_snapshot(RegistrySnapshot(snapshot_path))
+        return len(registry)
+
+    def trigram_snapshot() -> int:
+        for title, year in query_list:
+            snapshot_matcher.search(title, year, limit=1)
+        return len(query_list)
+
+    # полный перебор на большом реестре очень медленный, поэтому для него хватит пары прогонов
+    results = [
+        run_benchmark(f'matching.find_title_matches[{registry_size}]', full_scan, min(repeat, 3)),
+        run_benchmark(f'matching.title_index[{registry_size}]', indexed, repeat),
+        run_benchmark(f'matching.title_index_build[{registry_size}]', build_index, min(repeat, 3), warmup=0),
+        run_benchmark(f'matching.trigram[{registry_size}]', trigram, repeat),
+        run_benchmark(f'matching.trigram_build[{registry_size}]', build_trigrams, min(repeat, 3), warmup=0),
+        run_benchmark(f'matching.trigram_snapshot[{registry_size}]', trigram_snapshot, repeat),
+        run_benchmark(f'matching.snapshot_open[{registry_size}]', open_snapshot, repeat),
+    ]
+    snapshot_dir.cleanup()
+    return results
@@ -0,0 +1,46 @@
+import datetime as dt
+import random
+from typing import List
+
+from benchmarks.fixtures import PAGES
+from benchmarks.runner import run_benchmark
+from scrapers import SCRAPERS, get_scraper_class
+from scrapers.parsing import HTML_PARSER
+
+# конфиг, которого хватает любому скраперу для разбора страницы
+SCRAPER_CONFIG = {'theater_path': '/bench', 'city_no': 1}
+
+
+def run(repeat: int, movies: int = 20, sessions: int = 6, days: int = 7, seed: int = 0) -> List[dict]:
+    """
+    Замеряет разбор синтетических страниц каждым скрапером из scrapers.SCRAPERS.
+    Каждый скрапер замеряется со своим парсером и, для сравнения, с html.parser по всей странице
+
+    :param repeat: сколько раз разобрать страницу
+    :param movies: количество фильмов на странице (на каждый день)
+    :param sessions: количество сеансов у фильма
+    :param days: на сколько дней расписание у скраперов, которые умеют несколько дат за раз
+    :param seed: зерно генератора страниц
+    """
+    rnd = random.Random(seed)
+    dates = [dt.date(2022, 5, 1) + dt.timedelta(days=i) for i in range(days)]
+    results = []
+    for name in list(SCRAPERS):
+        scraper_cls = get_scraper_class(name)
+        page_factory = PAGES.get(name)
+        if page_factory is None:
+            raise KeyError(f'Нет генератора страниц для скрапера {name}, добавьте его в benchmarks.fixtures.PAGES')
+        html = page_factory(rnd, dates if scraper_cls.MULTI_DATE else dates[:1], movies, sessions)
+
+        variants = {name: scraper_cls}
+        if scraper_cls.PARSER != HTML_PARSER or scraper_cls.PARSE_ONLY is not None:
+            variants[f'{name}[{HTML_PARSER}]'] = type(scraper_cls.__name__, (scraper_cls,),
+                                                      {'PARSER': HTML_PARSER, 'PARSE_ONLY': None})
+
+        for variant_name, variant_cls in variants.items():
+            def parse() -> int:
+                scraper = variant_cls(SCRAPER_CONFIG)
+                return sum(1 for _ in scraper.parse(html, dates if variant_cls.MULTI_DATE else dates[0]))
+
+            results.append(run_benchmark(f'parsing.{variant_name}', parse, repeat))
+    return results
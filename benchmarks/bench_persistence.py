@@ -0,0 +1,124 @@
+import datetime as dt
+import itertools
+import os
+from typing import List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+from benchmarks.runner import run_benchmark
+from db.models import Base, Fedmovie, MovieSession, Session, Theater
+from repos.movie_sessions_repo import MovieSessionsRepo
+from repos.session_batch import SessionBatch
+
+# в sqlite нет последовательностей и ::character varying, поэтому схему для неё описываем вручную
+SQLITE_SCHEMA = '''
+CREATE TABLE session (
+    id INTEGER PRIMARY KEY,
+    theater_id INTEGER NOT NULL,
+    movie_id INTEGER NOT NULL,
+    hall VARCHAR,
+    datetime DATETIME,
+    link VARCHAR,
+    CONSTRAINT session_unique UNIQUE (theater_id, movie_id, hall, datetime)
+)
+'''
+
+
+def _sqlite_engine(db_url: str) -> Engine:
+    engine = create_engine(db_url)
+
+    # pysqlite сам управляет транзакциями и ломает SAVEPOINT, которые использует add_movie_sessions
+    @event.listens_for(engine, 'connect')
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def do_begin(connection):
+        connection.exec_driver_sql('BEGIN')
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(SQLITE_SCHEMA)
+    return engine
+
+
+def _postgresql_engine(db_url: str, schema: str, movies: int) -> Engine:
+    # все таблицы создаются в отдельной схеме, которая удаляется после прогона
+    engine = create_engine(db_url)
+
+    @event.listens_for(engine, 'connect')
+    def set_search_path(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'SET search_path TO {schema}')
+        cursor.close()
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f'CREATE SCHEMA {schema}')
+        connection.exec_driver_sql('CREATE SEQUENCE theater_id_seq')
+        connection.exec_driver_sql('CREATE SEQUENCE session_id_seq')
+        Base.metadata.create_all(connection)
+        connection.execute(Theater.__table__.insert(), [{'id': 1, 'name': 'bench', 'scraper': 'bench'}])
+        connection.execute(Fedmovie.__table__.insert(), [
+            {'id': idx, 'cardNumber': str(idx), 'filmname': f'Фильм {idx}'} for idx in range(1, movies + 1)
+        ])
+    return engine
+
+
+def run(repeat: int, db_url: str = 'sqlite://', sessions: int = 500, movies: int = 20) -> List[dict]:
+    """
+    Замеряет запись сеансов через MovieSessionsRepo.
+    Для postgresql таблицы создаются во временной схеме, для sqlite - в самой базе (по умолчанию в памяти)
+
+    :param repeat: сколько раз записать пачку сеансов
+    :param db_url: адрес БД в формате sqlalchemy
+    :param sessions: количество сеансов в одной пачке
+    :param movies: среди скольких фильмов распределяются сеансы
+    """
+    is_postgresql = db_url.startswith('postgresql')
+    schema = f'bench_{os.getpid()}'
+    engine = _postgresql_engine(db_url, schema, movies) if is_postgresql else _sqlite_engine(db_url)
+    Session.configure(bind=engine)
+
+    # каждая пачка - новые сеансы, чтобы замерять именно вставку
+    minutes = itertools.count()
+    start = dt.datetime(2022, 5, 1)
+    # id сеанса генерирует последовательность postgresql, а в sqlite его приходится задавать самим
+    ids = itertools.count(1)
+
+    def make_sessions() -> List[MovieSession]:
+        return [
+            MovieSession(id=None if is_postgresql else next(ids), theater_id=1, movie_id=i % movies + 1, hall='',
+                         datetime=start + dt.timedelta(minutes=next(minutes)), link='https://example.com')
+            for i in range(sessions)
+        ]
+
+    def add_sessions() -> int:
+        MovieSessionsRepo.add_movie_sessions(make_sessions())
+        return sessions
+
+    def add_sessions_bulk() -> int:
+        MovieSessionsRepo.add_movie_sessions_bulk(make_sessions())
+        return sessions
+
+    def add_session_batch() -> int:
+        # так пишет движок: сеансы сразу складываются в колоночную пачку, объекты MovieSession не создаются
+        batch = SessionBatch()
+        for i in range(sessions):
+            batch.append(1, i % movies + 1, '', start + dt.timedelta(minutes=next(minutes)), 'https://example.com')
+        MovieSessionsRepo.add_movie_sessions_bulk(batch)
+        return sessions
+
+    try:
+        results = [run_benchmark(f'persistence.add_movie_sessions[{engine.dialect.name}]', add_sessions, repeat)]
+        # INSERT ... ON CONFLICT ... RETURNING xmax есть только в postgresql
+        if is_postgresql:
+            results.append(run_benchmark('persistence.add_movie_sessions_bulk[postgresql]',
+                                         add_sessions_bulk, repeat))
+            results.append(run_benchmark('persistence.add_movie_sessions_bulk[postgresql, SessionBatch]',
+                                         add_session_batch, repeat))
+    finally:
+        if is_postgresql:
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f'DROP SCHEMA {schema} CASCADE')
+        engine.dispose()
+    return results
@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+import subprocess
+import sys
+from typing import Dict, List
+
+from benchmarks.runner import summarize
+
+# бюджет на импорт точек входа: медиана, мс. Импорт не должен тянуть selenium, bs4, numpy и подключение к БД
+IMPORT_BUDGETS_MS: Dict[str, float] = {
+    'main': 500,
+    'fed_movies_updater': 500,
+    'engine': 500,
+    'scrapers': 50,
+    'db.models': 300,
+}
+
+# модули, которые не должны импортироваться при старте
+HEAVY_MODULES = ('selenium', 'undetected_chromedriver', 'bs4', 'lxml', 'numpy')
+
+# замеряем только импорт, без запуска интерпретатора
+MEASURE_SCRIPT = '''
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed, *[name for name in {heavy!r} if name in sys.modules])
+'''
+
+
+def _measure(module: str) -> List[str]:
+    # параметры подключения к БД убираем: импорт должен работать и без них
+    env = {key: value for key, value in os.environ.items() if not key.startswith('DB_')}
+    result = subprocess.run(
+        [sys.executable, '-c', MEASURE_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout.split()
+
+
+def run(repeat: int) -> List[dict]:
+    """
+    Замеряет время импорта точек входа, каждый раз в новом процессе (с холодным кэшем модулей)
+
+    :param repeat: сколько раз импортировать каждую точку входа
+    """
+    results = []
+    for module in IMPORT_BUDGETS_MS:
+        timings = []
+        for _ in range(repeat):
+            elapsed, *heavy = _measure(module)
+            if heavy:
+                raise RuntimeError(f'Импорт {module} тянет за собой {", ".join(heavy)}')
+            timings.append(float(elapsed))
+        results.append(summarize(f'startup.import[{module}]', timings, repeat))
+    return results
+
+
+def check_budgets(results: List[dict]) -> List[str]:
+    """
+    Проверяет, что медианное время импорта точек входа укладывается в IMPORT_BUDGETS_MS
+
+    :param results: результаты run
+    :return: описания превышений бюджета
+    """
+    violations = []
+    for result in results:
+        module = result['name'][len('startup.import['):-1]
+        budget = IMPORT_BUDGETS_MS.get(module)
+        if budget is not None and result['p50_ms'] > budget:
+            violations.append(f'{result["name"]}: {result["p50_ms"]:.1f} ms > {budget:.0f} ms')
+    return violations
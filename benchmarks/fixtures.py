@@ -0,0 +1,139 @@
+"""
+Генераторы синтетических данных для бенчмарков: страницы кинотеатров в вёрстке каждого сайта и реестр фильмов
+"""
+import datetime as dt
+import random
+from typing import Callable, Dict, List, Optional, Tuple
+
+SYLLABLES = ['ка', 'ро', 'ми', 'на', 'ту', 'ле', 'зо', 'ви', 'де', 'са', 'по', 'ры', 'ён', 'ча', 'йо', 'гу']
+
+
+def make_words(rnd: random.Random, count: int) -> List[str]:
+    """
+    Словарь псевдослов для названий фильмов
+    """
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(1, 4))))
+    return sorted(words)
+
+
+def make_title(rnd: random.Random, words: List[str]) -> str:
+    title = ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 5)))
+    title = title.capitalize()
+    if rnd.random() < 0.2:
+        title += rnd.choice(['!', ': Часть 2', '. Начало', '...'])
+    return title
+
+
+def make_registry(size: int, seed: int = 0) -> List[Tuple[int, str, Optional[str]]]:
+    """
+    Синтетический реестр фильмов
+
+    :param size: количество фильмов
+    :param seed: зерно генератора, чтобы реестр был одинаковым от прогона к прогону
+    :return: фильмы в формате [(id_фильма, название_фильма, год_выхода), ]
+    """
+    rnd = random.Random(seed)
+    words = make_words(rnd, max(size // 5, 100))
+    return [
+        (idx, make_title(rnd, words), rnd.choice([None, str(rnd.randint(1950, 2023))]))
+        for idx in range(1, size + 1)
+    ]
+
+
+def make_queries(registry: List[Tuple[int, str, Optional[str]]], count: int,
+                 seed: int = 0) -> List[Tuple[str, Optional[int]]]:
+    """
+    Названия фильмов в том виде, в каком их пишут на сайтах кинотеатров: другой регистр, пунктуация, год не всегда
+
+    :return: запросы в формате [(название, год), ]
+    """
+    rnd = random.Random(seed)
+    queries = []
+    for _, title, year in rnd.sample(registry, min(count, len(registry))):
+        title = rnd.choice([title, title.upper(), title.replace('е', 'ё'), title + ' (2D)'])
+        queries.append((title, int(year) if year and rnd.random() < 0.3 else None))
+    return queries
+
+
+def _times(rnd: random.Random, count: int) -> List[str]:
+    return sorted({f'{rnd.randint(9, 23):02}:{rnd.choice([0, 15, 30, 45]):02}' for _ in range(count)})
+
+
+def _page(body: str, rnd: random.Random) -> str:
+    # обвес страницы, который парсер тоже вынужден разбирать
+    menu = ''.join(f'<li><a href="/page/{i}">Пункт меню {i}</a></li>' for i in range(rnd.randint(100, 200)))
+    footer = ''.join(f'<p class="text">Текст подвала {i}</p>' for i in range(100))
+    return (f'<!DOCTYPE html><html><head><title>Расписание | Синема Стар</title></head><body>'
+            f'<header><ul class="menu">{menu}</ul></header><main>{body}</main><footer>{footer}</footer>'
+            f'</body></html>')
+
+
+def kinobel_page(rnd: random.Random, dates: List[dt.date], movies: int, sessions: int) -> str:
+    tabs = []
+    for date in dates:
+        cards = ''.join(
+            f'<div class="movie-schedule"><a class="schedule-movie-name" href="/film/{i}">Фильм {i}</a><ul>'
+            + ''.join(f'<li class="time-select__item" data-session-time="{t}">{t}</li>' for t in _times(rnd, sessions))
+            + '</ul></div>'
+            for i in range(movies)
+        )
+        tabs.append(f'<div id="sp-showtime-tab-{date:%Y-%m-%d}" class="tab">{cards}</div>')
+    return _page(''.join(tabs), rnd)
+
+
+def sputnik_page(rnd: random.Random, dates: List[dt.date], movies: int, sessions: int) -> str:
+    days = []
+    for date in dates:
+        cards = ''.join(
+            f'<div class="film flex"><a class="film__head" href="https://sputnik-cinema.ru/film/{i}/">'
+            f'<div class="film__title">Фильм {i}</div></a>'
+            f'<img class="film__poster-image" src="https://sputnik-cinema.ru/posters/{i}.jpg">'
+            f'<div class="schedule">'
+            + ''.join(f'<span class="schedule__seance">{t}</span>' for t in _times(rnd, sessions))
+            + '</div></div>'
+            for i in range(movies)
+        )
+        days.append(f'<div class="films" data-date="{date:%Y-%m-%d}">{cards}</div>')
+    return _page(''.join(days), rnd)
+
+
+def cinema_star_page(rnd: random.Random, dates: List[dt.date], movies: int, sessions: int) -> str:
+    cards = ''.join(
+        f'<div class="movie"><div class="poster small">'
+        f'<img src="https://api.kinohod.ru/c/85x130/bc/55/{i}.jpg"></div>'
+        f'<div class="title"><a href="/film/{i}">Фильм {i}</a><span>драма</span></div>'
+        + ''.join(f'<a class="show" data-time="{t}" kh:widget="schedule" kh:id="{i}-{j}">{t}</a>'
+                  for j, t in enumerate(_times(rnd, sessions)))
+        + '</div>'
+        for i in range(movies)
+    )
+    return _page(f'<div id="selected_date_tab">{cards}</div>', rnd)
+
+
+def rusich_page(rnd: random.Random, dates: List[dt.date], movies: int, sessions: int) -> str:
+    cards = []
+    for i in range(movies):
+        halls = ''.join(
+            f'<div class="cinema-block-hall-item"><div class="cinema-block-hall-number"> Зал {hall} </div>'
+            + ''.join(f'<div class="cinema-block-hall-time">{t}<span>2D</span></div>' for t in _times(rnd, sessions))
+            + '</div>'
+            for hall in range(1, 3)
+        )
+        cards.append(
+            f'<article class="movie-info-item"><div class="movie-info-img"><img src="/upload/{i}.jpg"></div>'
+            f'<a class="movie-info-name" href="film/{i}/">Фильм {i}</a>'
+            f'<div><span class="movie-info-label">Год</span> – {rnd.randint(2000, 2023)}</div>'
+            f'{halls}</article>'
+        )
+    return _page(''.join(cards), rnd)
+
+
+# генераторы страниц для каждого скрапера из scrapers.SCRAPERS
+PAGES: Dict[str, Callable[[random.Random, List[dt.date], int, int], str]] = {
+    'rusich31': rusich_page,
+    'sputnik_cinema31': sputnik_page,
+    'cinema_star': cinema_star_page,
+    'kinobel': kinobel_page,
+}
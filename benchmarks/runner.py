@@ -0,0 +1,104 @@
+import json
+import math
+import time
+from typing import Callable, Dict, List, Optional
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Перцентиль по методу ближайшего ранга
+
+    :param values: отсортированные значения
+    :param percent: перцентиль (0-100)
+    """
+    if not values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def run_benchmark(name: str, func: Callable[[], Optional[int]], repeat: int, warmup: int = 1) -> dict:
+    """
+    Замеряет время выполнения функции
+
+    :param name: название бенчмарка
+    :param func: замеряемая операция. Может вернуть количество обработанных элементов (сеансов, названий и т.п.)
+    :param repeat: сколько раз выполнить операцию
+    :param warmup: сколько раз выполнить операцию до замеров
+    :return: результат в формате {'name': ..., 'items_per_sec': ..., 'p50_ms': ..., ...}
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        processed = func()
+        timings.append(time.perf_counter() - started)
+        items += 1 if processed is None else processed
+
+    return summarize(name, timings, items)
+
+
+def summarize(name: str, timings: List[float], items: int) -> dict:
+    """
+    Сводит замеры в результат бенчмарка
+
+    :param name: название бенчмарка
+    :param timings: длительности замеров в секундах
+    :param items: сколько элементов обработано за все замеры
+    :return: результат в формате {'name': ..., 'items_per_sec': ..., 'p50_ms': ..., ...}
+    """
+    timings = sorted(timings)
+    repeat = len(timings)
+    total = sum(timings)
+    return {
+        'name': name,
+        'repeat': repeat,
+        'items': items,
+        'items_per_sec': items / total if total else 0.0,
+        'mean_ms': total / repeat * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p90_ms': percentile(timings, 90) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+    }
+
+
+def print_results(results: List[dict]):
+    header = f'{"benchmark":<48} {"items/s":>12} {"p50, ms":>10} {"p90, ms":>10} {"p99, ms":>10}'
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(f'{result["name"]:<48} {result["items_per_sec"]:>12.1f} '
+              f'{result["p50_ms"]:>10.3f} {result["p90_ms"]:>10.3f} {result["p99_ms"]:>10.3f}')
+
+
+def save_results(results: List[dict], path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'results': results}, f, indent=2, ensure_ascii=False)
+
+
+def compare_results(results: List[dict], baseline_path: str, threshold: float) -> List[str]:
+    """
+    Сравнивает результаты с сохранённым ранее базовым прогоном
+
+    :param results: результаты текущего прогона
+    :param baseline_path: путь до файла с базовым прогоном (см. save_results)
+    :param threshold: допустимое ухудшение, например 0.2 - на 20%
+    :return: описания регрессий
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline: Dict[str, dict] = {result['name']: result for result in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result['name'])
+        if not base:
+            continue
+        if base['p50_ms'] and result['p50_ms'] > base['p50_ms'] * (1 + threshold):
+            regressions.append(f'{result["name"]}: p50 {base["p50_ms"]:.3f} ms -> {result["p50_ms"]:.3f} ms')
+        if base['items_per_sec'] and result['items_per_sec'] < base['items_per_sec'] * (1 - threshold):
+            regressions.append(f'{result["name"]}: throughput {base["items_per_sec"]:.1f}/s '
+                               f'-> {result["items_per_sec"]:.1f}/s')
+    return regressions
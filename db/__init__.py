@@ -5,13 +5,16 @@ from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 from sqlalchemy.engine.url import URL
 
+from settings import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+
 
 def db_engine_factory(config: Optional[dict] = None, **kwargs) -> Engine:
     """
     Фабкика движков для sqlalchemy
 
     :param config: словарь с параметрами подключения к postgresql. По умолчанию берётся из переменных окружения
-    :param kwargs: аргументы, которые передаются в create_engine
+    :param kwargs: аргументы, которые передаются в create_engine. Параметры пула соединений по умолчанию
+        берутся из settings (DB_POOL_*)
 
     :return: инициализированный движок sqlalchemy
     """
@@ -27,7 +30,14 @@ def db_engine_factory(config: Optional[dict] = None, **kwargs) -> Engine:
         # 'query': {'encoding': 'utf-8'}
     }
     url = URL.create(**db_config)
-    engine = create_engine(url, **kwargs)
+    pool_config = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    engine = create_engine(url, **{**pool_config, **kwargs})
     return engine
 
 
@@ -1,16 +1,54 @@
 # coding: utf-8
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, JSON, String, Text, UniqueConstraint, text
-from sqlalchemy.orm import relationship, sessionmaker
+from contextlib import contextmanager
+import threading
+from typing import Iterator, List, Optional
+
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Index, Integer, JSON, String, Text, \
+    UniqueConstraint, func, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession, relationship, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 from db import db_engine_factory
 
-engine = db_engine_factory()
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
 
-Session = sessionmaker(bind=engine)
-session = Session()
 
-Base = declarative_base(bind=engine)
+def get_engine() -> Engine:
+    """
+    Возвращает движок sqlalchemy. Движок создаётся при первом обращении, а не при импорте модуля,
+    поэтому для импорта моделей (например, в скраперах или бенчмарках) параметры подключения к БД не нужны
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = db_engine_factory()
+        return _engine
+
+
+def __getattr__(name: str):
+    # обратная совместимость: from db.models import engine
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class _LazySessionmaker(sessionmaker):
+    """
+    Фабрика сессий, которая привязывается к движку get_engine() при создании первой сессии,
+    если до этого её не привязали к другому движку через Session.configure(bind=...)
+    """
+
+    def __call__(self, **local_kw) -> OrmSession:
+        if self.kw.get('bind') is None and 'bind' not in local_kw:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+Session = _LazySessionmaker()
+
+Base = declarative_base()
 metadata = Base.metadata
 
 
@@ -25,6 +63,7 @@ class Fedmovie(Base):
     cardNumber = Column(String(20), nullable=False)
     foreignName = Column(String)
     filmname = Column(String, nullable=False, index=True)
+    normTitle = Column(String, index=True)  # нормализованное название для поиска по точному совпадению
     studio = Column(String)
     crYearOfProduction = Column(String, index=True)
     director = Column(String)
@@ -42,6 +81,18 @@ class Fedmovie(Base):
         return f'Fedmovie(id={self.id}, {self.filmname}, {self.crYearOfProduction})'
 
 
+class RegistryRevision(Base):
+    """
+    Ревизия реестра фильмов: увеличивается в той же транзакции, в которой меняются фильмы (см. FedMoviesRepo).
+    По ней без перебора fedmovie проверяется, не устарел ли снимок реестра
+    """
+    __tablename__ = 'registry_revision'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # в таблице одна строка с id = 1
+    revision = Column(Integer, nullable=False, server_default=text('0'))
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
 class Theater(Base):
     """
     Модель кинотеатра
@@ -65,7 +116,7 @@ class MovieSession(Base):
     """
     __tablename__ = 'session'
     __table_args__ = (
-        UniqueConstraint('theater_id', 'movie_id', 'hall', 'datetime'),
+        UniqueConstraint('theater_id', 'movie_id', 'hall', 'datetime', name='session_unique'),
     )
 
     id = Column(Integer, primary_key=True, server_default=text("nextval('session_id_seq'::regclass)"))
@@ -77,3 +128,128 @@ class MovieSession(Base):
 
     movie = relationship('Fedmovie')
     theater = relationship('Theater')
+
+
+class TitleMatch(Base):
+    """
+    Сохранённое сопоставление названия фильма с сайта кинотеатра и фильма из реестра.
+    Позволяет не искать повторно одни и те же названия при каждом запуске
+    """
+    __tablename__ = 'title_match'
+
+    source = Column(String, primary_key=True)  # скрапер, с сайта которого пришло название
+    title = Column(String, primary_key=True)  # название в том виде, в каком оно было на сайте
+    year = Column(Integer, primary_key=True, server_default=text('0'))  # год выхода, 0 - не указан
+    movie_id = Column(ForeignKey('fedmovie.id', ondelete='CASCADE'), nullable=False, index=True)
+    confidence = Column(Float, nullable=False)  # насколько уверенно найден фильм: 1 - точное совпадение названия
+    matched_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    movie = relationship('Fedmovie')
+
+    def __repr__(self):
+        return f'TitleMatch({self.source}, {self.title}, {self.year} -> {self.movie_id}, {self.confidence:.2f})'
+
+
+class ScrapeJob(Base):
+    """
+    Задача распределённой очереди: скрапинг расписания кинотеатра на дату (см. worker.py)
+    """
+    __tablename__ = 'scrape_job'
+    __table_args__ = (
+        Index('scrape_job_status_due_idx', 'status', 'due_at'),
+    )
+
+    theater_id = Column(ForeignKey('theater.id', ondelete='CASCADE'), primary_key=True)
+    date = Column(Date, primary_key=True)
+    status = Column(String, nullable=False, server_default=text("'pending'"))  # pending, running, done, failed
+    due_at = Column(DateTime, nullable=False, server_default=func.now())  # раньше этого времени задачу не берут
+    worker = Column(String)  # воркер, который выполняет задачу
+    lease_until = Column(DateTime)  # если воркер не продлил аренду до этого времени, задачу заберёт другой воркер
+    attempts = Column(Integer, nullable=False, server_default=text('0'))
+    last_error = Column(Text)
+    finished_at = Column(DateTime)
+
+    theater = relationship('Theater')
+
+    def __repr__(self):
+        return f'ScrapeJob({self.theater_id}, {self.date}, {self.status}, {self.worker})'
+
+
+class _SessionScope:
+    """
+    Сессии БД одного прогона: по одной на поток, т.к. сессия sqlalchemy не потокобезопасна
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._sessions: List[OrmSession] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> OrmSession:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            # объекты остаются доступными после commit без повторной загрузки из БД, как и после закрытия сессии
+            session = self._local.session = Session(expire_on_commit=False)
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self, commit: bool):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            try:
+                if commit:
+                    session.commit()
+                else:
+                    session.rollback()
+            finally:
+                session.close()
+
+
+_scope: Optional[_SessionScope] = None
+
+
+@contextmanager
+def session_scope() -> Iterator[None]:
+    """
+    Единица работы на прогон: пока блок with не завершился, все репозитории работают через одну и ту же сессию
+    (в каждом потоке - свою) вместо того, чтобы открывать новую на каждый вызов.
+    Репозитории по-прежнему сами делают commit, а незакоммиченное по выходу из блока коммитится
+    (или откатывается, если блок завершился ошибкой). Вложенные вызовы используют внешнюю единицу работы
+    """
+    global _scope
+    if _scope is not None:
+        yield
+        return
+
+    scope = _scope = _SessionScope()
+    try:
+        yield
+    except BaseException:
+        _scope = None
+        scope.close(commit=False)
+        raise
+    _scope = None
+    scope.close(commit=True)
+
+
+@contextmanager
+def get_session() -> Iterator[OrmSession]:
+    """
+    Сессия БД для одного вызова репозитория: общая сессия прогона, если открыт session_scope, иначе новая сессия,
+    которая закрывается по выходу из блока with
+    """
+    scope = _scope
+    if scope is None:
+        with Session() as session:
+            yield session
+        return
+
+    session = scope.get()
+    try:
+        yield session
+    except BaseException:
+        # после ошибки транзакция в сессии непригодна, а сессией дальше будут пользоваться другие вызовы
+        session.rollback()
+        raise
@@ -1,15 +1,46 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import datetime as dt
-import glob
-from pathlib import Path
-from typing import List, Optional
+from itertools import chain, islice
+import logging
+import math
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Union
 
-import requests
-
-from db.models import Theater, MovieSession
+from db.models import Fedmovie, Theater, session_scope
+from metrics import get_metrics
 from repos.fed_movies_repo import FedMoviesRepo
-from repos.movie_sessions_repo import MovieSessionsRepo
+from repos.movie_cache import MovieRecord
+from repos.movie_sessions_repo import MovieSessionsRepo, SyncResult, UpsertResult
+from repos.session_batch import SessionBatch
+from repos.title_matches_repo import MatchKey, TitleMatchesRepo
+from posters import PosterDownloader
 from scrapers import scraper_factory
-from settings import HEADERS, MEDIA_ROOT, POSTERS_DIR
+from scrapers.exceptions import BaseScraperException
+from scrapers.models import ScrapedSession
+from settings import SCRAPING_WORKERS, REQUESTS_SCRAPERS_LIMIT, \
+    BROWSER_SCRAPERS_LIMIT, THEATER_TIMEOUT, SESSIONS_SYNC, SESSIONS_BATCH_SIZE
+
+if TYPE_CHECKING:
+    from scrapers.abstract_scraper import AbstractScraper
+
+logger = logging.getLogger(__name__)
+
+# сколько сеансов скрапер отдаёт движку за раз
+SCRAPE_CHUNK_SIZE = 100
+
+
+class ScrapeEvent(NamedTuple):
+    """
+    Событие потока скрапинга: очередная порция сеансов кинотеатра или завершение его скрапинга
+    """
+    theater: Theater
+    sessions: List[ScrapedSession]  # порция сеансов (в событии завершения - пустая)
+    finished: bool = False  # скрапинг кинотеатра завершён
+    error: Optional[BaseException] = None  # скрапинг упал или не уложился в таймаут
 
 
 class BaseEngineException(BaseException):
@@ -21,87 +52,431 @@ class ScrapingEngine:
     Движок, управляющий работой скраперов и сохраняющий данные, которые поступают от скраперов
     """
     def __init__(self, theaters: List[Theater],
-                 fed_movies_repo: FedMoviesRepo, sessions_repo: MovieSessionsRepo):
+                 fed_movies_repo: FedMoviesRepo, sessions_repo: MovieSessionsRepo,
+                 workers: int = SCRAPING_WORKERS,
+                 requests_workers: int = REQUESTS_SCRAPERS_LIMIT,
+                 browser_workers: int = BROWSER_SCRAPERS_LIMIT,
+                 theater_timeout: Optional[float] = THEATER_TIMEOUT,
+                 matches_repo: Optional[TitleMatchesRepo] = None,
+                 sync: bool = SESSIONS_SYNC,
+                 batch_size: int = SESSIONS_BATCH_SIZE):
         """
         :param theaters: список кинотеатров
         :param fed_movies_repo: репозиторий фильмов
         :param sessions_repo: репозиторий сеансов
+        :param workers: количество потоков для скрапинга. При workers <= 1 кинотеатры скрапятся последовательно
+        :param requests_workers: сколько скраперов на requests могут работать одновременно
+        :param browser_workers: сколько скраперов на selenium могут работать одновременно
+        :param theater_timeout: сколько секунд ждать скрапинга одного кинотеатра. Отсчитывается с момента,
+            когда скрапер занял место в ограничениях скраперов (см. _queue_timeout). None - ждать сколько угодно
+        :param matches_repo: репозиторий сохранённых сопоставлений названий с фильмами
+        :param sync: синхронизировать расписание в БД со скрапленным (удалять отменённые и перенесённые сеансы).
+            False - сеансы только добавляются и обновляются
+        :param batch_size: сколько сеансов без синхронизации накапливается перед записью в БД
         """
         self.theaters = theaters
         self.fed_movies_repo = fed_movies_repo
         self.sessions_repo = sessions_repo
+        self.matches_repo = matches_repo or TitleMatchesRepo()
+        self.workers = workers
+        self.requests_workers = requests_workers
+        self.browser_workers = browser_workers
+        self.theater_timeout = theater_timeout
+        self.sync = sync
+        self.batch_size = batch_size
+        self._posters: Optional[PosterDownloader] = None
+        self._posters_lock = threading.Lock()
+        # скраперы на requests и на selenium ограничиваются отдельными семафорами: {USES_BROWSER: семафор}
+        self._limits = {
+            False: threading.Semaphore(requests_workers),
+            True: threading.Semaphore(browser_workers),
+        }
+        # сколько вызовов run_theater сейчас ждут места или скрапят: {USES_BROWSER: количество}
+        self._in_flight = {False: 0, True: 0}
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def posters(self) -> PosterDownloader:
+        """
+        Загрузчик постеров. Создаётся при первом обращении и живёт столько же, сколько движок
+        """
+        if self._posters is None:
+            # run_theater вызывается из нескольких потоков, а загрузчик со своим пулом потоков нужен один
+            with self._posters_lock:
+                if self._posters is None:
+                    self._posters = PosterDownloader(self.fed_movies_repo)
+        return self._posters
 
     @staticmethod
-    def _get_poster(idx: int) -> Optional[str]:
+    def _iter_theater(theater: Theater, scraper: 'AbstractScraper', dates: List[dt.date],
+                      chunk_size: int = SCRAPE_CHUNK_SIZE) -> Iterator[List[ScrapedSession]]:
         """
-        Возвращает путь до постера фильма по id, если таковой имеется
+        Скрапит один кинотеатр и отдаёт сеансы порциями по мере того, как скрапер их находит.
+        Записывает время скрапинга и количество найденных сеансов в метрики
 
-        :param idx: id фильма
-        :return: относительный путь до картинки с постером или None
+        :param theater: кинотеатр
+        :param scraper: скрапер кинотеатра
+        :param dates: даты, на которые скрапятся сеансы
+        :param chunk_size: сколько сеансов в одной порции
+        :return: порции найденных сеансов
         """
-        img_mask = Path(MEDIA_ROOT, POSTERS_DIR, str(idx) + '.*')
-        images = glob.glob(str(img_mask))
-        if images:
-            return images[0]
-        return None
+        metrics = get_metrics()
+        labels = {'theater': theater.name, 'scraper': theater.scraper}
+        logger.info('Scraping theater %s', theater.name, extra=labels)
+        count = 0
+        # время скрапинга - только время внутри скрапера: пока порция сопоставляется и пишется в БД, скрапер стоит
+        elapsed = 0.0
+        started = time.perf_counter()  # None - порция отдана и скрапер стоит
+        try:
+            sessions = scraper.iter_sessions(dates)
+            while chunk := list(islice(sessions, chunk_size)):
+                elapsed += time.perf_counter() - started
+                started = None
+                count += len(chunk)
+                yield chunk
+                started = time.perf_counter()
+                # брошенный движком скрапинг прекращается на следующей порции
+                scraper.time_left()
+            elapsed += time.perf_counter() - started
+        except BaseException:
+            if started is not None:
+                elapsed += time.perf_counter() - started
+            metrics.observe('scrape', elapsed, **labels)
+            metrics.inc('scrape_runs', result='failed', **labels)
+            raise
+        metrics.observe('scrape', elapsed, **labels)
+        metrics.inc('scrape_runs', result='ok', **labels)
+        metrics.inc('sessions_parsed', count, **labels)
+        logger.info('Scraping theater %s finished', theater.name,
+                    extra={**labels, 'sessions': count, 'seconds': round(elapsed, 3)})
 
-    @staticmethod
-    def _save_poster(idx: int, img_link: str) -> str:
+    def _queue_timeout(self, scraper: 'AbstractScraper', waiting: int) -> Optional[float]:
         """
-        Сохраняет постер
+        Сколько кинотеатр может ждать места в ограничениях скраперов: столько, сколько в худшем случае
+        скрапятся кинотеатры перед ним, если каждый укладывается в self.theater_timeout.
+        Дольше место занимает только зависший скрапер, и ждать его нет смысла
 
-        :param idx: id фильма
-        :param img_link: ссылка на постер
-        :return: относительный (относительно MEDIA_ROOT) путь до скачанной картинки с постером
+        :param scraper: скрапер кинотеатра
+        :param waiting: сколько кинотеатров (включая этот) ждут места или уже скрапятся
+        :return: таймаут в секундах, None - ждать сколько угодно
         """
-        img_ext = img_link.split('.')[-1]
-        img_response = requests.get(img_link, headers=HEADERS)
-        img_data = img_response.content
-        media_path = Path(MEDIA_ROOT, POSTERS_DIR, str(idx) + '.' + img_ext)
-        with open(media_path, 'wb') as f:
-            f.write(img_data)
-        return str(media_path)
+        if not self.theater_timeout:
+            return None
+        slots = self.browser_workers if scraper.USES_BROWSER else self.requests_workers
+        return self.theater_timeout * math.ceil(max(waiting, 1) / max(min(slots, self.workers), 1))
 
-    def run(self, date: dt.date):
+    @contextmanager
+    def _limit(self, theater: Theater, scraper: 'AbstractScraper'):
         """
-        Запускает скрапинг сеансов по выбранным кинотеатрам и сохраняет найденные сеансы в БД
+        Занимает место в ограничении одновременно работающих скраперов (отдельно для requests и selenium).
+        Место ждётся не дольше, чем до scraper.deadline. Когда место занято, scraper.deadline переносится
+        на self.theater_timeout вперёд: время в очереди не отнимается у скрапинга
+
+        :param theater: кинотеатр
+        :param scraper: скрапер кинотеатра
+        """
+        limit = self._limits[scraper.USES_BROWSER]
+        if not limit.acquire(timeout=scraper.time_left()):
+            raise TimeoutError(theater.name)
+        try:
+            if self.theater_timeout:
+                scraper.deadline = time.monotonic() + self.theater_timeout
+            yield
+        finally:
+            limit.release()
 
-        :param date:
-        :return:
+    def _stream_sequentially(self, dates: List[dt.date]) -> Iterator[ScrapeEvent]:
+        """
+        Скрапит кинотеатры по очереди. Скрапинг кинотеатра, который упал или не уложился в self.theater_timeout,
+        завершается событием с ошибкой, и скрапятся следующие кинотеатры
+
+        :param dates: даты, на которые скрапятся сеансы
+        :return: порции сеансов и события завершения скрапинга кинотеатров
         """
-        raw_sessions = {}
         for theater in self.theaters:
-            print(f'Scraping theater {theater}')
-            scraper = scraper_factory(theater)
-            scraper.run(date)
-            raw_sessions[theater.id] = scraper.raw_sessions
-            print(f'\tScraping finished')
-
-        movie_sessions = []
-        print('Matching movies with DB')
+            try:
+                scraper = scraper_factory(theater)
+                if self.theater_timeout:
+                    scraper.deadline = time.monotonic() + self.theater_timeout
+                for chunk in self._iter_theater(theater, scraper, dates):
+                    paused = time.monotonic()
+                    yield ScrapeEvent(theater, chunk)
+                    # пока сеансы порции сопоставляются и пишутся в БД, скрапер стоит: это время не его
+                    if scraper.deadline is not None:
+                        scraper.deadline += time.monotonic() - paused
+            except (Exception, BaseScraperException) as exc:
+                logger.error('Scraping theater %s failed: %r', theater.name, exc,
+                             extra={'theater': theater.name, 'scraper': theater.scraper})
+                yield ScrapeEvent(theater, [], finished=True, error=exc)
+            else:
+                yield ScrapeEvent(theater, [], finished=True)
+
+    def _stream_concurrently(self, dates: List[dt.date]) -> Iterator[ScrapeEvent]:
+        """
+        Скрапит кинотеатры параллельно в пуле потоков и отдаёт сеансы по мере того, как их находят скраперы.
+        Скраперы на requests и на selenium ограничиваются отдельными семафорами.
+        Скрапинг кинотеатра, который упал или не уложился в self.theater_timeout с момента, когда он занял место
+        в ограничениях скраперов, завершается событием с ошибкой (как и не дождавшийся места, см. _queue_timeout)
+
+        :param dates: даты, на которые скрапятся сеансы
+        :return: порции сеансов и события завершения скрапинга кинотеатров
+        """
+        events: queue.Queue = queue.Queue()
+
+        def scrape(theater: Theater, scraper: 'AbstractScraper'):
+            try:
+                with self._limit(theater, scraper):
+                    for chunk in self._iter_theater(theater, scraper, dates):
+                        events.put(ScrapeEvent(theater, chunk))
+            except BaseException as exc:
+                events.put(ScrapeEvent(theater, [], finished=True, error=exc))
+            else:
+                events.put(ScrapeEvent(theater, [], finished=True))
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scraper')
+        pending: Dict[int, Theater] = {}
+        # скраперы создаются заранее: по их deadline видно, каких кинотеатров пора перестать ждать.
+        # Пока кинотеатр в очереди, это срок ожидания места, а когда место занято - срок скрапинга (см. _limit)
+        scrapers: Dict[int, 'AbstractScraper'] = {}
+        for theater in self.theaters:
+            try:
+                scraper = scraper_factory(theater)
+            except Exception as exc:
+                events.put(ScrapeEvent(theater, [], finished=True, error=exc))
+            else:
+                if self.theater_timeout:
+                    scraper.deadline = time.monotonic() + self._queue_timeout(scraper, len(self.theaters))
+                scrapers[theater.id] = scraper
+                executor.submit(scrape, theater, scraper)
+            pending[theater.id] = theater
+        try:
+            while pending:
+                try:
+                    event = events.get(timeout=1 if self.theater_timeout else None)
+                except queue.Empty:
+                    event = None
+                # порции кинотеатров, которых перестали ждать по таймауту, пропускаем
+                if event is not None and event.theater.id in pending:
+                    if event.finished:
+                        del pending[event.theater.id]
+                    if event.error is not None:
+                        logger.error('Scraping theater %s failed: %r', event.theater.name, event.error,
+                                     extra={'theater': event.theater.name, 'scraper': event.theater.scraper})
+                    yield event
+
+                if not self.theater_timeout:
+                    continue
+                now = time.monotonic()
+                for theater_id, theater in list(pending.items()):
+                    scraper = scrapers.get(theater_id)
+                    if scraper is None or scraper.deadline is None or now <= scraper.deadline:
+                        continue
+                    # поток остановить нельзя, поэтому перестаём ждать его результат и просим скрапер прерваться:
+                    # он отдаст браузер и место в ограничении скраперов на ближайшем ожидании
+                    scraper.cancelled.set()
+                    del pending[theater_id]
+                    get_metrics().inc('scrape_runs', result='timeout', theater=theater.name, scraper=theater.scraper)
+                    logger.error('Scraping theater %s timed out', theater.name,
+                                 extra={'theater': theater.name, 'scraper': theater.scraper})
+                    yield ScrapeEvent(theater, [], finished=True, error=TimeoutError(theater.name))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _match_movies(self, raw_sessions: Dict[int, List[ScrapedSession]],
+                      theater_sources: Dict[int, str]) -> Dict[MatchKey, Union[Fedmovie, MovieRecord]]:
+        """
+        Сопоставляет названия фильмов с сайтов с фильмами из реестра.
+        Сначала одним запросом достаются сохранённые сопоставления, и только оставшиеся названия
+        ищутся в реестре одним пакетом. Найденные сопоставления сохраняются для следующих запусков.
+        Фильмы, которые не нашлись в реестре, в результат не попадают
+
+        :param raw_sessions: сеансы в формате {id_кинотеатра: [ScrapedSession, ]}
+        :param theater_sources: скраперы кинотеатров в формате {id_кинотеатра: скрапер}
+        :return: фильмы в формате {(скрапер, название, год): Fedmovie или MovieRecord}
+        """
+        scraped_movies = {}
         for theater_id, theater_raw_sessions in raw_sessions.items():
             for raw_session in theater_raw_sessions:
-                movie = self.fed_movies_repo.search_movie(title=raw_session.movie.filmname,
-                                                          year=raw_session.movie.year)
-                if not movie:
-                    raise BaseEngineException(f'Фильм {raw_session.movie} не найден в реестре Минкульта',
-                                              raw_session.movie)
+                key = (theater_sources[theater_id], raw_session.movie.filmname, raw_session.movie.year)
+                scraped_movies.setdefault(key, raw_session.movie)
+
+        metrics = get_metrics()
+        movies = self.matches_repo.get_matches(scraped_movies.keys())
+        metrics.inc('movies', len(movies), result='saved_match')
+        logger.info('%d of %d movie(s) found in saved matches', len(movies), len(scraped_movies))
 
-                # если постера в базе нет, то скачиваем
+        # одно и то же название может прийти с сайтов разных кинотеатров, а искать его в реестре нужно один раз
+        queries = {(scraped_movie.filmname, scraped_movie.year) for key, scraped_movie in scraped_movies.items()
+                   if key not in movies}
+        matches = self.fed_movies_repo.match_movies(queries)
+
+        new_matches = []
+        for key, scraped_movie in scraped_movies.items():
+            if key in movies:
+                continue
+            match = matches[(scraped_movie.filmname, scraped_movie.year)]
+            if not match:
+                # один ненайденный фильм не должен ронять сохранение сеансов всех остальных
+                metrics.inc('movies', result='not_found')
+                logger.warning('Movie %s not found in the register, its sessions are skipped', scraped_movie,
+                               extra={'source': key[0]})
+                continue
+            movie, confidence = match
+            metrics.inc('movies', result='exact' if confidence >= 1 else 'fuzzy')
+            movies[key] = movie
+            new_matches.append((key, movie.id, confidence))
+        self.matches_repo.save_matches(new_matches)
+        return movies
+
+    def _save(self, raw_sessions: Dict[int, List[ScrapedSession]], theater_sources: Dict[int, str],
+              dates: List[dt.date], complete: bool = True) -> Union[SyncResult, UpsertResult]:
+        """
+        Сопоставляет фильмы скрапленных сеансов с реестром и сохраняет сеансы в БД
+
+        :param raw_sessions: сеансы в формате {id_кинотеатра: [ScrapedSession, ]}
+        :param theater_sources: скраперы кинотеатров в формате {id_кинотеатра: скрапер}
+        :param dates: даты, на которые скрапились сеансы
+        :param complete: сеансы кинотеатров получены целиком. Только тогда при синхронизации удаляются сеансы,
+            которых больше нет в расписании
+        :return: количество записанных сеансов
+        """
+        metrics = get_metrics()
+        logger.info('Matching movies with DB')
+        with metrics.timer('stage', stage='match'):
+            movies = self._match_movies(raw_sessions, theater_sources)
+
+        # сеансы пишутся в БД прямо из колоночной пачки, без создания объектов MovieSession
+        movie_sessions = SessionBatch()
+        for theater_id, theater_raw_sessions in raw_sessions.items():
+            for raw_session in theater_raw_sessions:
+                movie = movies.get((theater_sources[theater_id], raw_session.movie.filmname, raw_session.movie.year))
+                if movie is None:
+                    continue
+
+                # если постера в базе нет, то ставим его в очередь на скачивание
                 if not movie.posterPath and raw_session.movie.poster_link:
-                    print(f'Downloading poster for {movie}')
-                    poster_path = self._save_poster(movie.id, raw_session.movie.poster_link)
-                    movie.posterPath = poster_path
-                    self.fed_movies_repo.add_movies([movie, ])
-
-                session = MovieSession(
-                    theater_id=theater_id,
-                    movie_id=movie.id,
-                    hall=raw_session.hall,
-                    datetime=raw_session.datetime,
-                    link=raw_session.link
-                )
-                movie_sessions.append(session)
-
-        self.sessions_repo.add_movie_sessions(movie_sessions)
-        print(f'Added/updated {len(movie_sessions)} session(s)')
+                    self.posters.submit(movie.id, raw_session.movie.poster_link)
+
+                movie_sessions.append(theater_id, movie.id, raw_session.hall, raw_session.datetime, raw_session.link)
+
+        with metrics.timer('stage', stage='write'):
+            if self.sync:
+                # синхронизируем только расписания, которые скрапер вернул хотя бы с одним сеансом: если кинотеатр
+                # упал или на дату ещё нет расписания, то его сеансы в БД не трогаем
+                scopes = {
+                    (theater_id, raw_session.datetime.date())
+                    for theater_id, theater_raw_sessions in raw_sessions.items()
+                    for raw_session in theater_raw_sessions
+                    if complete and raw_session.datetime.date() in dates
+                }
+                result = self.sessions_repo.sync_movie_sessions(movie_sessions, scopes)
+            else:
+                result = self.sessions_repo.add_movie_sessions_bulk(movie_sessions)
+        for name, count in result._asdict().items():
+            metrics.inc('session_rows', count, result=name)
+        logger.info('Session rows written', extra={**result._asdict(), 'sessions': len(movie_sessions)})
+        return result
+
+    def _run(self, dates: List[dt.date]):
+        """
+        Скрапит сеансы на переданные даты и сохраняет их в БД. Сеансы пишутся по мере скрапинга,
+        не дожидаясь остальных кинотеатров: в режиме синхронизации - как только кинотеатр доскраплен целиком,
+        иначе - пачками по self.batch_size сеансов
+
+        :param dates: даты, на которые скрапятся сеансы
+        """
+        metrics = get_metrics()
+        started = time.perf_counter()
+        theater_sources = {theater.id: theater.scraper for theater in self.theaters}
+        # сеансы, которые ещё не записаны в БД: {id_кинотеатра: [ScrapedSession, ]}
+        buffers: Dict[int, List[ScrapedSession]] = defaultdict(list)
+        buffered = scraped_theaters = 0
+
+        stream = self._stream_concurrently(dates) if self.workers > 1 else self._stream_sequentially(dates)
+        for event in stream:
+            buffers[event.theater.id].extend(event.sessions)
+            buffered += len(event.sessions)
+            if event.finished:
+                theater_sessions = buffers.pop(event.theater.id)
+                buffered -= len(theater_sessions)
+                scraped_theaters += event.error is None
+                # сеансы упавшего кинотеатра тоже пишем, но без удаления тех, что он не успел отдать
+                if theater_sessions:
+                    self._save({event.theater.id: theater_sessions}, theater_sources, dates,
+                               complete=event.error is None)
+            elif not self.sync and buffered >= self.batch_size:
+                self._save(buffers, theater_sources, dates, complete=False)
+                buffers.clear()
+                buffered = 0
+
+        # постеры качаются в фоне, пока матчатся и сохраняются сеансы. Дожидаемся их только в самом конце
+        if self._posters is not None:
+            with metrics.timer('stage', stage='posters'):
+                self.posters.wait()
+
+        metrics.observe('run', time.perf_counter() - started)
+        metrics.inc('runs')
+        logger.info('Run finished', extra={'seconds': round(time.perf_counter() - started, 3),
+                                           'theaters': scraped_theaters})
+
+    def run_theater(self, theater: Theater, dates: List[dt.date]) -> Union[SyncResult, UpsertResult]:
+        """
+        Скрапит один кинотеатр и сохраняет его сеансы в БД. Можно вызывать из нескольких потоков одновременно:
+        скраперы по-прежнему ограничиваются семафорами движка. Постеры качаются в фоне, их нужно дождаться
+        через self.posters.wait().
+        Скрапинг, который не уложился в self.theater_timeout с момента, когда занял место в ограничениях скраперов
+        (или не дождался места, см. _queue_timeout), бросается с TimeoutError,
+        чтобы зависший скрапер не занимал вызывающий поток навсегда
+
+        :param theater: кинотеатр
+        :param dates: даты, на которые скрапятся сеансы
+        :return: количество записанных сеансов
+        """
+        scraper = scraper_factory(theater)
+        result = {}
+
+        def scrape():
+            try:
+                with self._limit(theater, scraper):
+                    result['sessions'] = list(chain.from_iterable(self._iter_theater(theater, scraper, dates)))
+            except BaseException as exc:
+                result['error'] = exc
+
+        if self.theater_timeout:
+            with self._in_flight_lock:
+                self._in_flight[scraper.USES_BROWSER] += 1
+                waiting = self._in_flight[scraper.USES_BROWSER]
+            try:
+                scraper.deadline = time.monotonic() + self._queue_timeout(scraper, waiting)
+                # поток скрапера остановить нельзя, поэтому ждём его не дольше scraper.deadline,
+                # который переносится, когда скрапер занимает место в ограничениях скраперов
+                thread = threading.Thread(target=scrape, name=f'scraper-{theater.id}', daemon=True)
+                thread.start()
+                while thread.is_alive() and time.monotonic() < scraper.deadline:
+                    thread.join(scraper.deadline - time.monotonic())
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight[scraper.USES_BROWSER] -= 1
+            if thread.is_alive():
+                # скрапер прервётся на ближайшем ожидании и отдаст браузер и место в ограничениях скраперов
+                scraper.cancelled.set()
+                get_metrics().inc('scrape_runs', result='timeout', theater=theater.name, scraper=theater.scraper)
+                raise TimeoutError(theater.name)
+        else:
+            scrape()
+        if 'error' in result:
+            raise result['error']
+        # без session_scope: он общий на процесс, и задача, закончившая первой, закрыла бы сессии остальных потоков
+        return self._save({theater.id: result['sessions']}, {theater.id: theater.scraper}, dates)
+
+    def run(self, date: dt.date, days: int = 1):
+        """
+        Запускает скрапинг сеансов по выбранным кинотеатрам и сохраняет найденные сеансы в БД
+
+        :param date: дата, на которую скрапятся сеансы (первая дата диапазона)
+        :param days: на сколько дней, начиная с date, скрапятся сеансы
+        """
+        dates = [date + dt.timedelta(days=i) for i in range(days)]
+        # все репозитории в прогоне работают через общую сессию БД, а не открывают новую на каждый вызов
+        with session_scope():
+            self._run(dates)
@@ -1,50 +1,174 @@
 """
 Обновляет данные о фильмах, вытаскивая их через API минкульта РФ
+
+    python fed_movies_updater.py          # изменения за последние 30 дней
+    python fed_movies_updater.py --bulk   # то же самое, но загрузка в БД через COPY
+    python fed_movies_updater.py --full   # полная выгрузка реестра (всегда через COPY)
+    python fed_movies_updater.py --backfill   # заполнить нормализованные названия у уже сохранённых фильмов
+    python fed_movies_updater.py --snapshot   # только пересохранить снимок реестра для сопоставления названий
+
+Страницы API обрабатываются потоком: следующая страница скачивается, пока обрабатывается текущая,
+а фильмы сохраняются в БД пачками по --chunk-size штук. Поэтому память не растёт с количеством страниц,
+а при падении посреди выгрузки уже сохранённые пачки не теряются.
+После обновления пересохраняется снимок реестра (настройка REGISTRY_SNAPSHOT), по которому скраперы
+сопоставляют названия фильмов
 """
 
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import logging
 import os
 import datetime as dt
+from typing import Iterable, Iterator, List, Optional
 
 import requests
 from sqlalchemy import inspect
 
-from db.models import Fedmovie
+from db.models import Fedmovie, session_scope
+from http_client import get_http_session
+from metrics import configure_logging, get_metrics
 from repos.fed_movies_repo import FedMoviesRepo
-from settings import HEADERS
+from repos.title_matches_repo import TitleMatchesRepo
+from settings import HEADERS, HTTP_TIMEOUT, METRICS_FILE, REGISTRY_SNAPSHOT
 
 DATA_URL = 'https://opendata.mkrf.ru/v2/register_movies/7'
 REQ_PARAMS_TEMPLATE = 'f={{"modified":{{"$gt":"{date}"}}}}'
+CHUNK_SIZE = 1000
 
+MOVIE_FIELDS = [column.key for column in inspect(Fedmovie).attrs]
 
-if __name__ == '__main__':
-    fed_movies_db = FedMoviesRepo()
+logger = logging.getLogger(__name__)
 
-    update_from_date = (dt.date.today() - dt.timedelta(days=30)).strftime('%Y-%m-%d')
-    headers = HEADERS.copy()
-    headers.update({'X-API-KEY': os.environ['MKRF_API_KEY']})
 
-    movies = []
-    next_url = DATA_URL
-    params = REQ_PARAMS_TEMPLATE.format(date=update_from_date)
-    while next_url:
-        print(next_url)
-        response = requests.get(next_url, params=params, headers=headers)
-        if response.status_code != 200:
-            raise requests.exceptions.InvalidURL(f'MKRF update data downloading error: {response.status_code}')
+def fetch_page(url: str, params: Optional[str], headers: dict) -> dict:
+    """
+    Скачивает одну страницу реестра
 
-        movie_fields = [column.key for column in inspect(Fedmovie).attrs]
+    :param url: адрес страницы
+    :param params: параметры запроса
+    :param headers: заголовки запроса
+    :return: распарсенный json страницы
+    """
+    metrics = get_metrics()
+    logger.info('Downloading %s', url)
+    with metrics.timer('registry_page_fetch'):
+        response = get_http_session().get(url, params=params, headers=headers, timeout=HTTP_TIMEOUT)
+    if response.status_code != 200:
+        raise requests.exceptions.InvalidURL(f'MKRF update data downloading error: {response.status_code}')
+    metrics.inc('registry_pages')
+    metrics.inc('registry_bytes', len(response.content))
+    return response.json()
 
-        for raw_movie in response.json()['data']:
+
+def fetch_pages(url: str, params: Optional[str], headers: dict) -> Iterator[dict]:
+    """
+    Генератор страниц реестра. Пока вызывающий код обрабатывает текущую страницу, следующая уже скачивается
+
+    :param url: адрес первой страницы
+    :param params: параметры запроса первой страницы (в ссылках на следующие страницы они уже есть)
+    :param headers: заголовки запроса
+    :return: распарсенные json страниц
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(fetch_page, url, params, headers)
+        while next_page:
+            page = next_page.result()
+            next_url = page.get('nextPage')
+            next_page = executor.submit(fetch_page, next_url, None, headers) if next_url else None
+            yield page
+
+
+def movies_from_pages(pages: Iterable[dict]) -> Iterator[Fedmovie]:
+    """
+    Превращает страницы реестра в фильмы
+
+    :param pages: распарсенные json страниц
+    :return: фильмы
+    """
+    for page in pages:
+        for raw_movie in page['data']:
             movie_data = raw_movie['data']['general']
-            movie_params = {k: v for k, v in movie_data.items() if k in movie_fields}
+            movie_params = {k: v for k, v in movie_data.items() if k in MOVIE_FIELDS}
             movie_params['durationMinute'] = movie_params['durationMinute'].strip() or None
             movie_params['durationHour'] = movie_params['durationHour'].strip() or None
             movie_params['ageLimit'] = movie_params['ageLimit'].strip() or None
-            movies.append(Fedmovie(**movie_params))
+            yield Fedmovie(**movie_params)
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """
+    Разбивает поток на пачки не больше size элементов
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Обновление фильмов из реестра Минкульта РФ')
+    parser.add_argument('--full', action='store_true',
+                        help='загрузить весь реестр, а не только изменения за последние 30 дней')
+    parser.add_argument('--bulk', action='store_true',
+                        help='загружать фильмы в БД через COPY, а не по одному')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='сколько фильмов сохранять в БД за раз')
+    parser.add_argument('--backfill', action='store_true',
+                        help='только заполнить нормализованные названия у фильмов, где их ещё нет')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='только пересохранить снимок реестра')
+    args = parser.parse_args()
+    configure_logging()
+
+    fed_movies_db = FedMoviesRepo()
+    if args.backfill:
+        count = fed_movies_db.backfill_norm_titles(args.chunk_size)
+        logger.info('Normalized titles of %d movie(s)', count)
+        raise SystemExit
+    if args.snapshot:
+        fed_movies_db.export_snapshot()
+        raise SystemExit
+
+    update_from_date = (dt.date.today() - dt.timedelta(days=30)).strftime('%Y-%m-%d')
+    headers = HEADERS.copy()
+    headers.update({'X-API-KEY': os.environ['MKRF_API_KEY']})
+
+    params = None if args.full else REQ_PARAMS_TEMPLATE.format(date=update_from_date)
+    movies = movies_from_pages(fetch_pages(DATA_URL, params, headers))
+
+    metrics = get_metrics()
+    total = 0
+    # изменившиеся фильмы: [(id_фильма, название_фильма, год_выхода), ]
+    changed = []
+    try:
+        # все пачки сохраняются через одну сессию и одно соединение с БД
+        with session_scope():
+            for chunk in chunked(movies, args.chunk_size):
+                with metrics.timer('registry_save'):
+                    if args.full or args.bulk:
+                        count = fed_movies_db.bulk_load_movies(chunk)
+                    else:
+                        fed_movies_db.add_movies(chunk)
+                        count = len(chunk)
+                changed.extend((movie.id, movie.filmname, movie.crYearOfProduction) for movie in chunk)
+                total += count
+                metrics.inc('registry_movies', count)
+                logger.info('Added/updated %d movie(s), %d in total', count, total,
+                            extra={'chunk': count, 'total': total})
+    finally:
+        # сохранённые сопоставления названий с изменившимися фильмами могли устареть. Сбрасываем их один раз
+        # за обновление (в том числе упавшее - по уже сохранённым пачкам): каждый вызов перебирает все
+        # неточные сопоставления
+        with metrics.timer('registry_invalidate'):
+            TitleMatchesRepo.invalidate(changed)
 
-        next_url = response.json().get('nextPage')
-        params = None
+    if REGISTRY_SNAPSHOT:
+        with metrics.timer('registry_snapshot'):
+            fed_movies_db.export_snapshot()
 
-    print(f'Added/updated {len(movies)} movie(s):\n\t', end='')
-    print(*movies, sep='\n\t')
-    fed_movies_db.add_movies(movies)
+    if METRICS_FILE:
+        metrics.export(METRICS_FILE)
@@ -0,0 +1,50 @@
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from settings import HEADERS, HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF
+
+
+def make_http_session(pool_size: int = HTTP_POOL_SIZE, retries: int = HTTP_RETRIES,
+                      backoff: float = HTTP_BACKOFF) -> requests.Session:
+    """
+    Создаёт сессию requests с пулом keep-alive соединений и повтором неудачных запросов
+
+    :param pool_size: сколько соединений держать открытыми на один хост
+    :param retries: сколько раз повторять GET-запрос при сетевой ошибке или ответах 429/5xx
+    :param backoff: пауза перед повтором в секундах, удваивается с каждой попыткой
+    :return: сессия requests
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        # после последней попытки отдаём ответ как есть, статус проверяет вызывающий код
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_default_session: Optional[requests.Session] = None
+_default_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Возвращает общую на процесс сессию requests. Соединения с сайтами переиспользуются между запросами,
+    скраперами и прогонами, поэтому TCP/TLS-рукопожатия не повторяются на каждый запрос
+    """
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = make_http_session()
+        return _default_session
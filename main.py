@@ -1,16 +1,60 @@
+"""
+Скрапит сеансы кинотеатров и сохраняет их в БД
+
+    python main.py                                  # сеансы кинотеатров Белгорода на завтра
+    python main.py --city Белгород --city Курск --date 2022-10-01 --days 3
+    python main.py --daemon --city Белгород         # не завершаться, а постоянно обновлять расписание (scheduler.py)
+"""
+
+import argparse
 import datetime as dt
+import signal
 
 from engine import ScrapingEngine
-from repos import fed_movies_repo, theaters_repo, movie_sessions_repo
+from metrics import configure_logging, get_metrics
+from repos import fed_movies_repo, theaters_repo, movie_sessions_repo, title_matches_repo
+from scheduler import Scheduler
+from settings import METRICS_FILE, SCHEDULER_DAYS, SCRAPING_WORKERS
+
+DEFAULT_CITY = 'Белгород'
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Скрапинг сеансов кинотеатров')
+    parser.add_argument('--city', action='append',
+                        help=f'город, кинотеатры которого скрапятся (можно указать несколько раз). '
+                             f'По умолчанию - {DEFAULT_CITY}')
+    parser.add_argument('--date', type=dt.date.fromisoformat,
+                        help='первая дата в формате ГГГГ-ММ-ДД. По умолчанию - завтра. '
+                             'Демон всегда обновляет расписание, начиная с сегодняшнего дня')
+    parser.add_argument('--days', type=int,
+                        help=f'на сколько дней скрапятся сеансы. По умолчанию - 1 (в режиме демона - {SCHEDULER_DAYS})')
+    parser.add_argument('--workers', type=int, default=SCRAPING_WORKERS,
+                        help='сколько кинотеатров скрапится одновременно')
+    parser.add_argument('--daemon', action='store_true',
+                        help='не завершаться, а постоянно обновлять расписание')
+    args = parser.parse_args()
+    configure_logging()
+
     theaters_repo = theaters_repo.TheatersRepo()
-    theaters = theaters_repo.get_theaters_by_city('Белгород')
+    theaters = []
+    for city in args.city or [DEFAULT_CITY]:
+        theaters.extend(theaters_repo.get_theaters_by_city(city))
 
     fed_movies_db = fed_movies_repo.FedMoviesRepo()
     sessions_repo = movie_sessions_repo.MovieSessionsRepo()
-    scraping_engine = ScrapingEngine(theaters=theaters, fed_movies_repo=fed_movies_db, sessions_repo=sessions_repo)
+    matches_repo = title_matches_repo.TitleMatchesRepo()
+    scraping_engine = ScrapingEngine(theaters=theaters, fed_movies_repo=fed_movies_db, sessions_repo=sessions_repo,
+                                     workers=args.workers, matches_repo=matches_repo)
+
+    if args.daemon:
+        scheduler = Scheduler(scraping_engine, days=args.days or SCHEDULER_DAYS, workers=args.workers)
+        signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: scheduler.stop())
+        scheduler.run_forever()
+    else:
+        date = args.date or dt.date.today() + dt.timedelta(hours=24)
+        scraping_engine.run(date, args.days or 1)
 
-    date = dt.date.today() + dt.timedelta(hours=24)
-    scraping_engine.run(date)
+        if METRICS_FILE:
+            get_metrics().export(METRICS_FILE)
@@ -0,0 +1,249 @@
+"""
+Метрики и логирование.
+
+Метрики (счётчики и таймеры с метками) копятся в общем на процесс реестре get_metrics()
+и выгружаются в текстовом формате Prometheus или в json:
+
+    with get_metrics().timer('stage', stage='match'):
+        ...
+    get_metrics().inc('sessions_parsed', len(sessions), theater=theater.name)
+    get_metrics().export('metrics.prom')
+
+Логи пишутся через стандартный logging. Поля, переданные в extra, выводятся в конце строки в виде key=value,
+а при LOG_JSON = True каждая запись выводится одной json-строкой
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import datetime as dt
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from settings import LOG_LEVEL, LOG_JSON, METRICS_PREFIX
+
+# метки метрики: (('метка', 'значение'), ), отсортированные по названию метки
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """
+    Потокобезопасный реестр счётчиков и таймеров
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        """
+        :param prefix: префикс названий метрик при выгрузке в Prometheus
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        # {(название, метки): [количество, сумма_секунд, максимум_секунд]}
+        self._timers: Dict[Tuple[str, Labels], List[float]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> Tuple[str, Labels]:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Увеличивает счётчик
+
+        :param name: название счётчика
+        :param value: на сколько увеличить
+        :param labels: метки, например theater='Синема Стар'
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """
+        Записывает длительность в таймер
+
+        :param name: название таймера
+        :param seconds: длительность в секундах
+        :param labels: метки
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            timer = self._timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Замеряет длительность выполнения блока with (в том числе завершившегося ошибкой)
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter(self, name: str, **labels) -> float:
+        """
+        Текущее значение счётчика
+        """
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def snapshot(self) -> dict:
+        """
+        Снимок всех метрик
+
+        :return: {'counters': [{'name', 'labels', 'value'}, ], 'timers': [{'name', 'labels', 'count', 'sum', 'max'}, ]}
+        """
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            timers = [
+                {'name': name, 'labels': dict(labels), 'count': count, 'sum': total, 'max': maximum}
+                for (name, labels), (count, total, maximum) in sorted(self._timers.items())
+            ]
+        return {'time': dt.datetime.now().isoformat(), 'counters': counters, 'timers': timers}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Метрики в текстовом формате Prometheus: счётчики - <префикс>_<название>_total,
+        таймеры - summary <префикс>_<название>_seconds и gauge <префикс>_<название>_seconds_max
+        """
+        def labels_text(labels: dict) -> str:
+            if not labels:
+                return ''
+            escaped = (
+                (label, value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+                for label, value in labels.items()
+            )
+            return '{' + ','.join(f'{label}="{value}"' for label, value in escaped) + '}'
+
+        def number_text(value: Union[int, float]) -> str:
+            # без округления: в :g остаётся 6 значащих цифр, и счётчики байт и строк больше 10^6 искажаются
+            return str(value) if isinstance(value, int) else repr(float(value))
+
+        snapshot = self.snapshot()
+        lines = []
+        # в формате Prometheus все строки одной метрики должны идти подряд после строки # TYPE
+        counters = defaultdict(list)
+        for counter in snapshot['counters']:
+            counters[f'{self.prefix}_{counter["name"]}_total'].append(counter)
+        for metric, samples in counters.items():
+            lines.append(f'# TYPE {metric} counter')
+            lines.extend(f'{metric}{labels_text(s["labels"])} {number_text(s["value"])}' for s in samples)
+
+        timers = defaultdict(list)
+        for timer in snapshot['timers']:
+            timers[f'{self.prefix}_{timer["name"]}_seconds'].append(timer)
+        for metric, samples in timers.items():
+            lines.append(f'# TYPE {metric} summary')
+            for s in samples:
+                lines.append(f'{metric}_count{labels_text(s["labels"])} {s["count"]}')
+                lines.append(f'{metric}_sum{labels_text(s["labels"])} {s["sum"]:.6f}')
+            lines.append(f'# TYPE {metric}_max gauge')
+            lines.extend(f'{metric}_max{labels_text(s["labels"])} {s["max"]:.6f}' for s in samples)
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str):
+        """
+        Сохраняет снимок метрик в файл: в json, если у файла расширение .json, иначе в формате Prometheus
+        (например, для textfile collector в node_exporter). Файл подменяется атомарно
+
+        :param path: путь до файла
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = self.to_json() if path.suffix == '.json' else self.to_prometheus()
+        tmp_path = path.with_suffix(f'{path.suffix}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        """
+        Обнуляет все метрики
+        """
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+
+_default_metrics: Optional[Metrics] = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """
+    Возвращает общий на процесс реестр метрик
+    """
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
+
+
+# атрибуты, которые есть у любой записи лога. Всё остальное в записи - поля, переданные через extra
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Обычная текстовая строка лога, в конце которой выводятся поля из extra в виде key=value
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Запись лога одной json-строкой со всеми полями из extra
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': dt.datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, json_logs: bool = LOG_JSON):
+    """
+    Настраивает вывод логов в stderr
+
+    :param level: уровень логирования
+    :param json_logs: выводить каждую запись одной json-строкой
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    if json_logs:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
@@ -0,0 +1,144 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import logging
+from pathlib import Path
+import threading
+from typing import Dict, List, Optional, Set
+
+import requests
+
+from http_client import get_http_session
+from metrics import get_metrics
+from repos.fed_movies_repo import FedMoviesRepo
+from settings import MEDIA_ROOT, POSTERS_DIR, POSTER_WORKERS, POSTER_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class PosterDownloader:
+    """
+    Фоновая загрузка постеров фильмов.
+    Постеры качаются пулом потоков через общий keep-alive пул соединений, каждый фильм - не больше одного раза
+    за прогон. Уже скачанные постеры ищутся по индексу, который строится один раз при создании загрузчика
+    """
+
+    def __init__(self, fed_movies_repo: FedMoviesRepo, workers: int = POSTER_WORKERS,
+                 posters_path: Path = Path(MEDIA_ROOT, POSTERS_DIR), http: Optional[requests.Session] = None):
+        """
+        :param fed_movies_repo: репозиторий фильмов, в котором сохраняются пути до скачанных постеров
+        :param workers: количество потоков для скачивания
+        :param posters_path: папка с постерами
+        :param http: сессия requests, через которую качаются постеры. По умолчанию - общая на процесс
+        """
+        self.fed_movies_repo = fed_movies_repo
+        self.posters_path = posters_path
+        # индекс скачанных постеров: {id_фильма: путь_до_постера}
+        self.index: Dict[int, str] = self._scan()
+
+        self._http = http if http is not None else get_http_session()
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poster')
+        self._lock = threading.Lock()
+        # фильмы, постеры которых уже поставлены в очередь в текущем прогоне
+        self._requested: Set[int] = set()
+        self._futures: List[Future] = []
+
+    def _scan(self) -> Dict[int, str]:
+        """
+        Собирает индекс уже скачанных постеров
+
+        :return: {id_фильма: путь_до_постера}
+        """
+        index = {}
+        if not self.posters_path.is_dir():
+            return index
+        for path in sorted(self.posters_path.iterdir()):
+            if path.stem.isdigit():
+                index.setdefault(int(path.stem), str(path))
+        return index
+
+    def get_poster(self, idx: int) -> Optional[str]:
+        """
+        Возвращает путь до постера фильма по id, если таковой имеется
+
+        :param idx: id фильма
+        :return: относительный путь до картинки с постером или None
+        """
+        return self.index.get(idx)
+
+    def submit(self, idx: int, img_link: str) -> bool:
+        """
+        Ставит постер в очередь на скачивание. Повторные запросы того же фильма за прогон игнорируются.
+        Если постер уже лежит на диске, то он не качается заново, а только прописывается в БД
+
+        :param idx: id фильма
+        :param img_link: ссылка на постер
+        :return: True, если постер поставлен в очередь
+        """
+        with self._lock:
+            if idx in self._requested:
+                return False
+            self._requested.add(idx)
+            poster_path = self.index.get(idx)
+
+        if poster_path:
+            get_metrics().inc('posters', result='existing')
+            future = self._executor.submit(self.fed_movies_repo.set_poster_path, idx, poster_path)
+        else:
+            future = self._executor.submit(self._download, idx, img_link)
+        # под блокировкой, чтобы параллельный wait() не потерял задачу
+        with self._lock:
+            self._futures.append(future)
+        return True
+
+    def _download(self, idx: int, img_link: str) -> str:
+        """
+        Скачивает постер и прописывает путь до него в БД
+
+        :param idx: id фильма
+        :param img_link: ссылка на постер
+        :return: относительный (относительно MEDIA_ROOT) путь до скачанной картинки с постером
+        """
+        metrics = get_metrics()
+        logger.info('Downloading poster for movie %d', idx, extra={'movie_id': idx})
+        img_ext = img_link.split('.')[-1]
+        with metrics.timer('poster_download'):
+            img_response = self._http.get(img_link, timeout=POSTER_TIMEOUT)
+        img_response.raise_for_status()
+        metrics.inc('posters', result='downloaded')
+        metrics.inc('poster_bytes', len(img_response.content))
+        media_path = Path(self.posters_path, str(idx) + '.' + img_ext)
+        with open(media_path, 'wb') as f:
+            f.write(img_response.content)
+
+        with self._lock:
+            self.index[idx] = str(media_path)
+        self.fed_movies_repo.set_poster_path(idx, str(media_path))
+        return str(media_path)
+
+    def wait(self):
+        """
+        Дожидается скачивания всех поставленных в очередь постеров и завершает прогон:
+        после этого постеры, которые не удалось скачать, можно запросить снова
+        """
+        with self._lock:
+            futures, self._futures = self._futures, []
+        wait(futures)
+        for future in futures:
+            if future.exception():
+                get_metrics().inc('posters', result='failed')
+                logger.error('Poster downloading failed: %r', future.exception())
+        with self._lock:
+            self._requested.clear()
+
+    def close(self):
+        """
+        Дожидается скачивания постеров и освобождает потоки
+        """
+        self.wait()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
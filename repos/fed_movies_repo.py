@@ -1,9 +1,55 @@
-import re
-from typing import Optional, List, Tuple
+import csv
+import io
+import logging
+import os
+from typing import Dict, Iterable, Iterator, Optional, List, Set, Tuple, Union
 
-from sqlalchemy import func, desc
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 
-from db.models import Fedmovie, Session
+from db.models import Fedmovie, RegistryRevision, get_session
+from repos.movie_cache import MISSING, MovieCache, MovieRecord
+from repos.registry_snapshot import RegistrySnapshot, RegistryVersion
+from repos.title_index import TitleIndex, normalize_title, year_filter
+from repos.trigram_matcher import PgTrigramMatcher, TrigramMatcher
+from settings import MATCH_THRESHOLD, TITLE_MATCHER, TRIGRAM_BACKEND, REGISTRY_SNAPSHOT, REGISTRY_SNAPSHOT_CHECK
+
+logger = logging.getLogger(__name__)
+
+
+# искомый фильм: (название, год выхода)
+MovieQuery = Tuple[str, Optional[int]]
+
+
+class _CsvStream:
+    """
+    Файлоподобный объект для COPY ... FROM STDIN, который формирует csv из строк по мере чтения,
+    не собирая весь файл в памяти
+    """
+    NULL = '\\N'
+
+    def __init__(self, rows: Iterator[list]):
+        self._rows = rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or self._buffer.tell() < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow([self.NULL if value is None else value for value in row])
+
+        data = self._buffer.getvalue()
+        if size < 0:
+            chunk, rest = data, ''
+        else:
+            chunk, rest = data[:size], data[size:]
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffer.write(rest)
+        return chunk
 
 
 class FedMoviesRepo:
@@ -11,11 +57,182 @@ class FedMoviesRepo:
     Репозиторий фильмов с данными из Реестра прокатных удостоверений фильмов Минкульта РФ
     """
 
-    def __init__(self):
-        # формируем кэш для более быстрого поиска фильмов
-        # структура кэша: {'название': Fedmovie_obj  }
-        # TODO вынести потом кэш в отдельный прокси
-        self.cache = {}
+    def __init__(self, cache: Optional[MovieCache] = None):
+        """
+        :param cache: кэш результатов поиска фильмов по ключу (нормализованное название, год)
+        """
+        self.cache = cache if cache is not None else MovieCache()
+
+    # индекс названий и триграммы общие для всех экземпляров репозитория и строятся один раз на процесс
+    # (либо берутся из снимка реестра)
+    _title_index: Union[TitleIndex, RegistrySnapshot, None] = None
+    _trigram_matcher: Union[TrigramMatcher, PgTrigramMatcher, None] = None
+    _snapshot: Optional[RegistrySnapshot] = None
+    # файл снимка на момент последней попытки его открыть: (inode, время изменения, размер), None - файла не было,
+    # MISSING - снимок ещё не открывался. Пока файл тот же, устаревший снимок повторно не открывается
+    _snapshot_file = MISSING
+
+    @staticmethod
+    def _load_titles() -> List[Tuple[int, str, Optional[str]]]:
+        """
+        Загружает названия и годы выхода всех фильмов из БД
+        """
+        with get_session() as session:
+            return session.query(Fedmovie.id, Fedmovie.filmname, Fedmovie.crYearOfProduction).all()
+
+    @staticmethod
+    def _get_revision(session: Session) -> int:
+        """
+        Возвращает ревизию реестра (0 - фильмы ещё не менялись)
+        """
+        revision = session.query(RegistryRevision.revision).filter(RegistryRevision.id == 1).scalar()
+        return revision or 0
+
+    @staticmethod
+    def _bump_revision(session: Session):
+        """
+        Увеличивает ревизию реестра. Вызывается в той же транзакции, в которой меняются фильмы,
+        чтобы снимок реестра, выгруженный до изменения, считался устаревшим, даже если выгрузка после него упала
+        """
+        RegistryRevision.__table__.create(session.connection(), checkfirst=True)
+        stmt = insert(RegistryRevision).values(id=1, revision=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[RegistryRevision.id],
+            set_={'revision': RegistryRevision.revision + 1, 'updated_at': func.now()},
+        )
+        session.execute(stmt)
+
+    @classmethod
+    def registry_version(cls) -> RegistryVersion:
+        """
+        Возвращает текущую версию реестра в БД (максимальный id, количество фильмов и ревизию реестра)
+        """
+        with get_session() as session:
+            max_id, count = session.query(func.max(Fedmovie.id), func.count(Fedmovie.id)).one()
+            revision = cls._get_revision(session)
+        return RegistryVersion(max_id or 0, count, revision)
+
+    @staticmethod
+    def _snapshot_file_id() -> Optional[Tuple[int, int, int]]:
+        """
+        Возвращает (inode, время изменения, размер) файла снимка, либо None, если файла нет
+        """
+        try:
+            stat = os.stat(REGISTRY_SNAPSHOT)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def get_snapshot(cls) -> Optional[RegistrySnapshot]:
+        """
+        Открывает снимок реестра (см. настройки REGISTRY_SNAPSHOT и REGISTRY_SNAPSHOT_CHECK)
+
+        :return: снимок, либо None, если снимка нет или он устарел
+        """
+        if cls._snapshot is None and REGISTRY_SNAPSHOT and cls._snapshot_file is MISSING:
+            cls._snapshot_file = cls._snapshot_file_id()
+            if cls._snapshot_file is None:
+                return None
+            try:
+                snapshot = RegistrySnapshot(REGISTRY_SNAPSHOT)
+            except (OSError, ValueError) as exc:
+                logger.warning('Registry snapshot %s is unreadable: %r', REGISTRY_SNAPSHOT, exc)
+                return None
+            if REGISTRY_SNAPSHOT_CHECK:
+                version = cls.registry_version()
+                if snapshot.version != version:
+                    logger.warning('Registry snapshot %s is outdated', REGISTRY_SNAPSHOT,
+                                   extra={'snapshot': snapshot.version._asdict(), 'registry': version._asdict()})
+                    return None
+            cls._snapshot = snapshot
+        return cls._snapshot
+
+    @classmethod
+    def export_snapshot(cls, path: Optional[str] = REGISTRY_SNAPSHOT) -> RegistryVersion:
+        """
+        Сохраняет снимок реестра, по которому процессы потом сопоставляют названия без загрузки всех фильмов из БД
+
+        :param path: путь до файла снимка
+        :return: версия реестра в снимке
+        """
+        with get_session() as session:
+            RegistryRevision.__table__.create(session.connection(), checkfirst=True)
+            # ревизия читается до фильмов: если реестр параллельно изменится, то снимок окажется устаревшим,
+            # а не актуальным со старыми названиями
+            revision = cls._get_revision(session)
+            rows = session.query(Fedmovie.id, Fedmovie.filmname, Fedmovie.crYearOfProduction,
+                                 Fedmovie.posterPath).all()
+        movies = [(idx, title, year) for idx, title, year, _ in rows]
+        posters = {idx: poster_path for idx, _, _, poster_path in rows if poster_path}
+        # максимальный id и количество считаются по самой выборке, чтобы совпадать с ней
+        version = RegistryVersion(max((idx for idx, _, _ in movies), default=0), len(movies), revision)
+        RegistrySnapshot.write(path, movies, version, posters)
+        # при следующем поиске откроется новый снимок
+        cls._drop_snapshot()
+        logger.info('Registry snapshot %s exported', path, extra=version._asdict())
+        return version
+
+    @staticmethod
+    def _drop_snapshot():
+        """
+        Забывает снимок реестра после изменения фильмов: он устарел до следующей выгрузки
+        """
+        FedMoviesRepo._snapshot = None
+        FedMoviesRepo._snapshot_file = MISSING
+        if not isinstance(FedMoviesRepo._title_index, TitleIndex):
+            FedMoviesRepo._title_index = None
+        # триграммы дешевле перестроить при следующем поиске, чем обновлять
+        FedMoviesRepo._trigram_matcher = None
+
+    def refresh_snapshot(self) -> bool:
+        """
+        Проверяет, не сменился ли файл снимка реестра (его пересохраняет fed_movies_updater.py).
+        Если сменился, то индексы, построенные по старому снимку или по БД, и кэш поиска фильмов сбрасываются,
+        и при следующем поиске открывается новый снимок. Долгоживущие процессы вызывают его периодически
+
+        :return: True, если снимок сменился
+        """
+        if FedMoviesRepo._snapshot_file is MISSING or self._snapshot_file_id() == FedMoviesRepo._snapshot_file:
+            return False
+        logger.info('Registry snapshot %s changed, reloading', REGISTRY_SNAPSHOT)
+        FedMoviesRepo._snapshot = None
+        FedMoviesRepo._snapshot_file = MISSING
+        FedMoviesRepo._title_index = None
+        FedMoviesRepo._trigram_matcher = None
+        self.cache.clear()
+        return True
+
+    @classmethod
+    def get_title_index(cls) -> Union[TitleIndex, RegistrySnapshot]:
+        """
+        Возвращает индекс названий фильмов. Если есть актуальный снимок реестра, то поиск идёт по нему,
+        иначе при первом обращении загружаются названия всех фильмов из БД
+
+        :return: индекс названий фильмов
+        """
+        if cls._title_index is None:
+            snapshot = cls.get_snapshot()
+            cls._title_index = snapshot if snapshot is not None else TitleIndex(cls._load_titles())
+        return cls._title_index
+
+    @classmethod
+    def get_trigram_matcher(cls) -> Union[TrigramMatcher, PgTrigramMatcher]:
+        """
+        Возвращает нечёткий поиск по триграммам названий (см. настройку TRIGRAM_BACKEND).
+        В памяти триграммы берутся из снимка реестра, либо строятся при первом обращении,
+        и перестраиваются после изменения фильмов
+
+        :return: поиск по триграммам
+        """
+        if cls._trigram_matcher is None:
+            if TRIGRAM_BACKEND == 'pg':
+                cls._trigram_matcher = PgTrigramMatcher()
+            else:
+                snapshot = cls.get_snapshot()
+                cls._trigram_matcher = TrigramMatcher.from_snapshot(snapshot) if snapshot is not None \
+                    else TrigramMatcher(cls._load_titles())
+        return cls._trigram_matcher
 
     @property
     def max_id(self) -> int:
@@ -24,7 +241,7 @@ class FedMoviesRepo:
 
         :return: максимальный id фильма
         """
-        with Session() as session:
+        with get_session() as session:
             result = session.query(func.max(Fedmovie.id)).one()
             return result[0]
 
@@ -38,7 +255,10 @@ class FedMoviesRepo:
         if not all([isinstance(movie, Fedmovie) for movie in movies]):
             raise TypeError('В списке должны быть только объекты типа Fedmovie')
 
-        with Session() as session:
+        for movie in movies:
+            movie.normTitle = normalize_title(movie.filmname)
+
+        with get_session() as session:
             new_movies = {movie.id: movie for movie in movies}
 
             # Обновляем записи, которые уже есть в БД
@@ -47,8 +267,157 @@ class FedMoviesRepo:
             # добавляем все остальные
             session.bulk_save_objects(new_movies.values())
 
+            FedMoviesRepo._bump_revision(session)
             session.commit()
 
+        # поддерживаем индекс названий в актуальном состоянии, если он уже построен
+        if isinstance(FedMoviesRepo._title_index, TitleIndex):
+            FedMoviesRepo._title_index.update(
+                (movie.id, movie.filmname, movie.crYearOfProduction) for movie in movies
+            )
+        FedMoviesRepo._drop_snapshot()
+
+    @staticmethod
+    def bulk_load_movies(movies: Iterable[Fedmovie]) -> int:
+        """
+        Массовая загрузка фильмов в репозиторий: фильмы потоком заливаются через COPY во временную таблицу,
+        а затем одним запросом добавляются в fedmovie или обновляют уже существующие записи.
+        Уже сохранённый путь до постера при обновлении не затирается
+
+        :param movies: фильмы для загрузки
+        :return: количество добавленных/обновлённых фильмов
+        """
+        columns = [column.name for column in Fedmovie.__table__.columns]
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        select_list = ', '.join(
+            "COALESCE(\"posterPath\", '')" if column == 'posterPath' else f'"{column}"' for column in columns
+        )
+        update_list = ', '.join(
+            f'"{column}" = EXCLUDED."{column}"' for column in columns if column not in ('id', 'posterPath')
+        )
+
+        # названия загруженных фильмов для обновления индекса, если он уже построен
+        loaded = []
+
+        def rows() -> Iterator[list]:
+            for movie in movies:
+                if not isinstance(movie, Fedmovie):
+                    raise TypeError('Загружать можно только объекты типа Fedmovie')
+                movie.normTitle = normalize_title(movie.filmname)
+                if isinstance(FedMoviesRepo._title_index, TitleIndex):
+                    loaded.append((movie.id, movie.filmname, movie.crYearOfProduction))
+                yield [getattr(movie, column) for column in columns]
+
+        with get_session() as session:
+            # курсор DBAPI не привязан к сессии, поэтому закрываем его сами
+            with session.connection().connection.cursor() as cursor:
+                cursor.execute('CREATE TEMP TABLE fedmovie_staging (LIKE fedmovie) ON COMMIT DROP')
+                cursor.copy_expert(
+                    f"COPY fedmovie_staging ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{_CsvStream.NULL}')",
+                    _CsvStream(rows())
+                )
+                # если фильм попал в выгрузку несколько раз, то берём последнюю версию
+                cursor.execute(
+                    f'INSERT INTO fedmovie ({column_list}) '
+                    f'SELECT DISTINCT ON (id) {select_list} FROM fedmovie_staging ORDER BY id, ctid DESC '
+                    f'ON CONFLICT (id) DO UPDATE SET {update_list}, '
+                    f'"posterPath" = COALESCE(NULLIF(fedmovie."posterPath", \'\'), EXCLUDED."posterPath")'
+                )
+                count = cursor.rowcount
+            FedMoviesRepo._bump_revision(session)
+            session.commit()
+
+        if isinstance(FedMoviesRepo._title_index, TitleIndex):
+            FedMoviesRepo._title_index.update(loaded)
+        FedMoviesRepo._drop_snapshot()
+        return count
+
+    @staticmethod
+    def backfill_norm_titles(batch_size: int = 1000) -> int:
+        """
+        Добавляет в таблицу fedmovie колонку с нормализованными названиями (если её ещё нет)
+        и заполняет её у фильмов, сохранённых до её появления. Нормализация делается в python,
+        чтобы результат в точности совпадал с normalize_title
+
+        :param batch_size: сколько фильмов обновлять за один запрос
+        :return: количество обновлённых фильмов
+        """
+        with get_session() as session:
+            session.execute(text('ALTER TABLE fedmovie ADD COLUMN IF NOT EXISTS "normTitle" VARCHAR'))
+            session.execute(text('CREATE INDEX IF NOT EXISTS "ix_fedmovie_normTitle" ON fedmovie ("normTitle")'))
+            session.commit()
+
+        total, last_id = 0, 0
+        while True:
+            with get_session() as session:
+                movies = session.query(Fedmovie.id, Fedmovie.filmname)\
+                    .filter(Fedmovie.id > last_id, Fedmovie.normTitle.is_(None))\
+                    .order_by(Fedmovie.id)\
+                    .limit(batch_size)\
+                    .all()
+                if not movies:
+                    return total
+                session.bulk_update_mappings(
+                    Fedmovie, [{'id': idx, 'normTitle': normalize_title(title)} for idx, title in movies]
+                )
+                session.commit()
+            last_id = movies[-1].id
+            total += len(movies)
+
+    @staticmethod
+    def find_exact_movies(queries: Iterable[MovieQuery]) -> Dict[MovieQuery, Fedmovie]:
+        """
+        Поиск фильмов, названия которых совпадают с искомыми после нормализации, одним запросом по индексу
+
+        :param queries: искомые фильмы в формате [(название, год_выхода), ].
+            Поиск осуществляется в промежутке ± 1 год от переданного года
+        :return: найденные фильмы в формате {(название, год_выхода): Fedmovie}.
+            Если подходящих фильмов несколько, то берётся самый новый
+        """
+        queries = set(queries)
+        norm_titles = {normalize_title(title) for title, _ in queries}
+        if not norm_titles:
+            return {}
+
+        with get_session() as session:
+            candidates: Dict[str, List[Fedmovie]] = {}
+            for movie in session.query(Fedmovie).filter(Fedmovie.normTitle.in_(norm_titles)):
+                candidates.setdefault(movie.normTitle, []).append(movie)
+
+        movies = {}
+        for title, year in queries:
+            year_matches = year_filter(year)
+            matches = [movie for movie in candidates.get(normalize_title(title), ())
+                       if year_matches(movie.crYearOfProduction)]
+            if matches:
+                # самый новый фильм, пустые годы сначала - как ORDER BY ... DESC в postgresql
+                movies[(title, year)] = max(
+                    matches, key=lambda movie: (movie.crYearOfProduction is None, movie.crYearOfProduction or '')
+                )
+        return movies
+
+    def find_exact_movie(self, title: str, year: Optional[int] = None) -> Optional[Fedmovie]:
+        """
+        Поиск фильма, название которого совпадает с title после нормализации, одним запросом по индексу
+
+        :param title: Название фильма
+        :param year: Год выхода. Поиск осуществляется в промежутке ± 1 год от переданного
+        :return: Найденный фильм (самый новый, если таких несколько), либо None
+        """
+        return self.find_exact_movies([(title, year)]).get((title, year))
+
+    def set_poster_path(self, idx: int, poster_path: str):
+        """
+        Сохраняет путь до постера фильма в БД и в закэшированных результатах поиска
+
+        :param idx: id фильма
+        :param poster_path: путь до картинки с постером
+        """
+        with get_session() as session:
+            session.query(Fedmovie).filter(Fedmovie.id == idx).update({Fedmovie.posterPath: poster_path})
+            session.commit()
+        self.cache.set_poster_path(idx, poster_path)
+
     @staticmethod
     def get_movie_by_id(idx: int) -> Optional[Fedmovie]:
         """
@@ -57,43 +426,132 @@ class FedMoviesRepo:
         :param idx: Идентификатор записи реестра (id фильма в реестре Минкульта)
         :return: Найденный фильм, либо None
         """
-        with Session() as session:
+        with get_session() as session:
             movie = session.get(Fedmovie, idx)
         return movie
 
-    def search_movie(self, title: str, year: Optional[int] = None) -> Optional[Fedmovie]:
+    def _fuzzy_match(self, title: str, year: Optional[int] = None) -> Optional[Tuple[int, float]]:
         """
-        Поиск фильма в репозитории по названию и году выхода
+        Поиск фильма по похожести названий (см. настройку TITLE_MATCHER)
 
         :param title: Название фильма
-        :param year: Год выхода. Поиск осуществляется в промежутке ± 1 год от переданного
-        :return: Найденный фильм, либо None
+        :param year: Год выхода
+        :return: id найденного фильма и уверенность от 0 до 1, либо None
         """
+        if TITLE_MATCHER == 'words':
+            title_index = self.get_title_index()
+            movies = title_index.find_matches(title, year)
+            if movies is None:
+                return None
+            return movies[0][0], title_index.confidence(title, movies[0][0])
 
-        movie = self.cache.get(title)
-        if movie:
-            return movie
+        candidates = self.get_trigram_matcher().search(title, year, limit=1, threshold=MATCH_THRESHOLD)
+        return candidates[0] if candidates else None
 
-        with Session() as session:
-            if year:
-                year = int(year)
-                date_range = (str(year - 1), str(year + 1))
-                result = session.query(Fedmovie.id, Fedmovie.filmname)\
-                    .filter(Fedmovie.crYearOfProduction.between(*date_range))\
-                    .order_by(desc(Fedmovie.crYearOfProduction))\
-                    .all()
+    def _find_movies(self, queries: Set[MovieQuery]) -> Dict[MovieQuery, Optional[MovieRecord]]:
+        """
+        Ищет фильмы в реестре в обход кэша. Если есть актуальный снимок реестра, то и точные совпадения,
+        и похожие названия, и сами найденные фильмы берутся из него, без запросов к БД
+        (кроме нечёткого поиска в pg_trgm при TRIGRAM_BACKEND = 'pg'). Иначе фильмы ищутся в БД
+
+        :param queries: искомые фильмы в формате {(название, год_выхода), }
+        :return: {(название, год_выхода): MovieRecord с уверенностью от 0 до 1}, None - если фильм не найден
+        """
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return self._find_movies_in_db(queries)
+
+        matches: Dict[MovieQuery, Optional[MovieRecord]] = {}
+        for title, year in queries:
+            exact_matches = snapshot.find_exact(title, year)
+            match = (exact_matches[0][0], 1.0) if exact_matches else self._fuzzy_match(title, year)
+            movie = snapshot.movie(match[0]) if match else None
+            matches[(title, year)] = MovieRecord(*movie, confidence=match[1]) if movie else None
+        return matches
+
+    def _find_movies_in_db(self, queries: Set[MovieQuery]) -> Dict[MovieQuery, Optional[MovieRecord]]:
+        """
+        Ищет фильмы в БД. Точные совпадения нормализованных названий ищутся одним запросом,
+        для остальных фильм ищется по похожести названий, и все найденные так фильмы достаются ещё одним запросом
+
+        :param queries: искомые фильмы в формате {(название, год_выхода), }
+        :return: {(название, год_выхода): MovieRecord с уверенностью от 0 до 1}, None - если фильм не найден
+        """
+        matches: Dict[MovieQuery, Optional[MovieRecord]] = {
+            query: MovieRecord.from_movie(movie) for query, movie in self.find_exact_movies(queries).items()
+        }
+
+        fuzzy_matches = {}
+        for query in queries:
+            if query in matches:
+                continue
+            fuzzy_matches[query] = self._fuzzy_match(*query)
+            matches[query] = None
+
+        ids = {match[0] for match in fuzzy_matches.values() if match is not None}
+        if ids:
+            with get_session() as session:
+                movies = {movie.id: movie for movie in session.query(Fedmovie).filter(Fedmovie.id.in_(ids))}
+            for query, match in fuzzy_matches.items():
+                if match is not None and match[0] in movies:
+                    matches[query] = MovieRecord.from_movie(movies[match[0]], match[1])
+        return matches
+
+    def match_movies(self, queries: Iterable[MovieQuery]) -> Dict[MovieQuery, Optional[Tuple[MovieRecord, float]]]:
+        """
+        Поиск сразу нескольких фильмов по названию и году выхода с оценкой уверенности совпадения.
+        Одинаковые запросы выполняются один раз. Результаты (в том числе ненайденные фильмы) кэшируются
+        по нормализованному названию и году, поэтому одно и то же название в разном написании ищется один раз,
+        а в реестре ищутся только названия, которых нет в кэше
+
+        :param queries: искомые фильмы в формате [(название, год_выхода), ]
+        :return: {(название, год_выхода): (MovieRecord, уверенность от 0 до 1)}, None - если фильм не найден
+        """
+        matches: Dict[MovieQuery, Optional[Tuple[MovieRecord, float]]] = {}
+        misses = set()
+        for title, year in set(queries):
+            record = self.cache.get((normalize_title(title), year))
+            if record is MISSING:
+                misses.add((title, year))
             else:
-                result = session.query(Fedmovie.id, Fedmovie.filmname)\
-                    .order_by(desc(Fedmovie.crYearOfProduction))\
-                    .all()
+                matches[(title, year)] = (record, record.confidence) if record is not None else None
 
-        movies = self._find_title_matches(title, result)
-        if movies is None:
-            return None
-        with Session() as session:
-            movie = session.get(Fedmovie, movies[0][0])
-            self.cache[title] = movie
-        return movie
+        for (title, year), record in (self._find_movies(misses) if misses else {}).items():
+            matches[(title, year)] = (record, record.confidence) if record is not None else None
+            self.cache.put((normalize_title(title), year), record)
+        return matches
+
+    def match_movie(self, title: str, year: Optional[int] = None) -> Optional[Tuple[MovieRecord, float]]:
+        """
+        Поиск фильма в репозитории по названию и году выхода с оценкой уверенности совпадения
+
+        Сначала ищется точное совпадение нормализованных названий (± 1 год от переданного).
+        Если его нет, то фильм ищется по похожести названий (см. настройку TITLE_MATCHER)
+
+        :param title: Название фильма
+        :param year: Год выхода
+        :return: Найденный фильм и уверенность от 0 до 1 (1 - названия совпадают), либо None
+        """
+        return self.match_movies([(title, year)])[(title, year)]
+
+    def search_movies(self, queries: Iterable[MovieQuery]) -> Dict[MovieQuery, Optional[MovieRecord]]:
+        """
+        Поиск сразу нескольких фильмов в репозитории по названию и году выхода (см. match_movies)
+
+        :param queries: искомые фильмы в формате [(название, год_выхода), ]
+        :return: найденные фильмы в формате {(название, год_выхода): MovieRecord}, None - если фильм не найден
+        """
+        return {query: match[0] if match else None for query, match in self.match_movies(queries).items()}
+
+    def search_movie(self, title: str, year: Optional[int] = None) -> Optional[MovieRecord]:
+        """
+        Поиск фильма в репозитории по названию и году выхода
+
+        :param title: Название фильма
+        :param year: Год выхода. Поиск осуществляется в промежутке ± 1 год от переданного
+        :return: Найденный фильм, либо None
+        """
+        return self.search_movies([(title, year)])[(title, year)]
 
     @staticmethod
     def _normalize_title(title: str) -> str:
@@ -104,11 +562,7 @@ class FedMoviesRepo:
 
         :return: Нормализованное название фильма
         """
-        title = re.sub(r'(\W+)', ' ', title)
-        title = title.translate(str.maketrans({'Ё': 'Е', 'Й': 'И', 'ё': 'е', 'й': 'и', }))
-        title = title.strip()
-        title = title.lower()
-        return title
+        return normalize_title(title)
 
     def _find_title_matches(self, title: str, movies: List[Tuple[int, str]]) -> Optional[List[Tuple[int, str]]]:
         """
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Hashable, NamedTuple, Optional
+
+from db.models import Fedmovie
+from metrics import get_metrics
+from settings import MOVIE_CACHE_SIZE, MOVIE_CACHE_TTL, MOVIE_CACHE_NEGATIVE_TTL
+
+
+class MovieRecord(NamedTuple):
+    """
+    Компактная запись о фильме для кэша: только то, что нужно для сопоставления с сеансами,
+    и уверенность сопоставления
+    """
+    id: int
+    filmname: str
+    year: Optional[str]
+    posterPath: Optional[str]
+    confidence: float = 1.0  # насколько уверенно фильм сопоставлен с искомым названием
+
+    @classmethod
+    def from_movie(cls, movie: Fedmovie, confidence: float = 1.0) -> 'MovieRecord':
+        return cls(movie.id, movie.filmname, movie.crYearOfProduction, movie.posterPath, confidence)
+
+
+class CacheStats(NamedTuple):
+    """
+    Счётчики кэша с момента создания (или последнего clear)
+    """
+    hits: int  # найдено в кэше
+    negative_hits: int  # найдено в кэше, что фильма нет
+    misses: int  # в кэше ничего нет
+    evictions: int  # вытеснено из-за ограничения размера
+    expirations: int  # удалено из-за истечения ttl
+    size: int  # записей в кэше сейчас
+
+
+# значение, которое возвращает MovieCache.get, если ключа в кэше нет (None - это закэшированное "не найдено")
+MISSING = object()
+
+
+class MovieCache:
+    """
+    Кэш результатов поиска фильмов, ограниченный по размеру (вытесняются давно не использованные записи)
+    и по времени жизни записей. Кэширует и отрицательные результаты (фильм не найден),
+    но хранит их меньше, т.к. фильм может появиться в реестре при следующем обновлении
+    """
+
+    def __init__(self, max_size: int = MOVIE_CACHE_SIZE, ttl: float = MOVIE_CACHE_TTL,
+                 negative_ttl: float = MOVIE_CACHE_NEGATIVE_TTL):
+        """
+        :param max_size: максимальное количество записей
+        :param ttl: сколько секунд хранится найденный фильм
+        :param negative_ttl: сколько секунд хранится запись о том, что фильм не найден
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # {ключ: (время_истечения, MovieRecord или None)}, от давно использованных к недавно использованным
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._hits = self._negative_hits = self._misses = self._evictions = self._expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        """
+        Достаёт запись из кэша
+
+        :param key: ключ
+        :return: MovieRecord, None - если закэшировано, что фильм не найден, MISSING - если записи нет
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                result = 'miss'
+            else:
+                self._entries.move_to_end(key)
+                if entry[1] is None:
+                    self._negative_hits += 1
+                    result = 'negative_hit'
+                else:
+                    self._hits += 1
+                    result = 'hit'
+        get_metrics().inc('movie_cache', result=result)
+        return MISSING if entry is None else entry[1]
+
+    def put(self, key: Hashable, record: Optional[MovieRecord]):
+        """
+        Кладёт запись в кэш, при необходимости вытесняя давно не использованные
+
+        :param key: ключ
+        :param record: найденный фильм, либо None, если фильм не найден
+        """
+        ttl = self.negative_ttl if record is None else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, record)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self._evictions += evicted
+        if evicted:
+            get_metrics().inc('movie_cache_evictions', evicted)
+
+    def set_poster_path(self, idx: int, poster_path: str):
+        """
+        Прописывает путь до скачанного постера в закэшированные записи фильма,
+        чтобы постер не ставился в очередь на скачивание при каждом попадании в кэш
+
+        :param idx: id фильма
+        :param poster_path: путь до постера
+        """
+        with self._lock:
+            keys = [key for key, (_, record) in self._entries.items() if record is not None and record.id == idx]
+            for key in keys:
+                expires, record = self._entries[key]
+                self._entries[key] = (expires, record._replace(posterPath=poster_path))
+
+    def clear(self):
+        """
+        Очищает кэш и сбрасывает счётчики
+        """
+        with self._lock:
+            self._entries.clear()
+            self._reset_counters()
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._negative_hits, self._misses, self._evictions, self._expirations,
+                              len(self._entries))
@@ -1,6 +1,53 @@
+import datetime as dt
+from typing import Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import Boolean, DateTime, Integer, String, and_, bindparam, cast, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db.models import MovieSession, get_session
+from repos.session_batch import SessionBatch
+from settings import SESSIONS_BATCH_SIZE
+
+# поля уникального ключа сеанса (constraint session_unique)
+SESSION_KEY = ('theater_id', 'movie_id', 'hall', 'datetime')
+# колонки строки сеанса в том порядке, в котором они идут в кортежах строк: ключ сеанса и ссылка
+SESSION_COLUMNS = SESSION_KEY + ('link',)
+# типы колонок для передачи пачки в запрос массивами (по массиву на колонку)
+_COLUMN_ARRAYS = {
+    'theater_id': ARRAY(Integer),
+    'movie_id': ARRAY(Integer),
+    'hall': ARRAY(String),
+    'datetime': ARRAY(DateTime),
+    'link': ARRAY(String),
+}
+
+# строка таблицы сеансов: (id_кинотеатра, id_фильма, зал, время_начала, ссылка)
+SessionRow = Tuple[int, int, Optional[str], dt.datetime, Optional[str]]
+
+
+# расписание кинотеатра на день: (id_кинотеатра, дата)
+SyncScope = Tuple[int, dt.date]
 
-from db.models import Session, MovieSession
+
+class UpsertResult(NamedTuple):
+    """
+    Результат массовой записи сеансов
+    """
+    inserted: int
+    updated: int
+    skipped: int
+
+
+class SyncResult(NamedTuple):
+    """
+    Результат синхронизации сеансов
+    """
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
 
 
 class MovieSessionsRepo:
@@ -17,7 +64,7 @@ class MovieSessionsRepo:
         if not all([isinstance(movie_session, MovieSession) for movie_session in movie_sessions]):
             raise TypeError('В списке должны быть только объекты типа MovieSession')
 
-        with Session() as session:
+        with get_session() as session:
             for movie_session in movie_sessions:
                 # сейвимся вложенной сессией и пытаемся пропихнуть объект в БД.
                 # Если натыкаемся на constraint составного ключа (то есть такой сеанс уже есть в БД),
@@ -30,3 +77,151 @@ class MovieSessionsRepo:
                     if exc.orig.diag.constraint_name != 'session_unique':
                         raise
             session.commit()
+
+    @staticmethod
+    def add_movie_sessions_bulk(movie_sessions: Union[list[MovieSession], SessionBatch],
+                                batch_size: int = SESSIONS_BATCH_SIZE, update: bool = False) -> UpsertResult:
+        """
+        Массовое добавление сеансов в репозиторий пачками INSERT ... ON CONFLICT.
+        Так же, как и add_movie_sessions, пропускает сеансы, которые уже есть в БД
+
+        :param movie_sessions: список сеансов для добавления, либо пачка SessionBatch
+            (тогда строки запроса собираются прямо из её массивов, без объектов MovieSession)
+        :param batch_size: количество сеансов в одном запросе
+        :param update: обновлять ссылку у сеансов, которые уже есть в БД, вместо того, чтобы их пропускать
+        :return: количество добавленных, обновлённых и пропущенных сеансов
+        """
+        return MovieSessionsRepo._upsert_rows(MovieSessionsRepo._to_rows(movie_sessions), batch_size, update)
+
+    @staticmethod
+    def _to_rows(movie_sessions: Union[Iterable[MovieSession], SessionBatch]) -> List[SessionRow]:
+        if isinstance(movie_sessions, SessionBatch):
+            return list(movie_sessions.rows())
+        if not all([isinstance(movie_session, MovieSession) for movie_session in movie_sessions]):
+            raise TypeError('В списке должны быть только объекты типа MovieSession')
+        return [
+            (movie_session.theater_id, movie_session.movie_id, movie_session.hall, movie_session.datetime,
+             movie_session.link)
+            for movie_session in movie_sessions
+        ]
+
+    @staticmethod
+    def sync_movie_sessions(movie_sessions: Union[list[MovieSession], SessionBatch], scopes: Iterable[SyncScope],
+                            batch_size: int = SESSIONS_BATCH_SIZE) -> SyncResult:
+        """
+        Синхронизирует сеансы в БД со свежим расписанием. Существующие сеансы всех переданных расписаний
+        (кинотеатр + дата) загружаются одним запросом, и в БД записывается только разница в одной транзакции:
+        новые сеансы добавляются, у изменившихся обновляется ссылка, а сеансы, которых больше нет в расписании
+        (отменённые или перенесённые), удаляются.
+        Сеансы за пределами scopes только добавляются/обновляются, удаления за пределами scopes не происходит
+
+        :param movie_sessions: свежие сеансы: список MovieSession, либо пачка SessionBatch
+        :param scopes: расписания, которые получены целиком, в формате [(id_кинотеатра, дата), ]
+        :param batch_size: количество сеансов в одном запросе
+        :return: количество добавленных, обновлённых, удалённых и не изменившихся сеансов
+        """
+        fresh = {row[:-1]: row for row in MovieSessionsRepo._to_rows(movie_sessions)}
+        scopes = set(scopes)
+        table = MovieSession.__table__
+
+        with get_session() as session:
+            existing = []
+            if scopes:
+                # диапазон по datetime, а не datetime::date, чтобы работал индекс по datetime
+                condition = or_(*(
+                    and_(table.c.theater_id == theater_id,
+                         table.c.datetime >= dt.datetime.combine(date, dt.time()),
+                         table.c.datetime < dt.datetime.combine(date + dt.timedelta(days=1), dt.time()))
+                    for theater_id, date in scopes
+                ))
+                columns = [table.c.id, table.c.link, *(table.c[field] for field in SESSION_KEY)]
+                existing = session.execute(select(*columns).where(condition)).all()
+
+            to_update, to_delete, unchanged = [], [], 0
+            for row in existing:
+                key = tuple(getattr(row, field) for field in SESSION_KEY)
+                fresh_row = fresh.pop(key, None)
+                if fresh_row is None:
+                    to_delete.append(row.id)
+                elif fresh_row[-1] != row.link:
+                    to_update.append({'_id': row.id, '_link': fresh_row[-1]})
+                else:
+                    unchanged += 1
+
+            # оставшиеся свежие сеансы - новые (или лежат за пределами scopes и могут уже быть в БД)
+            inserted, updated = MovieSessionsRepo._execute_upserts(session, list(fresh.values()), batch_size, True)
+            unchanged += len(fresh) - inserted - updated
+            if to_update:
+                session.execute(
+                    table.update().where(table.c.id == bindparam('_id')).values(link=bindparam('_link')),
+                    to_update
+                )
+            for start in range(0, len(to_delete), batch_size):
+                session.execute(table.delete().where(table.c.id.in_(to_delete[start:start + batch_size])))
+            session.commit()
+
+        return SyncResult(inserted=inserted, updated=updated + len(to_update), deleted=len(to_delete),
+                          unchanged=unchanged)
+
+    @staticmethod
+    def _upsert_rows(rows: List[SessionRow], batch_size: int, update: bool) -> UpsertResult:
+        """
+        Записывает строки таблицы сеансов пачками INSERT ... ON CONFLICT
+
+        :param rows: строки таблицы сеансов в формате [(id_кинотеатра, id_фильма, зал, время_начала, ссылка), ]
+        :param batch_size: количество строк в одном запросе
+        :param update: обновлять ссылку у существующих сеансов вместо того, чтобы их пропускать
+        :return: количество добавленных, обновлённых и пропущенных сеансов
+        """
+        # postgresql не даёт одному INSERT ... ON CONFLICT задеть одну строку дважды,
+        # поэтому дубли внутри пачки убираем заранее
+        total = len(rows)
+        unique_rows = {}
+        for row in rows:
+            key = row[:-1]
+            if update:
+                unique_rows[key] = row
+            else:
+                unique_rows.setdefault(key, row)
+        rows = list(unique_rows.values())
+
+        with get_session() as session:
+            inserted, updated = MovieSessionsRepo._execute_upserts(session, rows, batch_size, update)
+            session.commit()
+
+        return UpsertResult(inserted=inserted, updated=updated, skipped=total - inserted - updated)
+
+    @staticmethod
+    def _execute_upserts(session: Session, rows: List[SessionRow], batch_size: int,
+                         update: bool) -> Tuple[int, int]:
+        """
+        Выполняет INSERT ... ON CONFLICT пачками в текущей транзакции, не коммитя её.
+        Пачка передаётся в запрос не строками, а пятью массивами (по одному на колонку), которые разворачивает unnest.
+        В rows не должно быть дублей по SESSION_KEY
+
+        :return: количество добавленных и обновлённых сеансов
+        """
+        table = MovieSession.__table__
+        # xmax = 0 только у только что вставленных строк, у обновлённых он заполнен
+        is_inserted = literal_column('xmax = 0', type_=Boolean)
+        source = select(literal_column('*')).select_from(func.unnest(*(
+            cast(bindparam(column), _COLUMN_ARRAYS[column]) for column in SESSION_COLUMNS
+        )))
+        inserted = updated = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            stmt = insert(table).from_select(SESSION_COLUMNS, source)
+            if update:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=SESSION_KEY,
+                    set_={'link': stmt.excluded.link},
+                    where=table.c.link.is_distinct_from(stmt.excluded.link)
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=SESSION_KEY)
+            params = {column: list(values) for column, values in zip(SESSION_COLUMNS, zip(*batch))}
+            results = session.execute(stmt.returning(is_inserted), params).scalars().all()
+            batch_inserted = sum(1 for result in results if result)
+            inserted += batch_inserted
+            updated += len(results) - batch_inserted
+        return inserted, updated
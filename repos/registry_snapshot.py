@@ -0,0 +1,364 @@
+"""
+Снимок реестра фильмов для сопоставления названий: id, исходные и нормализованные названия, годы выхода,
+пути до постеров, а также инвертированные индексы по словам и триграммам названий в одном бинарном файле.
+
+Файл открывается через mmap и не разбирается при загрузке: данные читаются прямо из отображённых страниц,
+поэтому снимок открывается почти мгновенно, а несколько процессов на одной машине делят одни и те же страницы
+в page cache. Поиск по снимку не требует соединения с БД.
+
+Формат файла: MAGIC, длина заголовка (uint32), заголовок в json (версия реестра и смещения секций),
+затем секции - массивы int32/int16 в порядке байт машины, которая записала снимок, и строки в utf-8
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+import datetime as dt
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from repos.title_index import normalize_title, year_filter
+from repos.trigram_matcher import parse_year, trigrams
+
+MAGIC = b'FMSNAP\x00\x02'
+_HEADER_LENGTH = struct.Struct('<I')
+
+
+class RegistryVersion(NamedTuple):
+    """
+    Версия реестра: если в fedmovie изменился максимальный id, количество фильмов или ревизия реестра
+    (она растёт при каждом изменении фильмов, см. db.models.RegistryRevision), то снимок устарел
+    """
+    max_id: int
+    count: int
+    revision: int
+
+
+class _StringTable(Sequence[str]):
+    """
+    Список строк в снимке: смещения начала каждой строки и общий буфер в utf-8
+    """
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+
+class _Permuted(Sequence[str]):
+    """
+    Строки таблицы в порядке перестановки order (для двоичного поиска по отсортированным названиям)
+    """
+
+    def __init__(self, table: _StringTable, order: memoryview):
+        self._table = table
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, i: int) -> str:
+        return self._table[self._order[i]]
+
+
+class _Postings:
+    """
+    Инвертированный индекс в снимке: отсортированные ключи и для каждого ключа - срез массива номеров строк.
+    Ключ ищется двоичным поиском, поэтому при открытии снимка индекс не нужно разбирать в словарь
+    """
+
+    def __init__(self, keys: _StringTable, offsets: memoryview, rows):
+        self._keys = keys
+        self._offsets = offsets
+        # memoryview или numpy-массив поверх mmap, срезы которых не копируют данные
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, key: str, default=None):
+        i = bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return default
+        return self._rows[self._offsets[i]:self._offsets[i + 1]]
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: str):
+        rows = self.get(key)
+        if rows is None:
+            raise KeyError(key)
+        return rows
+
+
+class RegistrySnapshot:
+    """
+    Снимок реестра, открытый через mmap. Для поиска по названиям умеет то же, что и TitleIndex
+    (find_exact, find_matches, confidence), а TrigramMatcher.from_snapshot строит поверх него нечёткий поиск.
+    Вместо исходных названий фильмов хранит нормализованные
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: путь до файла снимка
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a registry snapshot')
+        header_start = len(MAGIC) + _HEADER_LENGTH.size
+        header_length, = _HEADER_LENGTH.unpack_from(self._mmap, len(MAGIC))
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was written on a machine with another byte order')
+
+        self.version = RegistryVersion(header['max_id'], header['count'], header['revision'])
+        self.exported_at = dt.datetime.fromisoformat(header['exported_at'])
+        self._sections: Dict[str, Tuple[int, int, str]] = header['sections']
+        buffer = memoryview(self._mmap)
+        self._views = {
+            name: buffer[offset:offset + length].cast(typecode)
+            for name, (offset, length, typecode) in self._sections.items()
+        }
+
+        # строки фильмов отсортированы по id
+        self.ids: memoryview = self._views['ids']
+        # годы выхода числом, 0 - год неизвестен
+        self.years: memoryview = self._views['years']
+        self.titles = _StringTable(self._views['title_offsets'], self._views['title_blob'])
+        # исходные названия и пути до постеров, чтобы найденный фильм не приходилось доставать из БД
+        self.names = _StringTable(self._views['name_offsets'], self._views['name_blob'])
+        self.posters = _StringTable(self._views['poster_offsets'], self._views['poster_blob'])
+        self.year_strings = _StringTable(self._views['year_offsets'], self._views['year_blob'])
+        self._sorted_titles = _Permuted(self.titles, self._views['by_title'])
+        self._words = self._postings('word', self._views['word_rows'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _postings(self, name: str, rows) -> _Postings:
+        keys = _StringTable(self._views[f'{name}_key_offsets'], self._views[f'{name}_key_blob'])
+        return _Postings(keys, self._views[f'{name}_offsets'], rows)
+
+    def trigram_index(self, np=None) -> Tuple[_Postings, Sequence[int]]:
+        """
+        Триграммы названий для TrigramMatcher
+
+        :param np: модуль numpy. Если передан, то номера строк и количество триграмм отдаются numpy-массивами
+            поверх mmap (без копирования), иначе - memoryview
+        :return: индекс {триграмма: [номер_строки, ]} и количество триграмм в каждом названии
+        """
+        if np is None:
+            return self._postings('trigram', self._views['trigram_rows']), self._views['trigram_sizes']
+
+        def numpy_view(name: str):
+            offset, length, _ = self._sections[name]
+            return np.frombuffer(self._mmap, dtype=np.int32, count=length // 4, offset=offset)
+
+        return self._postings('trigram', numpy_view('trigram_rows')), numpy_view('trigram_sizes')
+
+    def _year_string(self, row: int) -> Optional[str]:
+        return self.year_strings[row] or None
+
+    def _row(self, idx: int) -> Optional[int]:
+        row = bisect_left(self.ids, idx)
+        return row if row < len(self.ids) and self.ids[row] == idx else None
+
+    def movie(self, idx: int) -> Optional[Tuple[int, str, Optional[str], str]]:
+        """
+        Возвращает фильм по id
+
+        :param idx: id фильма
+        :return: (id_фильма, название_фильма, год_выхода, путь_до_постера), либо None, если фильма в снимке нет
+        """
+        row = self._row(idx)
+        if row is None:
+            return None
+        return idx, self.names[row], self._year_string(row), self.posters[row]
+
+    def _sorted(self, rows: Iterable[int]) -> List[Tuple[int, str]]:
+        """
+        Сортирует фильмы так же, как TitleIndex: по году выхода по убыванию, пустые годы сначала
+        """
+        rows = sorted(rows, key=lambda row: (self._year_string(row) is None, self._year_string(row) or ''),
+                      reverse=True)
+        return [(self.ids[row], self.titles[row]) for row in rows]
+
+    def find_exact(self, title: str, year: Optional[int] = None) -> Optional[List[Tuple[int, str]]]:
+        """
+        Ищет фильмы, названия которых совпадают с title после нормализации. Результат - как у TitleIndex.find_exact,
+        только с нормализованными названиями
+
+        :param title: Название фильма
+        :param year: Год выхода. Поиск осуществляется в промежутке ± 1 год от переданного
+        :return: список найденных фильмов в формате [(id_фильма, название_фильма), ], либо None
+        """
+        norm_title = normalize_title(title)
+        year_matches = year_filter(year)
+        order = self._views['by_title']
+        rows = []
+        i = bisect_left(self._sorted_titles, norm_title)
+        while i < len(self._sorted_titles) and self._sorted_titles[i] == norm_title:
+            if year_matches(self._year_string(order[i])):
+                rows.append(order[i])
+            i += 1
+        return self._sorted(rows) if rows else None
+
+    def find_matches(self, title: str, year: Optional[int] = None) -> Optional[List[Tuple[int, str]]]:
+        """
+        Ищет наиболее близкие к title названия. Результат - как у TitleIndex.find_matches,
+        только с нормализованными названиями
+
+        :param title: Название фильма
+        :param year: Год выхода. Поиск осуществляется в промежутке ± 1 год от переданного
+        :return: список найденных фильмов в формате [(id_фильма, название_фильма), ], либо None
+        """
+        exact_matches = self.find_exact(title, year)
+        if exact_matches:
+            return exact_matches
+
+        year_matches = year_filter(year)
+        scores = defaultdict(int)
+        for word, count in Counter(normalize_title(title).split()).items():
+            # строка фильма встречается в индексе слова столько раз, сколько раз слово есть в названии
+            for row, repo_count in Counter(self._words.get(word, ())).items():
+                if year_matches(self._year_string(row)):
+                    scores[row] += min(count, repo_count)
+
+        if not scores:
+            return None
+        max_matches = max(scores.values())
+        return self._sorted(row for row, score in scores.items() if score == max_matches)
+
+    def confidence(self, title: str, idx: int) -> float:
+        """
+        Оценивает, насколько уверенно название title соответствует фильму (как TitleIndex.confidence)
+
+        :param title: Название фильма
+        :param idx: id фильма
+        :return: уверенность от 0 до 1
+        """
+        row = self._row(idx)
+        if row is None:
+            return 0.0
+        norm_title, repo_title = normalize_title(title), self.titles[row]
+        if norm_title == repo_title:
+            return 1.0
+        words, repo_words = Counter(norm_title.split()), Counter(repo_title.split())
+        matches = sum((words & repo_words).values())
+        return matches / max(sum(words.values()), sum(repo_words.values()), 1)
+
+    @staticmethod
+    def write(path: str, movies: Iterable[Tuple[int, str, Optional[str]]], version: RegistryVersion,
+              posters: Optional[Dict[int, str]] = None):
+        """
+        Записывает снимок реестра. Файл подменяется атомарно: процессы, которые уже открыли старый снимок,
+        продолжают с ним работать
+
+        :param path: путь до файла снимка
+        :param movies: фильмы в формате [(id_фильма, название_фильма, год_выхода), ]
+        :param version: версия реестра, из которого взяты фильмы
+        :param posters: пути до постеров в формате {id_фильма: путь_до_постера}
+        """
+        movies = sorted(movies)
+        posters = posters or {}
+        norm_titles = [normalize_title(title) for _, title, _ in movies]
+
+        def string_table(strings: Iterable[str]) -> Tuple[array, bytes]:
+            offsets, blob = array('i', [0]), bytearray()
+            for string in strings:
+                blob += string.encode('utf-8')
+                offsets.append(len(blob))
+            return offsets, bytes(blob)
+
+        def postings(index: Dict[str, List[int]]) -> Tuple[array, bytes, array, array]:
+            keys = sorted(index)
+            key_offsets, key_blob = string_table(keys)
+            offsets, rows = array('i', [0]), array('i')
+            for key in keys:
+                rows.extend(index[key])
+                offsets.append(len(rows))
+            return key_offsets, key_blob, offsets, rows
+
+        words: Dict[str, List[int]] = defaultdict(list)
+        title_trigrams: Dict[str, List[int]] = defaultdict(list)
+        trigram_sizes = array('i')
+        for row, norm_title in enumerate(norm_titles):
+            for word in norm_title.split():
+                words[word].append(row)
+            row_trigrams = trigrams(norm_title)
+            trigram_sizes.append(len(row_trigrams))
+            for trigram in row_trigrams:
+                title_trigrams[trigram].append(row)
+
+        title_offsets, title_blob = string_table(norm_titles)
+        name_offsets, name_blob = string_table(title for _, title, _ in movies)
+        poster_offsets, poster_blob = string_table(posters.get(idx) or '' for idx, _, _ in movies)
+        year_offsets, year_blob = string_table(year or '' for _, _, year in movies)
+        sections = {
+            'ids': array('i', (idx for idx, _, _ in movies)),
+            'years': array('h', (parse_year(year) or 0 for _, _, year in movies)),
+            'title_offsets': title_offsets,
+            'title_blob': title_blob,
+            'name_offsets': name_offsets,
+            'name_blob': name_blob,
+            'poster_offsets': poster_offsets,
+            'poster_blob': poster_blob,
+            'year_offsets': year_offsets,
+            'year_blob': year_blob,
+            'by_title': array('i', sorted(range(len(movies)), key=norm_titles.__getitem__)),
+            'trigram_sizes': trigram_sizes,
+        }
+        for name, index in (('word', words), ('trigram', title_trigrams)):
+            key_offsets, key_blob, offsets, rows = postings(index)
+            sections.update({f'{name}_key_offsets': key_offsets, f'{name}_key_blob': key_blob,
+                             f'{name}_offsets': offsets, f'{name}_rows': rows})
+
+        def encode_header(data_start: int) -> Tuple[bytes, Dict[str, Tuple[int, int, str]]]:
+            layout, offset = {}, data_start
+            for name, data in sections.items():
+                length = len(data) * data.itemsize if isinstance(data, array) else len(data)
+                layout[name] = (offset, length, data.typecode if isinstance(data, array) else 'B')
+                # выравниваем секции по 8 байт, чтобы массивы читались без невыровненного доступа
+                offset += -(-length // 8) * 8
+            header = json.dumps({
+                'max_id': version.max_id,
+                'count': version.count,
+                'revision': version.revision,
+                'exported_at': dt.datetime.now().isoformat(),
+                'byteorder': sys.byteorder,
+                'sections': layout,
+            }).encode('utf-8')
+            return header, layout
+
+        # смещения секций зависят от длины заголовка, а длина заголовка - от смещений: считаем до совпадения
+        data_start = 0
+        while True:
+            header, layout = encode_header(data_start)
+            header_end = -(-(len(MAGIC) + _HEADER_LENGTH.size + len(header)) // 8) * 8
+            if header_end == data_start:
+                break
+            data_start = header_end
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'{path.suffix}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + _HEADER_LENGTH.pack(len(header)) + header)
+            for name, data in sections.items():
+                offset, length, _ = layout[name]
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(data.tobytes() if isinstance(data, array) else data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,204 @@
+import datetime as dt
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import ScrapeJob, get_engine, get_session
+from settings import JOB_LEASE, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY
+
+# ключ задачи: (id_кинотеатра, дата)
+JobKey = Tuple[int, dt.date]
+
+
+class ClaimedJob(NamedTuple):
+    """
+    Задача, которую воркер забрал из очереди. Номер попытки увеличивается при каждом захвате задачи,
+    поэтому он же отличает текущий захват от прежних: завершить или продлить задачу можно только по текущему
+    """
+    theater_id: int
+    date: dt.date
+    attempts: int  # номер попытки, включая текущую
+
+    @property
+    def key(self) -> JobKey:
+        return self.theater_id, self.date
+
+
+class ScrapeJobsRepo:
+    """
+    Репозиторий распределённой очереди задач скрапинга.
+    Воркеры на разных машинах забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED, поэтому одну задачу
+    не возьмут двое. Взятая задача арендуется на время lease, и воркер продлевает аренду, пока её выполняет.
+    Если воркер умер, аренда истекает, и задачу забирает другой воркер.
+    Время везде берётся из БД (now()), чтобы не зависеть от расхождения часов на машинах воркеров
+    """
+
+    @staticmethod
+    def create_table():
+        """
+        Создаёт таблицу очереди, если её ещё нет
+        """
+        ScrapeJob.__table__.create(get_engine(), checkfirst=True)
+
+    @staticmethod
+    def enqueue(theater_ids: Iterable[int], dates: Iterable[dt.date]) -> int:
+        """
+        Ставит в очередь задачи на все сочетания кинотеатров и дат. Выполненные и упавшие задачи ставятся заново,
+        а выполняющиеся сейчас не трогаются
+
+        :param theater_ids: id кинотеатров
+        :param dates: даты
+        :return: сколько задач поставлено в очередь
+        """
+        dates = list(dates)
+        rows = [{'theater_id': theater_id, 'date': date} for theater_id in theater_ids for date in dates]
+        if not rows:
+            return 0
+
+        table = ScrapeJob.__table__
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['theater_id', 'date'],
+            set_={'status': 'pending', 'due_at': func.now(), 'attempts': 0, 'last_error': None},
+            where=table.c.status != 'running'
+        )
+        with get_session() as session:
+            count = session.execute(stmt).rowcount
+            session.commit()
+        return count
+
+    @staticmethod
+    def purge(before: dt.date) -> int:
+        """
+        Удаляет задачи на прошедшие даты
+
+        :param before: задачи на даты раньше этой удаляются
+        :return: сколько задач удалено
+        """
+        table = ScrapeJob.__table__
+        with get_session() as session:
+            count = session.execute(table.delete().where(table.c.date < before)).rowcount
+            session.commit()
+        return count
+
+    @staticmethod
+    def claim(worker: str, limit: int = 1, lease: float = JOB_LEASE,
+              max_attempts: int = JOB_MAX_ATTEMPTS) -> List[ClaimedJob]:
+        """
+        Забирает из очереди задачи, которым пора выполняться, и задачи, аренда которых истекла (воркер умер).
+        Задачи, которые прямо сейчас забирает другой воркер, пропускаются (SKIP LOCKED), а не ждут его транзакцию.
+        Задачи с истекшей арендой, у которых кончились попытки, помечаются как failed: иначе задача,
+        которая роняет процесс воркера, повторялась бы бесконечно
+
+        :param worker: имя воркера
+        :param limit: сколько задач забрать
+        :param lease: на сколько секунд задачи закрепляются за воркером
+        :param max_attempts: сколько всего попыток даётся задаче
+        :return: забранные задачи, в первую очередь - самые давно ожидающие
+        """
+        table = ScrapeJob.__table__
+        expired = and_(table.c.status == 'running', table.c.lease_until < func.now())
+        exhausted = table.update()\
+            .where(expired, table.c.attempts >= max_attempts)\
+            .values(status='failed', worker=None, lease_until=None, finished_at=func.now(),
+                    last_error='Lease expired on the last attempt')
+        available = select(table.c.theater_id, table.c.date)\
+            .where(or_(
+                and_(table.c.status == 'pending', table.c.due_at <= func.now()),
+                and_(expired, table.c.attempts < max_attempts),
+            ))\
+            .order_by(table.c.due_at)\
+            .limit(limit)\
+            .with_for_update(skip_locked=True)
+        stmt = table.update()\
+            .where(tuple_(table.c.theater_id, table.c.date).in_(available))\
+            .values(status='running', worker=worker, lease_until=func.now() + dt.timedelta(seconds=lease),
+                    attempts=table.c.attempts + 1)\
+            .returning(table.c.theater_id, table.c.date, table.c.attempts)
+        with get_session() as session:
+            session.execute(exhausted)
+            jobs = [ClaimedJob(*row) for row in session.execute(stmt).all()]
+            session.commit()
+        return jobs
+
+    @staticmethod
+    def heartbeat(worker: str, jobs: Iterable[ClaimedJob], lease: float = JOB_LEASE) -> int:
+        """
+        Продлевает аренду задач, которые выполняет воркер
+
+        :param worker: имя воркера
+        :param jobs: выполняющиеся задачи
+        :param lease: на сколько секунд от текущего момента продлить аренду
+        :return: у скольких задач продлена аренда. Меньше переданного - часть задач уже забрал другой воркер
+            (или другой поток этого воркера)
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return 0
+        table = ScrapeJob.__table__
+        stmt = table.update()\
+            .where(tuple_(table.c.theater_id, table.c.date, table.c.attempts).in_(jobs),
+                   table.c.worker == worker, table.c.status == 'running')\
+            .values(lease_until=func.now() + dt.timedelta(seconds=lease))
+        with get_session() as session:
+            count = session.execute(stmt).rowcount
+            session.commit()
+        return count
+
+    @staticmethod
+    def complete(worker: str, job: ClaimedJob) -> bool:
+        """
+        Отмечает задачу выполненной
+
+        :param worker: имя воркера
+        :param job: задача
+        :return: False, если аренда истекла и задачу уже забрал другой воркер
+        """
+        return ScrapeJobsRepo._finish(worker, job, {'status': 'done', 'last_error': None})
+
+    @staticmethod
+    def fail(worker: str, job: ClaimedJob, error: str, max_attempts: int = JOB_MAX_ATTEMPTS,
+             retry_delay: float = JOB_RETRY_DELAY) -> bool:
+        """
+        Отмечает задачу упавшей. Пока не исчерпаны попытки, задача возвращается в очередь
+        с паузой retry_delay * номер_попытки, иначе помечается как failed
+
+        :param worker: имя воркера
+        :param job: задача
+        :param error: текст ошибки
+        :param max_attempts: сколько всего попыток даётся задаче
+        :param retry_delay: пауза перед повтором после первой попытки, сек
+        :return: False, если аренда истекла и задачу уже забрал другой воркер
+        """
+        table = ScrapeJob.__table__
+        values = {
+            'status': case((table.c.attempts >= max_attempts, 'failed'), else_='pending'),
+            'due_at': func.now() + table.c.attempts * dt.timedelta(seconds=retry_delay),
+            'last_error': error,
+        }
+        return ScrapeJobsRepo._finish(worker, job, values)
+
+    @staticmethod
+    def _finish(worker: str, job: ClaimedJob, values: dict) -> bool:
+        table = ScrapeJob.__table__
+        # по номеру попытки: задачу, которую после истечения аренды забрали заново, завершает только новый захват
+        stmt = table.update()\
+            .where(table.c.theater_id == job.theater_id, table.c.date == job.date, table.c.attempts == job.attempts,
+                   table.c.worker == worker, table.c.status == 'running')\
+            .values(worker=None, lease_until=None, finished_at=func.now(), **values)
+        with get_session() as session:
+            count = session.execute(stmt).rowcount
+            session.commit()
+        return count > 0
+
+    @staticmethod
+    def get_job(key: JobKey) -> Optional[ScrapeJob]:
+        """
+        Поиск задачи
+
+        :param key: задача в формате (id_кинотеатра, дата)
+        :return: задача, либо None
+        """
+        with get_session() as session:
+            return session.get(ScrapeJob, key)
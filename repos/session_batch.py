@@ -0,0 +1,87 @@
+from array import array
+import datetime as dt
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from db.models import MovieSession
+
+# время сеансов хранится в БД без часового пояса, поэтому и секунды считаются от наивной даты
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+class SessionBatch:
+    """
+    Пачка сеансов для записи в БД в колоночном виде: параллельные массивы id кинотеатров, id фильмов, кодов залов,
+    времени начала (секунды от EPOCH) и кодов ссылок. Каждая строка зала и ссылки хранится один раз в словаре,
+    поэтому сеанс занимает несколько чисел в массивах, а не объект MovieSession со своими строками и datetime
+    """
+
+    __slots__ = ('theater_ids', 'movie_ids', 'hall_codes', 'timestamps', 'link_codes', 'halls', 'links',
+                 '_hall_codes', '_link_codes')
+
+    def __init__(self):
+        self.theater_ids = array('i')
+        self.movie_ids = array('i')
+        self.hall_codes = array('i')
+        self.timestamps = array('q')
+        self.link_codes = array('i')
+        # словари строк: код - номер строки в списке
+        self.halls: List[Optional[str]] = []
+        self.links: List[Optional[str]] = []
+        self._hall_codes: Dict[Optional[str], int] = {}
+        self._link_codes: Dict[Optional[str], int] = {}
+
+    def __len__(self):
+        return len(self.theater_ids)
+
+    @staticmethod
+    def _encode(value: Optional[str], values: List[Optional[str]], codes: Dict[Optional[str], int]) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def append(self, theater_id: int, movie_id: int, hall: Optional[str], datetime: dt.datetime,
+               link: Optional[str]):
+        """
+        Добавляет сеанс в пачку
+
+        :param theater_id: id кинотеатра
+        :param movie_id: id фильма
+        :param hall: зал
+        :param datetime: время начала
+        :param link: ссылка на сеанс
+        """
+        self.theater_ids.append(theater_id)
+        self.movie_ids.append(movie_id)
+        self.hall_codes.append(self._encode(hall, self.halls, self._hall_codes))
+        self.timestamps.append(int((datetime - EPOCH).total_seconds()))
+        self.link_codes.append(self._encode(link, self.links, self._link_codes))
+
+    @classmethod
+    def from_sessions(cls, movie_sessions: Iterable[MovieSession]) -> 'SessionBatch':
+        """
+        Собирает пачку из объектов MovieSession
+        """
+        batch = cls()
+        for movie_session in movie_sessions:
+            batch.append(movie_session.theater_id, movie_session.movie_id, movie_session.hall,
+                         movie_session.datetime, movie_session.link)
+        return batch
+
+    def rows(self) -> Iterator[Tuple[int, int, Optional[str], dt.datetime, Optional[str]]]:
+        """
+        Строки таблицы сеансов в формате (id_кинотеатра, id_фильма, зал, время_начала, ссылка) -
+        кортежи, которые zip собирает прямо из колонок, без словаря на каждую строку
+        """
+        # у сеансов одного дня время начала повторяется, поэтому datetime переиспользуются
+        datetimes: Dict[int, dt.datetime] = {}
+
+        def to_datetime(timestamp: int) -> dt.datetime:
+            datetime = datetimes.get(timestamp)
+            if datetime is None:
+                datetime = datetimes[timestamp] = EPOCH + dt.timedelta(seconds=timestamp)
+            return datetime
+
+        return zip(self.theater_ids, self.movie_ids, map(self.halls.__getitem__, self.hall_codes),
+                   map(to_datetime, self.timestamps), map(self.links.__getitem__, self.link_codes))
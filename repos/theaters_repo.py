@@ -1,6 +1,6 @@
 from typing import Optional, List
 
-from db.models import Theater, Session
+from db.models import Theater, get_session
 
 
 class TheatersRepo:
@@ -18,7 +18,7 @@ class TheatersRepo:
         if not all([isinstance(theater, Theater) for theater in theaters]):
             raise TypeError('В списке должны быть только объекты типа Theater')
 
-        with Session() as session:
+        with get_session() as session:
             session.bulk_save_objects(theaters)
             session.commit()
 
@@ -30,7 +30,7 @@ class TheatersRepo:
         :param idx: id кинотеатра
         :return: Найденный кинотеатр, либо None
         """
-        with Session() as session:
+        with get_session() as session:
             movie = session.get(Theater, idx)
         return movie
 
@@ -42,6 +42,6 @@ class TheatersRepo:
         :param city: Город
         :return: Список найденных кинотеатров, либо None
         """
-        with Session() as session:
+        with get_session() as session:
             results = session.query(Theater).filter(Theater.city == city).all()
         return results
@@ -0,0 +1,170 @@
+import re
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def normalize_title(title: str) -> str:
+    """
+    Нормализует название фильма для дальнейшего поиска по репозиторию
+
+    :param title: Название фильма
+
+    :return: Нормализованное название фильма
+    """
+    title = re.sub(r'(\W+)', ' ', title)
+    title = title.translate(str.maketrans({'Ё': 'Е', 'Й': 'И', 'ё': 'е', 'й': 'и', }))
+    title = title.strip()
+    title = title.lower()
+    return title
+
+
+def year_filter(year: Optional[int]) -> Callable[[Optional[str]], bool]:
+    """
+    Возвращает функцию-фильтр годов выхода в промежутке ± 1 год от переданного.
+    Годы в реестре хранятся строками, поэтому и сравниваем их как строки, так же, как это делает БД
+
+    :param year: Год выхода. None - подходит любой год
+    :return: функция, которая по году выхода из реестра говорит, подходит ли фильм
+    """
+    if not year:
+        return lambda repo_year: True
+    year = int(year)
+    low, high = str(year - 1), str(year + 1)
+    return lambda repo_year: repo_year is not None and low <= repo_year <= high
+
+
+class TitleIndex:
+    """
+    Индекс названий фильмов реестра, который строится один раз на процесс.
+    Позволяет искать фильмы по названию без выборки и перебора всей таблицы fedmovie
+    """
+
+    def __init__(self, movies: Iterable[Tuple[int, str, Optional[str]]] = ()):
+        """
+        :param movies: фильмы в формате [(id_фильма, название_фильма, год_выхода), ]
+        """
+        self.titles: Dict[int, str] = {}
+        self.years: Dict[int, Optional[str]] = {}
+        # {'нормализованное название': [id_фильма, ]}
+        self._exact: Dict[str, List[int]] = defaultdict(list)
+        # инвертированный индекс с разбивкой по годам выхода
+        # {'слово': {'год': {id_фильма: количество_вхождений_слова_в_название}}}
+        self._postings: Dict[str, Dict[Optional[str], Dict[int, int]]] = defaultdict(lambda: defaultdict(dict))
+        self.update(movies)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, idx: int, title: str, year: Optional[str]):
+        """
+        Добавляет фильм в индекс. Если фильм с таким id уже есть, то он заменяется
+
+        :param idx: id фильма
+        :param title: название фильма
+        :param year: год выхода (в том виде, в каком он хранится в реестре)
+        """
+        if idx in self.titles:
+            self.remove(idx)
+        norm_title = normalize_title(title)
+        self.titles[idx] = title
+        self.years[idx] = year
+        self._exact[norm_title].append(idx)
+        for word, count in Counter(norm_title.split()).items():
+            self._postings[word][year][idx] = count
+
+    def remove(self, idx: int):
+        """
+        Удаляет фильм из индекса
+
+        :param idx: id фильма
+        """
+        title = self.titles.pop(idx, None)
+        if title is None:
+            return
+        year = self.years.pop(idx)
+        norm_title = normalize_title(title)
+        self._exact[norm_title].remove(idx)
+        if not self._exact[norm_title]:
+            del self._exact[norm_title]
+        for word in set(norm_title.split()):
+            buckets = self._postings[word]
+            del buckets[year][idx]
+            if not buckets[year]:
+                del buckets[year]
+            if not buckets:
+                del self._postings[word]
+
+    def update(self, movies: Iterable[Tuple[int, str, Optional[str]]]):
+        """
+        Добавляет или заменяет фильмы в индексе
+
+        :param movies: фильмы в формате [(id_фильма, название_фильма, год_выхода), ]
+        """
+        for idx, title, year in movies:
+            self.add(idx, title, year)
+
+    def _sorted(self, ids: Iterable[int]) -> List[Tuple[int, str]]:
+        """
+        Сортирует фильмы по году выхода (по убыванию, пустые годы сначала - как ORDER BY ... DESC в postgresql)
+        """
+        ids = sorted(ids, key=lambda idx: (self.years[idx] is None, self.years[idx] or ''), reverse=True)
+        return [(idx, self.titles[idx]) for idx in ids]
+
+    def find_exact(self, title: str, year: Optional[int] = None) -> Optional[List[Tuple[int, str]]]:
+        """
+        Ищет в индексе фильмы, названия которых совпадают с title после нормализации
+
+        :param title: Название фильма
+        :param year: Год выхода. Поиск осуществляется в промежутке ± 1 год от переданного
+        :return: список найденных фильмов в формате [(id_фильма, название_фильма), ], либо None
+        """
+        year_matches = year_filter(year)
+        exact_ids = [idx for idx in self._exact.get(normalize_title(title), ()) if year_matches(self.years[idx])]
+        return self._sorted(exact_ids) if exact_ids else None
+
+    def find_matches(self, title: str, year: Optional[int] = None) -> Optional[List[Tuple[int, str]]]:
+        """
+        Ищет в индексе наиболее близкие к title названия.
+        Результат совпадает с FedMoviesRepo._find_title_matches по выборке из БД, но без перебора всех фильмов
+
+        :param title: Название фильма
+        :param year: Год выхода. Поиск осуществляется в промежутке ± 1 год от переданного
+        :return: список найденных фильмов в формате [(id_фильма, название_фильма), ], либо None
+        """
+        exact_matches = self.find_exact(title, year)
+        if exact_matches:
+            return exact_matches
+
+        norm_title = normalize_title(title)
+        year_matches = year_filter(year)
+        # считаем количество совпадающих слов только у тех фильмов, в названии которых есть хотя бы одно слово
+        scores = defaultdict(int)
+        for word, count in Counter(norm_title.split()).items():
+            for repo_year, postings in self._postings.get(word, {}).items():
+                if not year_matches(repo_year):
+                    continue
+                for idx, repo_count in postings.items():
+                    scores[idx] += min(count, repo_count)
+
+        if not scores:  # если совпадений не нашлось, то возвращаем None
+            return None
+        # возвращаем фильмы с наибольшим количеством совпадений
+        max_matches = max(scores.values())
+        return self._sorted(idx for idx, score in scores.items() if score == max_matches)
+
+    def confidence(self, title: str, idx: int) -> float:
+        """
+        Оценивает, насколько уверенно название title соответствует фильму из индекса:
+        доля совпадающих слов от большего из названий, 1 - названия совпадают после нормализации
+
+        :param title: Название фильма
+        :param idx: id фильма
+        :return: уверенность от 0 до 1
+        """
+        norm_title = normalize_title(title)
+        repo_title = normalize_title(self.titles[idx])
+        if norm_title == repo_title:
+            return 1.0
+        words, repo_words = Counter(norm_title.split()), Counter(repo_title.split())
+        matches = sum((words & repo_words).values())
+        return matches / max(sum(words.values()), sum(repo_words.values()), 1)
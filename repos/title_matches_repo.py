@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import Fedmovie, TitleMatch, get_session
+from repos.title_index import TitleIndex
+from repos.trigram_matcher import TrigramMatcher
+from settings import MATCH_THRESHOLD, TITLE_MATCHER
+
+# ключ сопоставления: (скрапер, название с сайта, год выхода)
+MatchKey = Tuple[str, str, Optional[int]]
+
+# сколько id или ключей перечисляется в одном запросе на удаление сопоставлений
+DELETE_BATCH_SIZE = 1000
+
+
+class TitleMatchesRepo:
+    """
+    Репозиторий сохранённых сопоставлений названий с сайтов кинотеатров и фильмов из реестра
+    """
+
+    @staticmethod
+    def get_matches(keys: Iterable[MatchKey]) -> Dict[MatchKey, Fedmovie]:
+        """
+        Ищет сохранённые сопоставления одним запросом
+
+        :param keys: ключи в формате [(скрапер, название, год), ]
+        :return: найденные фильмы в формате {(скрапер, название, год): Fedmovie}
+        """
+        # год в таблице - часть первичного ключа, поэтому вместо NULL там 0
+        keys = {(source, title, year or 0): (source, title, year) for source, title, year in keys}
+        if not keys:
+            return {}
+
+        with get_session() as session:
+            results = session.query(TitleMatch.source, TitleMatch.title, TitleMatch.year, Fedmovie)\
+                .join(Fedmovie, TitleMatch.movie_id == Fedmovie.id)\
+                .filter(tuple_(TitleMatch.source, TitleMatch.title, TitleMatch.year).in_(keys.keys()))\
+                .all()
+        return {keys[(source, title, year)]: movie for source, title, year, movie in results}
+
+    @staticmethod
+    def save_matches(matches: Iterable[Tuple[MatchKey, int, float]]):
+        """
+        Сохраняет сопоставления. Уже существующие сопоставления перезаписываются
+
+        :param matches: сопоставления в формате [((скрапер, название, год), id_фильма, уверенность), ]
+        """
+        rows = {
+            (source, title, year or 0): {
+                'source': source, 'title': title, 'year': year or 0, 'movie_id': movie_id, 'confidence': confidence
+            }
+            for (source, title, year), movie_id, confidence in matches
+        }
+        if not rows:
+            return
+
+        stmt = insert(TitleMatch.__table__).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['source', 'title', 'year'],
+            set_={
+                'movie_id': stmt.excluded.movie_id,
+                'confidence': stmt.excluded.confidence,
+                'matched_at': stmt.excluded.matched_at,
+            }
+        )
+        with get_session() as session:
+            session.execute(stmt)
+            session.commit()
+
+    @staticmethod
+    def invalidate(movies: Iterable[Tuple[int, str, Optional[str]]]):
+        """
+        Сбрасывает сопоставления, на которые могли повлиять изменения в реестре: сопоставления с изменёнными
+        фильмами и те неточные сопоставления, для названий которых изменённый фильм стал бы кандидатом
+        при новом поиске (см. настройку TITLE_MATCHER) и мог бы подойти лучше. Остальные неточные сопоставления
+        новые фильмы изменить не могут, поэтому они сохраняются.
+        Перебирает все неточные сопоставления, поэтому вызывается один раз на обновление реестра, а не на пачку
+
+        :param movies: добавленные или изменённые фильмы в формате [(id_фильма, название_фильма, год_выхода), ]
+        """
+        movies = list(movies)
+        if not movies:
+            return
+        # поиск только среди изменённых фильмов: находит ли он для названия хоть что-то
+        if TITLE_MATCHER == 'words':
+            title_index = TitleIndex(movies)
+
+            def affected(title: str, year: Optional[int]) -> bool:
+                return title_index.find_matches(title, year) is not None
+        else:
+            matcher = TrigramMatcher(movies)
+
+            def affected(title: str, year: Optional[int]) -> bool:
+                return bool(matcher.search(title, year, limit=1, threshold=MATCH_THRESHOLD))
+
+        with get_session() as session:
+            fuzzy = session.query(TitleMatch.source, TitleMatch.title, TitleMatch.year)\
+                .filter(TitleMatch.confidence < 1)\
+                .all()
+            keys = [tuple(key) for key in fuzzy if affected(key.title, key.year or None)]
+            ids = sorted({idx for idx, _, _ in movies})
+            conditions = [TitleMatch.movie_id.in_(ids[i:i + DELETE_BATCH_SIZE])
+                          for i in range(0, len(ids), DELETE_BATCH_SIZE)]
+            key_columns = tuple_(TitleMatch.source, TitleMatch.title, TitleMatch.year)
+            conditions += [key_columns.in_(keys[i:i + DELETE_BATCH_SIZE])
+                           for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+            for condition in conditions:
+                session.query(TitleMatch).filter(condition).delete(synchronize_session=False)
+            session.commit()
@@ -0,0 +1,222 @@
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from db.models import get_session
+from repos.title_index import normalize_title
+from settings import MATCH_THRESHOLD
+
+if TYPE_CHECKING:
+    from repos.registry_snapshot import RegistrySnapshot
+
+# numpy импортируется при первом построении триграмм (см. _numpy), а не при импорте модуля
+np = None
+_numpy_checked = False
+
+# насколько снижается оценка кандидата за каждый год разницы с искомым годом выхода (не больше MAX_YEAR_DISTANCE)
+YEAR_PENALTY = 0.05
+MAX_YEAR_DISTANCE = 5
+# если год выхода неизвестен у фильма из реестра, то считаем, что он отличается на столько лет
+UNKNOWN_YEAR_DISTANCE = 2
+
+
+def _numpy():
+    """
+    Импортирует numpy, если он установлен. Без numpy сопоставление работает на чистом python, только медленнее
+    """
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return np
+
+
+def trigrams(norm_title: str) -> Set[str]:
+    """
+    Разбивает нормализованное название на триграммы так же, как это делает pg_trgm:
+    каждое слово дополняется двумя пробелами в начале и одним в конце
+
+    :param norm_title: нормализованное название фильма
+    :return: множество триграмм
+    """
+    result = set()
+    for word in norm_title.split():
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def parse_year(year: Optional[str]) -> Optional[int]:
+    """
+    Год выхода из реестра (строка) в число
+    """
+    if year and year[:4].isdigit():
+        return int(year[:4])
+    return None
+
+
+def rank(candidates: Iterable[Tuple[int, float, Optional[int]]], year: Optional[int],
+         threshold: float, limit: int) -> List[Tuple[int, float]]:
+    """
+    Отбрасывает кандидатов с похожестью ниже порога и сортирует остальных по похожести с учётом близости года выхода
+
+    :param candidates: кандидаты в формате [(id_фильма, похожесть, год_выхода), ]
+    :param year: искомый год выхода
+    :param threshold: минимальная похожесть
+    :param limit: сколько кандидатов вернуть
+    :return: кандидаты в формате [(id_фильма, похожесть), ]
+    """
+    def score(candidate: Tuple[int, float, Optional[int]]) -> float:
+        _, similarity, repo_year = candidate
+        if not year:
+            return similarity
+        distance = UNKNOWN_YEAR_DISTANCE if repo_year is None else min(abs(int(year) - repo_year), MAX_YEAR_DISTANCE)
+        return similarity * (1 - YEAR_PENALTY * distance)
+
+    candidates = sorted((c for c in candidates if c[1] >= threshold), key=score, reverse=True)
+    return [(idx, similarity) for idx, similarity, _ in candidates[:limit]]
+
+
+class TrigramMatcher:
+    """
+    Нечёткий поиск фильмов по похожести названий (коэффициент Жаккара по триграммам, как similarity() в pg_trgm).
+    Триграммы всех названий реестра считаются один раз, а при поиске оцениваются только фильмы,
+    у которых есть хотя бы одна общая триграмма с искомым названием. Если установлен numpy, оценка идёт векторно
+    """
+
+    def __init__(self, movies: Iterable[Tuple[int, str, Optional[str]]]):
+        """
+        :param movies: фильмы в формате [(id_фильма, название_фильма, год_выхода), ]
+        """
+        self.ids: List[int] = []
+        self.years: List[Optional[int]] = []
+        sizes = []
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for row, (idx, title, year) in enumerate(movies):
+            title_trigrams = trigrams(normalize_title(title))
+            self.ids.append(idx)
+            self.years.append(parse_year(year))
+            sizes.append(len(title_trigrams))
+            for trigram in title_trigrams:
+                postings[trigram].append(row)
+
+        # {триграмма: [номер_строки, ]}
+        self._postings = dict(postings)
+        self._sizes = sizes
+        self._vectorized = _numpy() is not None
+        if self._vectorized:
+            self._postings = {trigram: np.array(rows, dtype=np.int32) for trigram, rows in postings.items()}
+            self._sizes = np.array(sizes, dtype=np.int32)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: 'RegistrySnapshot') -> 'TrigramMatcher':
+        """
+        Поиск поверх снимка реестра (см. repos.registry_snapshot): триграммы не считаются заново,
+        а индекс читается прямо из отображённого в память файла
+
+        :param snapshot: открытый снимок реестра
+        """
+        matcher = cls.__new__(cls)
+        matcher.ids = snapshot.ids
+        # в снимке неизвестный год хранится как 0, в rank он превращается в None
+        matcher.years = snapshot.years
+        matcher._vectorized = _numpy() is not None
+        matcher._postings, matcher._sizes = snapshot.trigram_index(np)
+        return matcher
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _similarities(self, query: Set[str], threshold: float) -> List[Tuple[int, float]]:
+        """
+        Считает похожесть искомого названия на все названия, с которыми у него есть общие триграммы
+
+        :param query: триграммы искомого названия
+        :param threshold: минимальная похожесть. Менее похожие названия отбрасываются сразу
+        :return: [(номер_строки, похожесть), ]
+        """
+        postings = [rows for rows in map(self._postings.get, query) if rows is not None]
+        if not postings:
+            return []
+
+        if self._vectorized:
+            rows, common = np.unique(np.concatenate(postings), return_counts=True)
+            similarities = common / (len(query) + self._sizes[rows] - common)
+            mask = similarities >= threshold
+            return list(zip(rows[mask].tolist(), similarities[mask].tolist()))
+
+        similarities = []
+        for row, count in Counter(row for rows in postings for row in rows).items():
+            similarity = count / (len(query) + self._sizes[row] - count)
+            if similarity >= threshold:
+                similarities.append((row, similarity))
+        return similarities
+
+    def search(self, title: str, year: Optional[int] = None, limit: int = 10,
+               threshold: float = MATCH_THRESHOLD) -> List[Tuple[int, float]]:
+        """
+        Ищет фильмы с похожими названиями
+
+        :param title: Название фильма
+        :param year: Год выхода. Фильмы с близким годом выхода ранжируются выше
+        :param limit: сколько кандидатов вернуть
+        :param threshold: минимальная похожесть названий (от 0 до 1)
+        :return: кандидаты в формате [(id_фильма, похожесть), ], лучшие первыми
+        """
+        query = trigrams(normalize_title(title))
+        candidates = ((self.ids[row], similarity, self.years[row] or None)
+                      for row, similarity in self._similarities(query, threshold))
+        return rank(candidates, year, threshold, limit)
+
+
+class PgTrigramMatcher:
+    """
+    Нечёткий поиск фильмов по похожести названий средствами расширения pg_trgm.
+    Не требует загрузки реестра в память, но нужен GIN-индекс (см. create_index)
+    """
+
+    # то же, что normalize_title, только на стороне БД (pg_trgm сам игнорирует знаки препинания)
+    NORMALIZED_TITLE = "translate(lower(filmname), 'ёй', 'еи')"
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+        Проверяет, установлено ли расширение pg_trgm
+        """
+        with get_session() as session:
+            return session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+    @classmethod
+    def create_index(cls):
+        """
+        Создаёт GIN-индекс по триграммам названий фильмов
+        """
+        with get_session() as session:
+            session.execute(text(
+                f'CREATE INDEX IF NOT EXISTS fedmovie_filmname_trgm_idx '
+                f'ON fedmovie USING gin (({cls.NORMALIZED_TITLE}) gin_trgm_ops)'
+            ))
+            session.commit()
+
+    @classmethod
+    def search(cls, title: str, year: Optional[int] = None, limit: int = 10,
+               threshold: float = MATCH_THRESHOLD) -> List[Tuple[int, float]]:
+        """
+        Ищет фильмы с похожими названиями. Параметры и результат - как у TrigramMatcher.search
+        """
+        with get_session() as session:
+            # оператор % использует порог из настройки pg_trgm.similarity_threshold
+            session.execute(text('SELECT set_config(\'pg_trgm.similarity_threshold\', :threshold, true)'),
+                            {'threshold': str(threshold)})
+            # с запасом, чтобы после учёта года выхода осталось limit лучших
+            results = session.execute(text(
+                f'SELECT id, similarity({cls.NORMALIZED_TITLE}, :title) AS sim, "crYearOfProduction" '
+                f'FROM fedmovie WHERE {cls.NORMALIZED_TITLE} % :title '
+                f'ORDER BY sim DESC LIMIT :limit'
+            ), {'title': normalize_title(title), 'limit': limit * 5}).all()
+        return rank(((idx, sim, parse_year(repo_year)) for idx, sim, repo_year in results), year, threshold, limit)
@@ -0,0 +1,259 @@
+"""
+Планировщик для режима демона: вместо запуска по cron процесс живёт постоянно и держит тёплыми пулы соединений с БД,
+кэши сопоставления фильмов и браузеры.
+
+Расписание каждого кинотеатра на каждую дату обновляется отдельной задачей. Задачи лежат в очереди с приоритетом
+по времени следующего запуска. Ближайшие даты обновляются чаще дальних, а интервал обновления кинотеатра
+подстраивается под то, как часто у него на самом деле меняется расписание. Скраперы одного сайта запускаются
+не чаще, чем раз в SCRAPER_DELAYS секунд, а скраперы разных сайтов работают параллельно
+"""
+
+import datetime as dt
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from db.models import Theater
+from engine import ScrapingEngine
+from metrics import get_metrics
+from scrapers.exceptions import BaseScraperException
+from settings import SCHEDULER_DAYS, SCHEDULER_INTERVAL, SCHEDULER_MIN_INTERVAL, SCHEDULER_MAX_INTERVAL, \
+    SCHEDULER_DAY_FACTOR, SCHEDULER_FLUSH_INTERVAL, SCRAPER_DELAYS, SCRAPER_DEFAULT_DELAY, SCRAPING_WORKERS, \
+    METRICS_FILE
+
+logger = logging.getLogger(__name__)
+
+# во сколько раз меняется интервал обновления кинотеатра, если расписание изменилось / не изменилось
+INTERVAL_DECREASE = 0.5
+INTERVAL_INCREASE = 1.5
+
+
+class Job(NamedTuple):
+    """
+    Задача обновления расписания кинотеатра на дату
+    """
+    due: float  # когда задачу пора запускать, по time.monotonic()
+    seq: int  # порядковый номер, чтобы задачи с одинаковым due запускались в порядке постановки
+    theater_id: int
+    date: dt.date
+
+
+class RateLimiter:
+    """
+    Ограничивает частоту запусков скраперов одного сайта.
+    Не потокобезопасен: вызывается только из потока планировщика
+    """
+
+    def __init__(self, delays: Optional[Dict[str, float]] = None, default_delay: float = SCRAPER_DEFAULT_DELAY):
+        """
+        :param delays: минимальная пауза между запусками в секундах в формате {скрапер: пауза}
+        :param default_delay: пауза для скраперов, которых нет в delays
+        """
+        self.delays = SCRAPER_DELAYS if delays is None else delays
+        self.default_delay = default_delay
+        # {скрапер: time.monotonic(), раньше которого скрапер запускать нельзя}
+        self._next_start: Dict[str, float] = {}
+
+    def acquire(self, scraper: str, now: float) -> float:
+        """
+        Пытается занять запуск скрапера
+
+        :param scraper: скрапер
+        :param now: текущее время по time.monotonic()
+        :return: 0, если скрапер можно запускать сейчас, иначе время (по time.monotonic()), когда будет можно
+        """
+        next_start = self._next_start.get(scraper, 0)
+        if next_start > now:
+            return next_start
+        self._next_start[scraper] = now + self.delays.get(scraper, self.default_delay)
+        return 0
+
+
+class Scheduler:
+    """
+    Планировщик обновления расписаний кинотеатров
+    """
+
+    def __init__(self, engine: ScrapingEngine, theaters: Optional[List[Theater]] = None,
+                 days: int = SCHEDULER_DAYS, workers: int = SCRAPING_WORKERS,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 interval: float = SCHEDULER_INTERVAL, min_interval: float = SCHEDULER_MIN_INTERVAL,
+                 max_interval: float = SCHEDULER_MAX_INTERVAL, day_factor: float = SCHEDULER_DAY_FACTOR,
+                 flush_interval: float = SCHEDULER_FLUSH_INTERVAL):
+        """
+        :param engine: движок, через который скрапятся и сохраняются сеансы
+        :param theaters: кинотеатры. По умолчанию - кинотеатры движка
+        :param days: на сколько дней вперёд, начиная с сегодняшнего, обновляется расписание
+        :param workers: сколько задач может выполняться одновременно
+        :param rate_limiter: ограничение частоты запусков скраперов одного сайта
+        :param interval: начальный интервал обновления расписания кинотеатра на сегодня, сек
+        :param min_interval: минимальный интервал обновления, сек
+        :param max_interval: максимальный интервал обновления, сек
+        :param day_factor: во сколько раз реже обновляется каждый следующий день
+        :param flush_interval: как часто сохраняются метрики и дожидаются скачивания постеров, сек
+        """
+        self.engine = engine
+        self.theaters: Dict[int, Theater] = {theater.id: theater for theater in (theaters or engine.theaters)}
+        self.days = days
+        self.workers = max(workers, 1)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.day_factor = day_factor
+        self.flush_interval = flush_interval
+        # текущий интервал обновления расписания кинотеатра на сегодня: {id_кинотеатра: сек}
+        self.intervals: Dict[int, float] = {theater_id: interval for theater_id in self.theaters}
+
+        self._lock = threading.Lock()
+        self._heap: List[Job] = []
+        self._seq = itertools.count()
+        # задачи, которые лежат в очереди или выполняются: {(id_кинотеатра, дата)}
+        self._planned: Set[Tuple[int, dt.date]] = set()
+        self._planned_for: Optional[dt.date] = None
+        self._slots = threading.Semaphore(self.workers)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def _plan(self, today: dt.date):
+        """
+        Ставит в очередь задачи на новые даты (при первом запуске и после смены дня)
+        """
+        if self._planned_for == today:
+            return
+        self._planned_for = today
+        now = time.monotonic()
+        with self._lock:
+            for date in (today + dt.timedelta(days=i) for i in range(self.days)):
+                for theater_id in self.theaters:
+                    if (theater_id, date) not in self._planned:
+                        self._planned.add((theater_id, date))
+                        heapq.heappush(self._heap, Job(now, next(self._seq), theater_id, date))
+
+    def _dispatch(self, executor: ThreadPoolExecutor) -> float:
+        """
+        Запускает все задачи, которым пора выполняться, если для них есть свободные потоки
+        и это позволяет ограничение частоты запросов к сайту
+
+        :return: сколько секунд можно спать до следующей задачи
+        """
+        today = dt.date.today()
+        while True:
+            with self._lock:
+                if not self._heap:
+                    return self.flush_interval
+                job = self._heap[0]
+                now = time.monotonic()
+                if job.due > now:
+                    return job.due - now
+                if job.date < today:
+                    # день прошёл, расписание на него больше не обновляем
+                    heapq.heappop(self._heap)
+                    self._planned.discard((job.theater_id, job.date))
+                    continue
+                if not self._slots.acquire(blocking=False):
+                    # все потоки заняты, планировщик разбудит освободившийся поток
+                    return self.flush_interval
+                theater = self.theaters[job.theater_id]
+                ready_at = self.rate_limiter.acquire(theater.scraper, now)
+                if ready_at:
+                    self._slots.release()
+                    heapq.heapreplace(self._heap, job._replace(due=ready_at, seq=next(self._seq)))
+                    continue
+                heapq.heappop(self._heap)
+            get_metrics().observe('scheduler_lag', now - job.due)
+            executor.submit(self._execute, job, theater)
+
+    def _adapt(self, theater_id: int, changed: Optional[bool]) -> float:
+        """
+        Подстраивает интервал обновления кинотеатра: если расписание изменилось, то обновляем чаще, иначе - реже
+
+        :param theater_id: id кинотеатра
+        :param changed: изменилось ли расписание. None - неизвестно (скрапинг упал), интервал не меняется
+        :return: новый интервал, сек
+        """
+        interval = self.intervals[theater_id]
+        if changed is not None:
+            interval *= INTERVAL_DECREASE if changed else INTERVAL_INCREASE
+            interval = min(max(interval, self.min_interval), self.max_interval)
+            self.intervals[theater_id] = interval
+        return interval
+
+    def _execute(self, job: Job, theater: Theater):
+        """
+        Выполняет задачу и ставит в очередь следующее обновление расписания кинотеатра на ту же дату
+        """
+        metrics = get_metrics()
+        labels = {'theater': theater.name, 'scraper': theater.scraper}
+        changed = error = None
+        try:
+            with metrics.timer('scheduler_job', **labels):
+                result = self.engine.run_theater(theater, [job.date])
+            changed = bool(result.inserted or result.updated or getattr(result, 'deleted', 0))
+            metrics.inc('scheduler_jobs', result='changed' if changed else 'unchanged', **labels)
+        except (Exception, BaseScraperException) as exc:
+            # в том числе TimeoutError: задача, не уложившаяся в таймаут кинотеатра, тоже планируется заново
+            metrics.inc('scheduler_jobs', result='timeout' if isinstance(exc, TimeoutError) else 'failed', **labels)
+            error = exc
+        finally:
+            with self._lock:
+                interval = self._adapt(theater.id, changed)
+                days_ahead = max((job.date - dt.date.today()).days, 0)
+                delay = interval * (1 + days_ahead * self.day_factor)
+                heapq.heappush(self._heap, Job(time.monotonic() + delay, next(self._seq), theater.id, job.date))
+            self._slots.release()
+            self._wakeup.set()
+        if error is not None:
+            # интервал после ошибки не меняется (см. _adapt), пишем, когда будет следующая попытка
+            logger.error('Updating theater %s on %s failed: %r', theater.name, job.date, error,
+                         extra={**labels, 'interval': round(interval), 'next_in': round(delay)})
+            return
+        logger.info('Theater %s on %s updated', theater.name, job.date,
+                    extra={**labels, 'changed': changed, 'interval': round(interval), 'next_in': round(delay)})
+
+    def _flush(self):
+        """
+        Дожидается скачивания поставленных в очередь постеров, сохраняет метрики
+        и подхватывает новый снимок реестра, если его пересохранили
+        """
+        self.engine.posters.wait()
+        self.engine.fed_movies_repo.refresh_snapshot()
+        if METRICS_FILE:
+            get_metrics().export(METRICS_FILE)
+
+    def run_forever(self):
+        """
+        Выполняет задачи, пока не будет вызван stop(). Выполняющиеся задачи при остановке дожидаются завершения
+        """
+        logger.info('Scheduler started', extra={'theaters': len(self.theaters), 'days': self.days,
+                                                'workers': self.workers})
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scheduler')
+        last_flush = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                self._plan(dt.date.today())
+                timeout = self._dispatch(executor)
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush()
+                    last_flush = time.monotonic()
+                self._wakeup.wait(min(timeout, self.flush_interval))
+                self._wakeup.clear()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._flush()
+            # пул браузеров есть, только если кинотеатрам понадобились скраперы на selenium
+            browser_pool = sys.modules.get('scrapers.browser_pool')
+            if browser_pool is not None:
+                browser_pool.get_browser_pool().close()
+            logger.info('Scheduler stopped')
+
+    def stop(self):
+        """
+        Останавливает планировщик. Можно вызывать из обработчика сигнала или другого потока
+        """
+        self._stopped.set()
+        self._wakeup.set()
@@ -1,23 +1,90 @@
-from typing import TYPE_CHECKING
+"""
+Реестр скраперов. Модуль скрапера импортируется только тогда, когда он понадобился кинотеатру,
+поэтому импорт пакета не тянет за собой selenium, undetected_chromedriver и bs4.
 
-from scrapers.cinema_star_scraper import CinemaStarScraper
-from scrapers.kinobel_scraper import KinobelScraper
+Новый скрапер можно зарегистрировать тремя способами:
+    - добавить строку 'модуль:класс' в SCRAPERS;
+    - вызвать register_scraper('название', 'модуль:класс') или повесить @register_scraper('название') на класс;
+    - объявить entry point в группе ENTRY_POINT_GROUP в пакете со скрапером, например в pyproject.toml:
+          [project.entry-points."cinema_aggregator.scrapers"]
+          my_cinema = "my_package.my_scraper:MyCinemaScraper"
+"""
+
+import importlib
+from importlib.metadata import entry_points
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Type, Union
 
 if TYPE_CHECKING:
     from db.models import Theater
-from scrapers.rusich_scraper import RusichScraper
-from scrapers.sputnik_cinema_scraper import SputnikScraper
-
-SCRAPERS = {
-    'rusich31': RusichScraper,
-    'sputnik_cinema31': SputnikScraper,
-    'cinema_star': CinemaStarScraper,
-    'kinobel': KinobelScraper
+    from scrapers.abstract_scraper import AbstractScraper
+
+ENTRY_POINT_GROUP = 'cinema_aggregator.scrapers'
+
+# {'название скрапера': 'модуль:класс' или сам класс}
+SCRAPERS: Dict[str, Union[str, Type['AbstractScraper']]] = {
+    'rusich31': 'scrapers.rusich_scraper:RusichScraper',
+    'sputnik_cinema31': 'scrapers.sputnik_cinema_scraper:SputnikScraper',
+    'cinema_star': 'scrapers.cinema_star_scraper:CinemaStarScraper',
+    'kinobel': 'scrapers.kinobel_scraper:KinobelScraper',
 }
 
+_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+def register_scraper(name: str, scraper: Union[str, Type['AbstractScraper'], None] = None):
+    """
+    Регистрирует скрапер. Можно использовать как декоратор класса: @register_scraper('my_cinema')
+
+    :param name: название скрапера (theater.scraper)
+    :param scraper: класс скрапера или строка 'модуль:класс' для отложенного импорта
+    """
+    if scraper is None:
+        def decorator(cls: Type['AbstractScraper']) -> Type['AbstractScraper']:
+            register_scraper(name, cls)
+            return cls
+        return decorator
+
+    with _lock:
+        SCRAPERS[name] = scraper
+
+
+def _load_entry_points():
+    """
+    Добавляет в реестр скраперы из установленных пакетов. Скраперы из SCRAPERS имеют приоритет
+    """
+    global _entry_points_loaded
+    with _lock:
+        if _entry_points_loaded:
+            return
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            SCRAPERS.setdefault(entry_point.name, entry_point.value)
+        _entry_points_loaded = True
+
+
+def get_scraper_class(name: str) -> Optional[Type['AbstractScraper']]:
+    """
+    Возвращает класс скрапера, при первом обращении импортируя его модуль
+
+    :param name: название скрапера (theater.scraper)
+    :return: класс скрапера, либо None, если такого скрапера нет
+    """
+    if name not in SCRAPERS:
+        _load_entry_points()
+    scraper = SCRAPERS.get(name)
+    if scraper is None or not isinstance(scraper, str):
+        return scraper
+
+    module_name, _, class_name = scraper.partition(':')
+    scraper = getattr(importlib.import_module(module_name), class_name)
+    with _lock:
+        SCRAPERS[name] = scraper
+    return scraper
+
 
 def scraper_factory(theater: 'Theater'):
-    scraper = SCRAPERS.get(theater.scraper)
+    scraper = get_scraper_class(theater.scraper)
     if not scraper:
         return None
     return scraper(theater.scraper_config)
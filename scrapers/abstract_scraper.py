@@ -1,8 +1,15 @@
-from abc import ABC, abstractmethod
+from abc import ABC
 import datetime as dt
-from typing import List
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional
 
+from bs4 import SoupStrainer
+
+from metrics import get_metrics
+from scrapers.exceptions import ScraperCancelled
 from scrapers.models import ScrapedSession
+from scrapers.parsing import HTML_PARSER, HtmlDocument, parse_html
 
 
 class AbstractScraper(ABC):
@@ -11,12 +18,72 @@ class AbstractScraper(ABC):
     """
 
     NAME = ''
+    # скрапер запускает браузер (selenium). Такие скраперы тяжелее, и одновременно их запускается меньше
+    USES_BROWSER = False
+    # скрапер за одну загрузку страницы получает сеансы сразу на несколько дат
+    MULTI_DATE = False
+    # парсер страниц и фильтр, оставляющий в дереве только нужную часть страницы (см. scrapers.parsing)
+    PARSER = HTML_PARSER
+    PARSE_ONLY: Optional[SoupStrainer] = None
 
     def __init__(self, config: dict = None):
         self.raw_sessions: List[ScrapedSession] = []
         self.config = config
+        # время по time.monotonic(), к которому скрапинг должен закончиться (выставляет движок). None - без ограничения
+        self.deadline: Optional[float] = None
+        # движок выставляет флаг, когда перестаёт ждать результат скрапинга
+        self.cancelled = threading.Event()
+
+    def time_left(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Сколько секунд осталось до self.deadline. Скраперы передают это время в ожидания браузера и сети,
+        чтобы брошенный движком скрапинг не держал браузер и место в очереди скраперов
+
+        :param timeout: обычный таймаут ожидания. Результат не больше него
+        :return: таймаут ожидания, None - без ограничения
+        """
+        if self.cancelled.is_set():
+            raise ScraperCancelled(f'{self.__class__.__name__}: scraping cancelled')
+        if self.deadline is None:
+            return timeout
+        left = self.deadline - time.monotonic()
+        if left <= 0:
+            raise ScraperCancelled(f'{self.__class__.__name__}: scraping timed out')
+        return left if timeout is None else min(timeout, left)
+
+    def parse_html(self, html: str) -> HtmlDocument:
+        """
+        Парсит страницу парсером скрапера
+
+        :param html: HTML-код страницы
+        :return: распарсенная страница
+        """
+        metrics = get_metrics()
+        metrics.inc('parsed_bytes', len(html), scraper=self.NAME)
+        with metrics.timer('parse', scraper=self.NAME):
+            return parse_html(html, self.PARSER, self.PARSE_ONLY)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # run и iter_sessions по умолчанию реализованы друг через друга, скрапер должен переопределить один из них
+        if cls.run is AbstractScraper.run and cls.iter_sessions is AbstractScraper.iter_sessions:
+            raise TypeError(f'Скрапер {cls.__name__} должен переопределить iter_sessions или run')
+
+    def iter_sessions(self, dates: Iterable[dt.date]) -> Iterator[ScrapedSession]:
+        """
+        Скрапит со страниц кинотеатра сеансы на несколько дат и отдаёт их по мере того, как они находятся,
+        не накапливая в памяти. Новые скраперы переопределяют этот метод.
+        По умолчанию - для скраперов, которые переопределяют только run/run_dates, - скрапит даты по очереди
+        (или все сразу, если MULTI_DATE = True) и отдаёт сеансы, накопившиеся в self.raw_sessions
+
+        :param dates: даты, на которые скрапятся данные о сеансах
+        :return: найденные сеансы
+        """
+        for batch in ([list(dates)] if self.MULTI_DATE else ([date] for date in dates)):
+            self.run_dates(batch)
+            sessions, self.raw_sessions = self.raw_sessions, []
+            yield from sessions
 
-    @abstractmethod
     def run(self, date: dt.date) -> None:
         """
         Скрапит со страницы кинотеатра данные о сеансах на определённую дату.
@@ -24,4 +91,17 @@ class AbstractScraper(ABC):
 
         :param date: дата, на которую скрапятся данные о сеансах
         """
-        pass
+        self.raw_sessions.extend(self.iter_sessions([date]))
+
+    def run_dates(self, dates: Iterable[dt.date]) -> None:
+        """
+        Скрапит со страницы кинотеатра данные о сеансах на несколько дат.
+        Складывает найденные сеансы ScrapedSession в список self.raw_sessions
+
+        :param dates: даты, на которые скрапятся данные о сеансах
+        """
+        if type(self).iter_sessions is not AbstractScraper.iter_sessions:
+            self.raw_sessions.extend(self.iter_sessions(dates))
+            return
+        for date in dates:
+            self.run(date)
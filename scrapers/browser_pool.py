@@ -0,0 +1,238 @@
+import atexit
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import undetected_chromedriver as uc
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from metrics import get_metrics
+from settings import BROWSER_POOL_SIZE, BROWSER_MAX_USES, BROWSER_WAIT_TIMEOUT, NETWORK_IDLE_TIME
+
+
+class BrowserPool:
+    """
+    Пул запущенных браузеров для скраперов на selenium.
+    Браузеры запускаются один раз и выдаются скраперам во временное пользование.
+    После max_uses использований или после ошибки браузер закрывается, а вместо него запускается новый
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_uses: int = BROWSER_MAX_USES,
+                 driver_factory: Callable[[], WebDriver] = uc.Chrome):
+        """
+        :param size: максимальное количество одновременно запущенных браузеров
+        :param max_uses: после скольких использований браузер перезапускается
+        :param driver_factory: функция, запускающая браузер
+        """
+        self.size = size
+        self.max_uses = max_uses
+        self.driver_factory = driver_factory
+        self._idle: List[WebDriver] = []
+        # количество использований каждого запущенного браузера: {id(driver): количество}
+        self._uses: Dict[int, int] = {}
+        # количество запущенных (и запускающихся) браузеров
+        self._started = 0
+        self._condition = threading.Condition()
+
+    def _acquire(self, timeout: Optional[float] = None) -> WebDriver:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._idle or self._started < self.size, timeout):
+                raise TimeoutError(f'{self.__class__.__name__}: no free browser in {timeout} s')
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+
+        # браузер запускается долго, поэтому запускаем его вне блокировки
+        try:
+            with get_metrics().timer('browser_start'):
+                driver = self.driver_factory()
+        except BaseException:
+            with self._condition:
+                self._started -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._uses[id(driver)] = 0
+        return driver
+
+    def _quit(self, driver: WebDriver):
+        with self._condition:
+            if self._uses.pop(id(driver), None) is not None:
+                self._started -= 1
+            self._condition.notify()
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def _release(self, driver: WebDriver):
+        with self._condition:
+            self._uses[id(driver)] += 1
+            worn_out = self._uses[id(driver)] >= self.max_uses
+            if not worn_out:
+                self._idle.append(driver)
+                self._condition.notify()
+        if worn_out:
+            self._quit(driver)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[WebDriver]:
+        """
+        Выдаёт браузер во временное пользование. Если все браузеры заняты, то ждёт освобождения одного из них
+
+        :param timeout: сколько секунд ждать свободный браузер. None - ждать сколько угодно
+        :return: браузер
+        """
+        with get_metrics().timer('browser_lease_wait'):
+            driver = self._acquire(timeout)
+        try:
+            yield driver
+        except BaseException:
+            # после ошибки состояние браузера непредсказуемо, поэтому не возвращаем его в пул
+            self._quit(driver)
+            raise
+        self._release(driver)
+
+    def close(self):
+        """
+        Закрывает все свободные браузеры
+        """
+        with self._condition:
+            drivers, self._idle = self._idle, []
+        for driver in drivers:
+            self._quit(driver)
+
+
+_default_pool: Optional[BrowserPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """
+    Возвращает общий на процесс пул браузеров
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = BrowserPool()
+            # браузеры не должны пережить процесс, даже если его код не закрыл пул сам (например, main.py).
+            # atexit срабатывает после завершения потоков скраперов, поэтому закрываются и возвращённые ими браузеры
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+def open_page(driver: WebDriver, url: str, page_load_timeout: float = 5):
+    """
+    Открывает страницу, не дожидаясь полной загрузки (страница защиты от ботов может грузиться бесконечно)
+
+    :param driver: браузер
+    :param url: адрес страницы
+    :param page_load_timeout: сколько секунд ждать загрузки страницы
+    """
+    metrics = get_metrics()
+    host = urlsplit(url).hostname
+    driver.set_page_load_timeout(page_load_timeout)
+    try:
+        with metrics.timer('browser_page_load', host=host):
+            driver.get(url)
+    except TimeoutException:
+        driver.execute_script("window.stop();")
+    metrics.inc('browser_pages', host=host)
+
+
+def _timed_wait(wait: str, condition: Callable[[], object]) -> bool:
+    """
+    Выполняет ожидание браузера, записывая в метрики его длительность и результат
+
+    :param wait: название ожидания (для меток метрик)
+    :param condition: функция, которая ждёт и бросает TimeoutException, если не дождалась
+    :return: True, если дождались
+    """
+    metrics = get_metrics()
+    try:
+        with metrics.timer('browser_wait', wait=wait):
+            condition()
+    except TimeoutException:
+        metrics.inc('browser_waits', wait=wait, result='timeout')
+        return False
+    metrics.inc('browser_waits', wait=wait, result='ok')
+    return True
+
+
+def wait_for_title(driver: WebDriver, title: str, timeout: float = BROWSER_WAIT_TIMEOUT) -> bool:
+    """
+    Ждёт, пока в заголовке страницы появится title (например, пока защита от ботов пропустит на сайт)
+
+    :return: True, если заголовок появился за timeout секунд
+    """
+    return _timed_wait('title', lambda: WebDriverWait(driver, timeout).until(EC.title_contains(title)))
+
+
+def wait_for_element(driver: WebDriver, locator: Tuple[str, str], timeout: float = BROWSER_WAIT_TIMEOUT) -> bool:
+    """
+    Ждёт, пока на странице появится элемент
+
+    :param locator: локатор элемента, например (By.ID, 'select_date_btn')
+    :return: True, если элемент появился за timeout секунд
+    """
+    return _timed_wait('element', lambda: WebDriverWait(driver, timeout).until(EC.presence_of_element_located(locator)))
+
+
+def wait_for_update(driver: WebDriver, element: WebElement, html: str, timeout: float = BROWSER_WAIT_TIMEOUT) -> bool:
+    """
+    Ждёт, пока js заменит элемент на странице (старый элемент пропадёт) или поменяет его содержимое.
+    Нужно, когда элемент с тем же локатором был на странице и до действия, например, расписание на прошлую дату
+
+    :param element: элемент, найденный до действия
+    :param html: содержимое элемента (innerHTML) до действия
+    :return: True, если элемент заменился или изменился за timeout секунд
+    """
+    def updated(drv: WebDriver) -> bool:
+        try:
+            return element.get_attribute('innerHTML') != html
+        except StaleElementReferenceException:
+            return True
+
+    return _timed_wait('update', lambda: WebDriverWait(driver, timeout).until(updated))
+
+
+def wait_for_document(driver: WebDriver, timeout: float = BROWSER_WAIT_TIMEOUT) -> bool:
+    """
+    Ждёт, пока браузер разберёт документ страницы (document.readyState - interactive или complete).
+    Подходит для страниц, на которых нужного элемента может законно не быть, например, для пустого расписания
+
+    :return: True, если документ разобран за timeout секунд
+    """
+    return _timed_wait('document', lambda: WebDriverWait(driver, timeout).until(
+        lambda drv: drv.execute_script('return document.readyState') != 'loading'))
+
+
+def wait_for_network_idle(driver: WebDriver, idle_time: float = NETWORK_IDLE_TIME,
+                          timeout: float = BROWSER_WAIT_TIMEOUT) -> bool:
+    """
+    Ждёт, пока страница перестанет загружать ресурсы (например, пока js догрузит расписание).
+    Сеть считается простаивающей, если за idle_time секунд не появилось ни одного нового запроса
+
+    :return: True, если сеть затихла за timeout секунд
+    """
+    state = {'count': -1, 'since': time.monotonic()}
+
+    def network_idle(drv: WebDriver) -> bool:
+        count = drv.execute_script(
+            "performance.setResourceTimingBufferSize(100000);"
+            "return performance.getEntriesByType('resource').length;"
+        )
+        now = time.monotonic()
+        if count != state['count']:
+            state['count'], state['since'] = count, now
+            return False
+        return now - state['since'] >= idle_time
+
+    return _timed_wait('network_idle',
+                       lambda: WebDriverWait(driver, timeout, poll_frequency=idle_time / 5).until(network_idle))
@@ -1,21 +1,30 @@
 import datetime as dt
 import re
-import time
+from typing import Iterable, Iterator
 
-from bs4 import BeautifulSoup
-import undetected_chromedriver as uc
+from bs4 import SoupStrainer
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 
 from scrapers.abstract_scraper import AbstractScraper
+from scrapers.browser_pool import get_browser_pool, open_page, wait_for_title, wait_for_element, \
+    wait_for_network_idle, wait_for_update
 from scrapers.exceptions import BaseScraperException
 from scrapers.models import ScrapedMovie, ScrapedSession
+from scrapers.parsing import LXML
+from settings import BROWSER_WAIT_TIMEOUT
 
 
 class CinemaStarScraper(AbstractScraper):
 
     NAME = 'cinema_star'
+    USES_BROWSER = True
     THEATER_BASE_URL = 'https://cinemastar.ru/'
+    PARSER = LXML
+    # нужна только вкладка с расписанием на выбранную дату
+    PARSE_ONLY = SoupStrainer('div', id='selected_date_tab')
 
     def get_html(self, date: dt.date) -> str:
         """
@@ -24,44 +33,62 @@ class CinemaStarScraper(AbstractScraper):
         :param date: дата, за которую открываем расписание
         :return: HTML-код страницы с расписанием
         """
-        driver = uc.Chrome()
-
-        # обходим защиту от ботов
-        driver.set_page_load_timeout(5)
-        try:
-            driver.get(self.THEATER_BASE_URL + self.config['theater_path'])
-            time.sleep(10)
-        except TimeoutException:
-            driver.execute_script("window.stop();")
-        if 'Синема Стар' not in driver.title:
-            raise BaseScraperException(f'{self.__class__.__name__}: Page not loaded. Got: {driver.title}')
-
-        # переходим на страницу с сеансами в выбранном кинотеатре
-        # TODO Сделать проверку месяца - в конце месяца на дейтпикере придётся кликать "Следующий месяц"
-        try:
-            datepicker_button = driver.find_element(by=By.ID, value='select_date_btn')
-            datepicker_button.click()
-            time.sleep(0.5)  # задержка на открытие дейтпикера
-            calendar_date_cell = driver.find_element(
-                by=By.XPATH,
-                value=f'//td[@data-month="{date.month - 1}" and @data-year="{date.year}"]'
-                      f'/a[text() = "{date.day}"]'
-                      f'/parent::td')
-            calendar_date_cell.click()
-        except NoSuchElementException as exc:
-            raise BaseScraperException(
-                f'{self.__class__.__name__}: Page layout was changed. Check your scraper', exc)
-
-        time.sleep(1.5)  # задержка на прогрузку расписания через js
-        html = driver.page_source
-        driver.close()
+        with get_browser_pool().lease(self.time_left()) as driver:
+            open_page(driver, self.THEATER_BASE_URL + self.config['theater_path'])
+            # обходим защиту от ботов: ждём, пока она пропустит на сайт
+            if not wait_for_title(driver, 'Синема Стар', self.time_left(BROWSER_WAIT_TIMEOUT)):
+                raise BaseScraperException(f'{self.__class__.__name__}: Page not loaded. Got: {driver.title}')
+
+            # переходим на страницу с сеансами в выбранном кинотеатре
+            # TODO Сделать проверку месяца - в конце месяца на дейтпикере придётся кликать "Следующий месяц"
+            if not wait_for_element(driver, (By.ID, 'select_date_btn'), self.time_left(BROWSER_WAIT_TIMEOUT)):
+                raise BaseScraperException(f'{self.__class__.__name__}: Page layout was changed. Check your scraper')
+            try:
+                datepicker_button = driver.find_element(by=By.ID, value='select_date_btn')
+                datepicker_button.click()
+                # ждём открытия дейтпикера
+                calendar_date_cell = WebDriverWait(driver, self.time_left(BROWSER_WAIT_TIMEOUT)).until(
+                    EC.element_to_be_clickable((
+                        By.XPATH,
+                        f'//td[@data-month="{date.month - 1}" and @data-year="{date.year}"]'
+                        f'/a[text() = "{date.day}"]'
+                        f'/parent::td'
+                    ))
+                )
+                # на странице уже может быть вкладка с расписанием на другую дату (по умолчанию - на сегодня).
+                # Если выбирается уже выбранная дата, то вкладка не перерисуется
+                old_tabs = [] if 'ui-datepicker-current-day' in (calendar_date_cell.get_attribute('class') or '') \
+                    else driver.find_elements(By.ID, 'selected_date_tab')
+                old_html = old_tabs[0].get_attribute('innerHTML') if old_tabs else None
+                calendar_date_cell.click()
+            except (NoSuchElementException, TimeoutException) as exc:
+                raise BaseScraperException(
+                    f'{self.__class__.__name__}: Page layout was changed. Check your scraper', exc)
+
+            # ждём, пока js прогрузит расписание на выбранную дату. Если вкладка не изменилась, то расписания
+            # на обе даты совпадают до ссылок на сеансы, т.е. оба пустые - такую вкладку и разбираем
+            if old_tabs:
+                wait_for_update(driver, old_tabs[0], old_html, self.time_left(BROWSER_WAIT_TIMEOUT))
+            wait_for_element(driver, (By.ID, 'selected_date_tab'), self.time_left(BROWSER_WAIT_TIMEOUT))
+            wait_for_network_idle(driver, timeout=self.time_left(BROWSER_WAIT_TIMEOUT))
+            html = driver.page_source
         return html
 
-    def run(self, date: dt.date) -> None:
-        html = self.get_html(date)
-        html_doc = BeautifulSoup(html, features='html.parser')
+    def iter_sessions(self, dates: Iterable[dt.date]) -> Iterator[ScrapedSession]:
+        for date in dates:
+            yield from self.parse(self.get_html(date), date)
+
+    def parse(self, html: str, date: dt.date) -> Iterator[ScrapedSession]:
+        """
+        Достаёт сеансы из HTML страницы с расписанием
+
+        :param html: HTML-код страницы с расписанием
+        :param date: дата расписания
+        :return: найденные сеансы
+        """
+        html_doc = self.parse_html(html)
 
-        schedule_node = html_doc.find('div', {'id': 'selected_date_tab'})
+        schedule_node = html_doc.one('div#selected_date_tab')
         movie_cards = schedule_node.find_all('div', {'class': 'movie'})
         for card in movie_cards:
             name_genre_node = card.findNext('div', {'class': 'title'})
@@ -94,9 +121,7 @@ class CinemaStarScraper(AbstractScraper):
                 kh_id = hall_session.attrs['kh:id']
                 link = f'https://kinohod.ru/?kinohod=widget:{kh_widget},id:{kh_id}'
 
-                self.raw_sessions.append(
-                    ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
-                )
+                yield ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
 
 
 if __name__ == '__main__':
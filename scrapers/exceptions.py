@@ -1,2 +1,9 @@
 class BaseScraperException(BaseException):
     pass
+
+
+class ScraperCancelled(BaseScraperException):
+    """
+    Скрапинг прерван: движок перестал ждать результат (вышел таймаут кинотеатра)
+    """
+    pass
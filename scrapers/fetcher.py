@@ -0,0 +1,146 @@
+from concurrent.futures import Future
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from http_client import get_http_session
+from metrics import get_metrics
+from settings import HTTP_CACHE_DIR, HTTP_CACHE_TTL, HTTP_TIMEOUT
+
+
+class CachedResponse(NamedTuple):
+    """
+    Ответ сервера (возможно, взятый из кэша)
+    """
+    status_code: int
+    text: str
+    from_cache: bool = False
+
+
+class CachedFetcher:
+    """
+    Общий слой загрузки страниц для скраперов на requests.
+    Успешные ответы складываются в кэш на диске и отдаются из него, пока не истёк ttl.
+    После этого страница перезапрашивается с If-None-Match/If-Modified-Since, и если она не изменилась,
+    то сервер ответит 304 и страница снова возьмётся из кэша.
+    Одновременные запросы одного и того же адреса из разных потоков выполняются одним запросом
+    """
+
+    def __init__(self, cache_dir: str = HTTP_CACHE_DIR, ttl: float = HTTP_CACHE_TTL,
+                 session: Optional[requests.Session] = None):
+        """
+        :param cache_dir: папка для кэша
+        :param ttl: сколько секунд ответ считается свежим и отдаётся без запроса к серверу
+        :param session: сессия requests, через которую делаются запросы. По умолчанию - общая на процесс
+        """
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.session = session if session is not None else get_http_session()
+        self._lock = threading.Lock()
+        # запросы, которые выполняются прямо сейчас: {адрес: Future с ответом}
+        self._in_flight: Dict[str, Future] = {}
+
+    def get(self, url: str, params: Optional[dict] = None, ttl: Optional[float] = None) -> CachedResponse:
+        """
+        Загружает страницу
+
+        :param url: адрес страницы
+        :param params: параметры запроса
+        :param ttl: время жизни ответа в кэше, если нужно отличное от self.ttl. 0 - всегда ревалидировать
+        :return: ответ сервера
+        """
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        with self._lock:
+            future = self._in_flight.get(full_url)
+            is_owner = future is None
+            if is_owner:
+                future = self._in_flight[full_url] = Future()
+        if not is_owner:
+            return future.result()
+
+        try:
+            response = self._fetch(full_url, self.ttl if ttl is None else ttl)
+            future.set_result(response)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[full_url]
+        return response
+
+    def _cache_path(self, url: str) -> Path:
+        return self.cache_dir / (hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _load(self, path: Path) -> Optional[dict]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, path: Path, entry: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # пишем во временный файл и подменяем, чтобы параллельный процесс не прочитал половину файла
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, url: str, ttl: float) -> CachedResponse:
+        metrics = get_metrics()
+        host = urlsplit(url).hostname
+        path = self._cache_path(url)
+        entry = self._load(path)
+        now = time.time()
+        if entry and now - entry['fetched_at'] < ttl:
+            metrics.inc('http_requests', host=host, result='cache')
+            return CachedResponse(200, entry['text'], from_cache=True)
+
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        with metrics.timer('http_fetch', host=host):
+            response = self.session.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        metrics.inc('http_bytes', len(response.content), host=host)
+
+        if response.status_code == 304 and entry:
+            metrics.inc('http_requests', host=host, result='not_modified')
+            entry['fetched_at'] = now
+            self._save(path, entry)
+            return CachedResponse(200, entry['text'], from_cache=True)
+
+        metrics.inc('http_requests', host=host, result='fetched' if response.status_code == 200 else 'error')
+        if response.status_code == 200:
+            self._save(path, {
+                'url': url,
+                'fetched_at': now,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'text': response.text,
+            })
+        return CachedResponse(response.status_code, response.text)
+
+
+_default_fetcher: Optional[CachedFetcher] = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> CachedFetcher:
+    """
+    Возвращает общий на процесс загрузчик страниц
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = CachedFetcher()
+        return _default_fetcher
@@ -1,33 +1,65 @@
 import datetime as dt
+import re
+from typing import Iterable, Iterator
 
-import requests
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer, Tag
 
 from scrapers.abstract_scraper import AbstractScraper
 from scrapers.exceptions import BaseScraperException
+from scrapers.fetcher import get_fetcher
 from scrapers.models import ScrapedMovie, ScrapedSession
-from settings import HEADERS
+from scrapers.parsing import LXML
 
 
 class KinobelScraper(AbstractScraper):
     NAME = 'kinobel'
+    MULTI_DATE = True
     THEATER_BASE_URL = 'https://kinobel.ru'
     SCHEDULE_PATH = '/kinoteatry'
+    PARSER = LXML
+    # нужны только вкладки с расписанием по дням
+    PARSE_ONLY = SoupStrainer('div', id=re.compile(r'^sp-showtime-tab-'))
 
-    def run(self, date: dt.date):
-        # преобразуем дату в строку, чтобы искать соответствующий тег на странице
-        date_str = date.strftime('%Y-%m-%d')
+    def get_html(self) -> str:
+        """
+        Получаем HTML страницы с расписанием. На странице лежит расписание сразу на несколько дней
 
-        response = requests.get(
-            self.THEATER_BASE_URL + self.SCHEDULE_PATH + self.config['theater_path'],
-            headers=HEADERS
-        )
+        :return: HTML-код страницы с расписанием
+        """
+        response = get_fetcher().get(self.THEATER_BASE_URL + self.SCHEDULE_PATH + self.config['theater_path'])
         if response.status_code != 200:
             raise BaseScraperException(f'{self.__class__.__name__}: Response status != 200', response)
+        return response.text
 
-        html_doc = BeautifulSoup(response.text, features='html.parser')
-        day_schedule = html_doc.find('div', {'id': f'sp-showtime-tab-{date_str}'})
+    def iter_sessions(self, dates: Iterable[dt.date]) -> Iterator[ScrapedSession]:
+        yield from self.parse(self.get_html(), dates)
 
+    def parse(self, html: str, dates: Iterable[dt.date]) -> Iterator[ScrapedSession]:
+        """
+        Достаёт сеансы на выбранные даты из HTML страницы с расписанием
+
+        :param html: HTML-код страницы с расписанием
+        :param dates: даты, на которые нужны сеансы
+        :return: найденные сеансы
+        """
+        html_doc = self.parse_html(html)
+        for date in dates:
+            # преобразуем дату в строку, чтобы искать соответствующий тег на странице
+            date_str = date.strftime('%Y-%m-%d')
+            day_schedule = html_doc.one(f'div[id="sp-showtime-tab-{date_str}"]')
+            # расписание на эту дату ещё не выложили
+            if day_schedule is None:
+                continue
+            yield from self.parse_day(day_schedule, date)
+
+    def parse_day(self, day_schedule: Tag, date: dt.date) -> Iterator[ScrapedSession]:
+        """
+        Достаёт сеансы из расписания на один день
+
+        :param day_schedule: тег с расписанием на день
+        :param date: дата расписания
+        :return: найденные сеансы
+        """
         movie_cards = day_schedule.find_all('div', {'class': 'movie-schedule'})
 
         for card in movie_cards:
@@ -49,9 +81,7 @@ class KinobelScraper(AbstractScraper):
                 session_time = dt.datetime.strptime(session_time, '%H:%M').time()
                 session_datetime = dt.datetime.combine(date, session_time)
 
-                self.raw_sessions.append(
-                    ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
-                )
+                yield ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
 
 
 if __name__ == '__main__':
@@ -2,18 +2,41 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 import datetime as dt
+from functools import lru_cache
+import sys
 from typing import Optional
 
 
+def intern_str(value: Optional[str]) -> Optional[str]:
+    """
+    Возвращает общий на процесс экземпляр строки (см. sys.intern), None возвращает как есть
+    """
+    return sys.intern(value) if value is not None else None
+
+
+@lru_cache(maxsize=4096)
+def intern_datetime(value: dt.datetime) -> dt.datetime:
+    """
+    Возвращает общий экземпляр для одинаковых datetime: у сеансов одного дня время начала повторяется постоянно
+    """
+    return value
+
+
 @dataclass
 class ScrapedMovie:
     """
     Модель сырых данных о фильме
     """
+    __slots__ = ('filmname', 'poster_link', 'year')
+
     filmname: str
     poster_link: Optional[str]
     year: Optional[int]
 
+    def __post_init__(self):
+        self.filmname = intern_str(self.filmname)
+        self.poster_link = intern_str(self.poster_link)
+
     def __repr__(self):
         return f'ScrapedMovie: {self.filmname}, ({self.year})'
 
@@ -21,9 +44,17 @@ class ScrapedMovie:
 @dataclass
 class ScrapedSession:
     """
-    Модель сырых данных о сеансе
+    Модель сырых данных о сеансе. Залы, ссылки и время начала одинаковые у множества сеансов,
+    поэтому хранятся в одном экземпляре на процесс
     """
+    __slots__ = ('movie', 'hall', 'datetime', 'link')
+
     movie: ScrapedMovie
     hall: str
     datetime: dt.datetime
     link: str
+
+    def __post_init__(self):
+        self.hall = intern_str(self.hall)
+        self.datetime = intern_datetime(self.datetime)
+        self.link = intern_str(self.link)
@@ -0,0 +1,51 @@
+from typing import List, Optional
+
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer, Tag
+
+# доступные парсеры
+HTML_PARSER = 'html.parser'  # встроенный в python, самый медленный
+LXML = 'lxml'  # в разы быстрее, но нужен пакет lxml
+
+
+class HtmlDocument:
+    """
+    Распарсенная страница с простым API для выборки элементов по css-селекторам
+    """
+
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+
+    def one(self, selector: str) -> Optional[Tag]:
+        """
+        Первый элемент, подходящий под селектор
+
+        :param selector: css-селектор
+        :return: найденный элемент, либо None
+        """
+        return self.soup.select_one(selector)
+
+    def all(self, selector: str) -> List[Tag]:
+        """
+        Все элементы, подходящие под селектор
+
+        :param selector: css-селектор
+        :return: список найденных элементов
+        """
+        return self.soup.select(selector)
+
+
+def parse_html(html: str, parser: str = HTML_PARSER, parse_only: Optional[SoupStrainer] = None) -> HtmlDocument:
+    """
+    Парсит страницу выбранным парсером
+
+    :param html: HTML-код страницы
+    :param parser: парсер (HTML_PARSER или LXML). Если lxml не установлен, то используется HTML_PARSER
+    :param parse_only: если передан, то в дерево попадают только подходящие под него элементы
+        (например, только блок с расписанием), что заметно ускоряет парсинг
+    :return: распарсенная страница
+    """
+    try:
+        soup = BeautifulSoup(html, features=parser, parse_only=parse_only)
+    except FeatureNotFound:
+        soup = BeautifulSoup(html, features=HTML_PARSER, parse_only=parse_only)
+    return HtmlDocument(soup)
@@ -1,43 +1,65 @@
 import datetime as dt
-import time
+from typing import Iterable, Iterator
 
-import undetected_chromedriver as uc
-from bs4 import BeautifulSoup
-from selenium.common.exceptions import TimeoutException
+from bs4 import SoupStrainer
 
+from scrapers.browser_pool import get_browser_pool, open_page, wait_for_title, wait_for_document, \
+    wait_for_network_idle
 from scrapers.models import ScrapedMovie, ScrapedSession
 from scrapers.abstract_scraper import AbstractScraper
 from scrapers.exceptions import BaseScraperException
+from scrapers.parsing import LXML
+from settings import BROWSER_WAIT_TIMEOUT
 
 
 class RusichScraper(AbstractScraper):
     NAME = 'rusich31'
+    USES_BROWSER = True
     THEATER_BASE_URL = 'https://kinorusich.ru'
     SCHEDULE_URL = THEATER_BASE_URL + '/h/schedule/'
+    PARSER = LXML
+    # нужны только карточки фильмов
+    PARSE_ONLY = SoupStrainer('article', {'class': 'movie-info-item'})
 
-    def run(self, date: dt.date):
+    def get_html(self, date: dt.date) -> str:
+        """
+        Получаем HTML страницы с расписанием
+
+        :param date: дата, за которую открываем расписание
+        :return: HTML-код страницы с расписанием
+        """
         # получаем таймстамп, ибо так хочет сайт
         datetime = dt.datetime.combine(date, dt.datetime.min.time())
         timestamp = int(datetime.timestamp())
 
         payload = f'?d={timestamp}'
-        driver = uc.Chrome()
-
-        # обходим защиту от ботов
-        driver.set_page_load_timeout(5)
-        try:
-            driver.get(self.SCHEDULE_URL + payload)
-            time.sleep(10)
-        except TimeoutException:
-            driver.execute_script("window.stop();")
-        if 'Расписание' not in driver.title:
-            raise BaseScraperException(f'{self.__class__.__name__}: Page not loaded. Got: {driver.title}')
-        html = driver.page_source
-        driver.close()
-
-        html_doc = BeautifulSoup(html, features='html.parser')
-
-        movie_cards = html_doc.find_all('article', {'class': 'movie-info-item'})
+        with get_browser_pool().lease(self.time_left()) as driver:
+            open_page(driver, self.SCHEDULE_URL + payload)
+            # обходим защиту от ботов: ждём, пока она пропустит на страницу с расписанием
+            if not wait_for_title(driver, 'Расписание', self.time_left(BROWSER_WAIT_TIMEOUT)):
+                raise BaseScraperException(f'{self.__class__.__name__}: Page not loaded. Got: {driver.title}')
+            # если сеансов на дату нет, то и карточек фильмов не будет, поэтому ждём не карточки,
+            # а разбора страницы, который есть и у заполненного, и у пустого расписания
+            wait_for_document(driver, self.time_left(BROWSER_WAIT_TIMEOUT))
+            wait_for_network_idle(driver, timeout=self.time_left(BROWSER_WAIT_TIMEOUT))
+            html = driver.page_source
+        return html
+
+    def iter_sessions(self, dates: Iterable[dt.date]) -> Iterator[ScrapedSession]:
+        for date in dates:
+            yield from self.parse(self.get_html(date), date)
+
+    def parse(self, html: str, date: dt.date) -> Iterator[ScrapedSession]:
+        """
+        Достаёт сеансы из HTML страницы с расписанием
+
+        :param html: HTML-код страницы с расписанием
+        :param date: дата расписания
+        :return: найденные сеансы
+        """
+        html_doc = self.parse_html(html)
+
+        movie_cards = html_doc.all('article.movie-info-item')
         for card in movie_cards:
             name_tag = card.findNext('a', {'class': 'movie-info-name'})
             name = name_tag.text
@@ -68,6 +90,4 @@ class RusichScraper(AbstractScraper):
                         break
                     session_time = dt.datetime.strptime(session_time, '%H:%M').time()
                     session_datetime = dt.datetime.combine(date, session_time)
-                    self.raw_sessions.append(
-                        ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
-                    )
+                    yield ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
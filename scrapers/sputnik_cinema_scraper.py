@@ -1,30 +1,64 @@
 import datetime as dt
+from typing import Iterable, Iterator
 
-import requests
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer, Tag
 
 from scrapers.models import ScrapedMovie, ScrapedSession
 from scrapers.abstract_scraper import AbstractScraper
 from scrapers.exceptions import BaseScraperException
-from settings import HEADERS
+from scrapers.fetcher import get_fetcher
+from scrapers.parsing import LXML
 
 
 class SputnikScraper(AbstractScraper):
     NAME = 'sputnik_cinema31'
+    MULTI_DATE = True
     THEATER_BASE_URL = 'https://sputnik-cinema.ru/'
+    PARSER = LXML
+    # нужны только блоки с расписанием по дням
+    PARSE_ONLY = SoupStrainer('div', {'class': 'films'})
 
-    def run(self, date: dt.date):
-        # преобразуем дату в строку, чтобы искать соответствующий тег на странице
-        date_str = date.strftime('%Y-%m-%d')
+    def get_html(self) -> str:
+        """
+        Получаем HTML страницы с расписанием. На странице лежит расписание сразу на несколько дней
 
+        :return: HTML-код страницы с расписанием
+        """
         payload = {'city': self.config['city_no'], }
-        response = requests.get(self.THEATER_BASE_URL, params=payload, headers=HEADERS)
+        response = get_fetcher().get(self.THEATER_BASE_URL, params=payload)
         if response.status_code != 200:
             raise BaseScraperException(f'{self.__class__.__name__}: Response status != 200', response)
+        return response.text
 
-        html_doc = BeautifulSoup(response.text, features='html.parser')
-        day_schedule = html_doc.find('div', {'class': 'films', 'data-date': date_str})
+    def iter_sessions(self, dates: Iterable[dt.date]) -> Iterator[ScrapedSession]:
+        yield from self.parse(self.get_html(), dates)
 
+    def parse(self, html: str, dates: Iterable[dt.date]) -> Iterator[ScrapedSession]:
+        """
+        Достаёт сеансы на выбранные даты из HTML страницы с расписанием
+
+        :param html: HTML-код страницы с расписанием
+        :param dates: даты, на которые нужны сеансы
+        :return: найденные сеансы
+        """
+        html_doc = self.parse_html(html)
+        for date in dates:
+            # преобразуем дату в строку, чтобы искать соответствующий тег на странице
+            date_str = date.strftime('%Y-%m-%d')
+            day_schedule = html_doc.one(f'div.films[data-date="{date_str}"]')
+            # расписание на эту дату ещё не выложили
+            if day_schedule is None:
+                continue
+            yield from self.parse_day(day_schedule, date)
+
+    def parse_day(self, day_schedule: Tag, date: dt.date) -> Iterator[ScrapedSession]:
+        """
+        Достаёт сеансы из расписания на один день
+
+        :param day_schedule: тег с расписанием на день
+        :param date: дата расписания
+        :return: найденные сеансы
+        """
         movie_cards = day_schedule.find_all('div', {'class': 'film flex'})
         for card in movie_cards:
             name_tag = card.findNext('div', {'class': 'film__title'})
@@ -58,6 +92,4 @@ class SputnikScraper(AbstractScraper):
                 session_time = hall_session.text
                 session_time = dt.datetime.strptime(session_time, '%H:%M').time()
                 session_datetime = dt.datetime.combine(date, session_time)
-                self.raw_sessions.append(
-                    ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
-                )
+                yield ScrapedSession(movie=movie, hall=hall_name, datetime=session_datetime, link=link)
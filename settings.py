@@ -7,3 +7,89 @@ HEADERS = {
 
 MEDIA_ROOT = 'media'
 POSTERS_DIR = 'posters'
+
+# параллельный скрапинг кинотеатров
+SCRAPING_WORKERS = 1  # 1 - кинотеатры скрапятся последовательно
+REQUESTS_SCRAPERS_LIMIT = 4  # сколько скраперов на requests могут работать одновременно
+BROWSER_SCRAPERS_LIMIT = 2  # сколько скраперов на selenium могут работать одновременно
+THEATER_TIMEOUT = 120  # сек, сколько ждём скрапинга одного кинотеатра (без очереди за местом). None - сколько угодно
+
+# сколько сеансов отправляется в БД одним INSERT ... ON CONFLICT
+SESSIONS_BATCH_SIZE = 1000
+# синхронизировать расписание кинотеатров на скрапленные даты: удалять из БД сеансы, которых больше нет на сайте.
+# False - сеансы только добавляются и обновляются
+SESSIONS_SYNC = True
+
+# режим демона (см. scheduler.py): расписание каждого кинотеатра на каждую дату обновляется отдельной задачей
+SCHEDULER_DAYS = 3  # на сколько дней вперёд, начиная с сегодняшнего, обновляется расписание
+SCHEDULER_INTERVAL = 30 * 60  # сек, начальный интервал обновления расписания кинотеатра на сегодня
+# сек, в этих пределах интервал подстраивается под то, как часто у кинотеатра меняется расписание
+SCHEDULER_MIN_INTERVAL = 10 * 60
+SCHEDULER_MAX_INTERVAL = 6 * 60 * 60
+# во сколько раз реже обновляется каждый следующий день: 1 - завтра в 2 раза реже, чем сегодня, послезавтра в 3 и т.д.
+SCHEDULER_DAY_FACTOR = 1.0
+SCHEDULER_FLUSH_INTERVAL = 60  # сек, как часто сохраняются метрики и дожидаются скачивания постеров
+# минимальная пауза между запусками скраперов одного сайта, сек: {скрапер: пауза}
+SCRAPER_DELAYS = {}
+SCRAPER_DEFAULT_DELAY = 5
+
+# распределённая очередь задач скрапинга (см. worker.py)
+JOB_WORKERS = 2  # сколько задач один воркер выполняет одновременно
+JOB_LEASE = 5 * 60  # сек, на сколько задача закрепляется за воркером. Пока задача выполняется, аренда продлевается
+JOB_HEARTBEAT = 60  # сек, как часто воркер продлевает аренду
+JOB_TIMEOUT = 30 * 60  # сек, после скольких секунд выполнения задачи воркер перестаёт продлевать аренду
+JOB_POLL_INTERVAL = 10  # сек, как часто проверять пустую очередь
+JOB_MAX_ATTEMPTS = 3  # после стольких неудачных попыток задача помечается как failed
+JOB_RETRY_DELAY = 5 * 60  # сек, пауза перед повтором упавшей задачи (умножается на номер попытки)
+
+# фоновое скачивание постеров
+POSTER_WORKERS = 4
+POSTER_TIMEOUT = 30  # сек
+
+# пул браузеров для скраперов на selenium
+BROWSER_POOL_SIZE = BROWSER_SCRAPERS_LIMIT
+BROWSER_MAX_USES = 20  # после скольких страниц браузер перезапускается
+BROWSER_WAIT_TIMEOUT = 30  # сек, сколько ждать прохождения защиты от ботов и прогрузки расписания
+NETWORK_IDLE_TIME = 0.5  # сек без новых запросов, после которых считаем, что страница догрузилась
+
+# кэш страниц для скраперов на requests
+HTTP_CACHE_DIR = 'cache/http'
+HTTP_CACHE_TTL = 10 * 60  # сек, сколько страница отдаётся из кэша без запроса к сайту
+HTTP_TIMEOUT = 30  # сек
+
+# общий на процесс http-клиент (см. http_client.py)
+HTTP_POOL_SIZE = 10  # сколько keep-alive соединений держать на один хост
+HTTP_RETRIES = 3  # сколько раз повторять запрос при сетевой ошибке или ответах 429/5xx
+HTTP_BACKOFF = 0.5  # сек, пауза перед повтором (удваивается с каждой попыткой)
+
+# пул соединений с БД (см. db.db_engine_factory)
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10  # сколько соединений можно открыть сверх DB_POOL_SIZE при нагрузке
+DB_POOL_TIMEOUT = 30  # сек, сколько ждать свободное соединение
+DB_POOL_RECYCLE = 30 * 60  # сек, через сколько переоткрывать соединение
+DB_POOL_PRE_PING = True  # проверять соединение перед выдачей из пула
+
+# сопоставление названий фильмов с реестром
+# 'trigram' - нечёткий поиск по похожести триграмм, 'words' - по количеству совпадающих слов
+TITLE_MATCHER = 'trigram'
+# где считается похожесть триграмм: 'memory' - в памяти процесса (с numpy, если он установлен), 'pg' - в pg_trgm
+TRIGRAM_BACKEND = 'memory'
+MATCH_THRESHOLD = 0.4  # минимальная похожесть названий, при которой фильм считается найденным
+# снимок реестра в одном файле, который открывается через mmap (см. repos/registry_snapshot.py):
+# индекс названий и триграммы берутся из него, а не строятся по выборке из БД. None - не использовать
+REGISTRY_SNAPSHOT = 'cache/registry.snapshot'
+# сверять версию снимка (максимальный id, количество фильмов и ревизию реестра) с БД.
+# False - снимок используется как есть
+REGISTRY_SNAPSHOT_CHECK = True
+
+# кэш результатов поиска фильмов в FedMoviesRepo
+MOVIE_CACHE_SIZE = 10000  # максимальное количество записей
+MOVIE_CACHE_TTL = 24 * 60 * 60  # сколько секунд хранится найденный фильм
+MOVIE_CACHE_NEGATIVE_TTL = 60 * 60  # сколько секунд хранится запись о том, что фильм не найден
+
+# логирование и метрики (см. metrics.py)
+LOG_LEVEL = 'INFO'
+LOG_JSON = False  # выводить каждую запись лога одной json-строкой
+METRICS_PREFIX = 'cinema_scraper'
+# куда сохранять метрики после каждого прогона (.json - в json, иначе в формате Prometheus). None - не сохранять
+METRICS_FILE = None
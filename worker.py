@@ -0,0 +1,241 @@
+"""
+Воркер распределённой очереди задач скрапинга. Задача - расписание одного кинотеатра на одну дату.
+Воркеры можно запускать на нескольких машинах с общей БД: задачи делятся через таблицу scrape_job,
+и одну задачу два воркера не выполняют. Задачи умершего воркера забирают другие, когда истекает аренда
+
+    python worker.py --init                                             # создать таблицу очереди
+    python worker.py --enqueue --city Белгород --city Курск --days 3    # поставить задачи в очередь (например, по cron)
+    python worker.py --workers 2                                        # выполнять задачи из очереди
+"""
+
+import argparse
+import datetime as dt
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from db.models import Theater
+from engine import ScrapingEngine
+from metrics import configure_logging, get_metrics
+from repos.fed_movies_repo import FedMoviesRepo
+from repos.movie_sessions_repo import MovieSessionsRepo
+from repos.scrape_jobs_repo import ClaimedJob, ScrapeJobsRepo
+from repos.theaters_repo import TheatersRepo
+from repos.title_matches_repo import TitleMatchesRepo
+from scrapers.exceptions import BaseScraperException
+from settings import JOB_WORKERS, JOB_LEASE, JOB_HEARTBEAT, JOB_TIMEOUT, JOB_POLL_INTERVAL, \
+    SCHEDULER_FLUSH_INTERVAL, METRICS_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """
+    Выполняет задачи из очереди в нескольких потоках и продлевает аренду выполняющихся задач
+    """
+
+    def __init__(self, engine: ScrapingEngine, jobs_repo: ScrapeJobsRepo, theaters_repo: TheatersRepo,
+                 name: Optional[str] = None, workers: int = JOB_WORKERS, lease: float = JOB_LEASE,
+                 heartbeat: float = JOB_HEARTBEAT, timeout: float = JOB_TIMEOUT,
+                 poll_interval: float = JOB_POLL_INTERVAL, flush_interval: float = SCHEDULER_FLUSH_INTERVAL):
+        """
+        :param engine: движок, через который скрапятся и сохраняются сеансы
+        :param jobs_repo: репозиторий очереди задач
+        :param theaters_repo: репозиторий кинотеатров
+        :param name: имя воркера в очереди. По умолчанию - хост:pid
+        :param workers: сколько задач выполняется одновременно
+        :param lease: на сколько секунд задача закрепляется за воркером
+        :param heartbeat: как часто продлевается аренда, сек
+        :param timeout: после скольких секунд выполнения задачи аренда перестаёт продлеваться
+            и задачу может забрать другой воркер
+        :param poll_interval: как часто проверять пустую очередь, сек
+        :param flush_interval: как часто сохраняются метрики и дожидаются скачивания постеров, сек
+        """
+        self.engine = engine
+        self.jobs_repo = jobs_repo
+        self.theaters_repo = theaters_repo
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.workers = max(workers, 1)
+        self.lease = lease
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._theaters: Dict[int, Theater] = {theater.id: theater for theater in engine.theaters}
+        # выполняющиеся задачи: {задача: time.monotonic() начала}. Задача с номером попытки, а не только
+        # (id_кинотеатра, дата): задачу, аренда которой истекла, может заново забрать другой поток этого же воркера
+        self._running: Dict[ClaimedJob, float] = {}
+        self._stopped = threading.Event()  # новые задачи больше не берём
+        self._finished = threading.Event()  # все задачи доделаны
+
+    def _get_theater(self, theater_id: int) -> Optional[Theater]:
+        with self._lock:
+            theater = self._theaters.get(theater_id)
+        if theater is None:
+            theater = self.theaters_repo.get_theater_by_id(theater_id)
+            if theater is not None:
+                with self._lock:
+                    self._theaters[theater_id] = theater
+        return theater
+
+    def _execute(self, job: ClaimedJob):
+        """
+        Выполняет задачу и отмечает её в очереди выполненной или упавшей
+        """
+        metrics = get_metrics()
+        with self._lock:
+            self._running[job] = time.monotonic()
+        try:
+            theater = self._get_theater(job.theater_id)
+            if theater is None:
+                raise LookupError(f'Theater {job.theater_id} not found')
+            labels = {'theater': theater.name, 'scraper': theater.scraper}
+            logger.info('Job %s on %s started', theater.name, job.date, extra={**labels, 'attempt': job.attempts})
+            with metrics.timer('job', **labels):
+                self.engine.run_theater(theater, [job.date])
+        except (Exception, BaseScraperException) as exc:
+            metrics.inc('jobs', result='failed')
+            logger.error('Job %s on %s failed: %r', job.theater_id, job.date, exc,
+                         extra={'theater_id': job.theater_id, 'attempt': job.attempts})
+            error = exc
+        else:
+            metrics.inc('jobs', result='done')
+            error = None
+        finally:
+            with self._lock:
+                self._running.pop(job, None)
+
+        try:
+            if error is None:
+                finished = self.jobs_repo.complete(self.name, job)
+            else:
+                finished = self.jobs_repo.fail(self.name, job, repr(error))
+        except Exception as exc:
+            # сессия уже откачена (см. get_session). Поток продолжает брать задачи, а эту задачу
+            # заберут снова, когда истечёт аренда
+            metrics.inc('jobs', result='finish_failed')
+            logger.error('Finishing job %s on %s failed: %r', job.theater_id, job.date, exc,
+                         extra={'theater_id': job.theater_id, 'attempt': job.attempts})
+            return
+
+        if not finished:
+            # пока задача выполнялась, аренда истекла, и задачу забрал другой воркер
+            metrics.inc('jobs', result='lease_lost')
+            logger.warning('Lease of job %s on %s was lost', job.theater_id, job.date,
+                           extra={'theater_id': job.theater_id})
+
+    def _work(self):
+        """
+        Поток воркера: забирает задачи по одной, пока воркер не остановят
+        """
+        while not self._stopped.is_set():
+            try:
+                jobs = self.jobs_repo.claim(self.name, 1, self.lease)
+            except Exception as exc:
+                logger.error('Claiming a job failed: %r', exc)
+                jobs = []
+            if not jobs:
+                self._stopped.wait(self.poll_interval)
+                continue
+            self._execute(jobs[0])
+
+    def _heartbeat(self):
+        """
+        Поток продления аренды выполняющихся задач. Работает, пока не доделаны все задачи
+        """
+        while not self._finished.wait(self.heartbeat):
+            now = time.monotonic()
+            with self._lock:
+                # зависшие задачи не продлеваем: пусть их заберёт другой воркер
+                jobs = [job for job, started in self._running.items() if now - started < self.timeout]
+            try:
+                renewed = self.jobs_repo.heartbeat(self.name, jobs, self.lease)
+            except Exception as exc:
+                logger.error('Renewing leases failed: %r', exc)
+                continue
+            if renewed < len(jobs):
+                logger.warning('%d job lease(s) lost', len(jobs) - renewed)
+
+    def _flush(self):
+        """
+        Дожидается скачивания поставленных в очередь постеров, сохраняет метрики
+        и подхватывает новый снимок реестра, если его пересохранили
+        """
+        self.engine.posters.wait()
+        self.engine.fed_movies_repo.refresh_snapshot()
+        if METRICS_FILE:
+            get_metrics().export(METRICS_FILE)
+
+    def run_forever(self):
+        """
+        Выполняет задачи, пока не будет вызван stop(). Выполняющиеся задачи при остановке доделываются
+        """
+        logger.info('Worker %s started', self.name, extra={'workers': self.workers})
+        threads = [threading.Thread(target=self._work, name=f'worker-{i}') for i in range(self.workers)]
+        heartbeat = threading.Thread(target=self._heartbeat, name='heartbeat', daemon=True)
+        heartbeat.start()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(timeout=self.flush_interval)
+                self._flush()
+        finally:
+            self._finished.set()
+            # пул браузеров есть, только если задачам понадобились скраперы на selenium
+            browser_pool = sys.modules.get('scrapers.browser_pool')
+            if browser_pool is not None:
+                browser_pool.get_browser_pool().close()
+            logger.info('Worker %s stopped', self.name)
+
+    def stop(self):
+        """
+        Останавливает воркер. Можно вызывать из обработчика сигнала или другого потока
+        """
+        self._stopped.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Воркер распределённой очереди задач скрапинга')
+    parser.add_argument('--init', action='store_true', help='создать таблицу очереди и выйти')
+    parser.add_argument('--enqueue', action='store_true',
+                        help='поставить в очередь задачи на кинотеатры городов --city и выйти')
+    parser.add_argument('--city', action='append', default=[], help='город (можно указать несколько раз)')
+    parser.add_argument('--date', type=dt.date.fromisoformat,
+                        help='первая дата в формате ГГГГ-ММ-ДД. По умолчанию - сегодня')
+    parser.add_argument('--days', type=int, default=1, help='на сколько дней ставить задачи')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS, help='сколько задач выполнять одновременно')
+    args = parser.parse_args()
+    configure_logging()
+
+    jobs_repo = ScrapeJobsRepo()
+    theaters_repo = TheatersRepo()
+    if args.init:
+        jobs_repo.create_table()
+        raise SystemExit
+
+    if args.enqueue:
+        today = dt.date.today()
+        start = args.date or today
+        theater_ids = [theater.id for city in args.city for theater in theaters_repo.get_theaters_by_city(city)]
+        purged = jobs_repo.purge(today)
+        count = jobs_repo.enqueue(theater_ids, (start + dt.timedelta(days=i) for i in range(args.days)))
+        logger.info('Enqueued %d job(s), purged %d outdated job(s)', count, purged)
+        raise SystemExit
+
+    scraping_engine = ScrapingEngine(theaters=[], fed_movies_repo=FedMoviesRepo(), sessions_repo=MovieSessionsRepo(),
+                                     matches_repo=TitleMatchesRepo())
+    worker = Worker(scraping_engine, jobs_repo, theaters_repo, workers=args.workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    worker.run_forever()